@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# interlocking.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+import threading
+
+from src.hw.turnout_planner import TurnoutPlanner
+
+class Interlocking(object):
+    """Sets named routes, never two conflicting routes at the same time
+
+    A route is a set of turnout positions. Two routes conflict if they need
+    a turnout in different positions, or if they are declared to conflict,
+    e.g. across a diamond crossing. The conflicts of every route are worked
+    out once and kept as a bitset over route indices, so checking a route
+    against every locked route is a single and.
+
+    A route is reserved atomically, then its turnouts are set outside of the
+    lock so routes that do not conflict are set at the same time. Only the
+    turnouts not already in position are moved, and a route only counts as
+    set once a turnout it shares with a route still being set has settled. It
+    stays locked until released.
+    """
+
+    def __init__(self, routes, get_turnout, conflicts=(), bank=None):
+        """Create an interlocking
+
+        Routes map a route name to a dict of turnout id to diverging. Turnouts
+        are looked up by id with get_turnout, e.g. Layout.get_turnout.
+        Conflicts are extra pairs of route names that may not be locked
+        together. Turnouts are set with the bank, a new TurnoutBank if not
+        given.
+        """
+        self.__logger = logging.getLogger('interlocking')
+        self.__lock = threading.Lock()
+
+        self.__get_turnout = get_turnout
+        self.__planner = TurnoutPlanner(bank)
+
+        self.__names = list(routes)
+        self.__index = dict((name, i) for i, name in enumerate(self.__names))
+        self.__routes = [dict(routes[name]) for name in self.__names]
+
+        self.__conflicts = self.__build_conflicts(conflicts)
+
+        # Bit i set while route i is locked
+        self.__locked = 0
+
+    def get_route_names(self):
+        """Return the name of every route"""
+        return list(self.__names)
+
+    def get_positions(self, name):
+        """Return the turnout positions of a route"""
+        return dict(self.__routes[self.__get_index(name)])
+
+    def conflicts(self, name, other):
+        """Return True if two routes may not be locked together"""
+        return bool(
+            self.__conflicts[self.__get_index(name)] &
+            (1 << self.__get_index(other)))
+
+    def get_locked(self):
+        """Return the names of the locked routes"""
+        locked = self.__locked
+
+        return [
+            name for i, name in enumerate(self.__names) if locked & (1 << i)]
+
+    def is_locked(self, name):
+        """Return True if a route is locked"""
+        return bool(self.__locked & (1 << self.__get_index(name)))
+
+    def reserve(self, name):
+        """Lock a route if it conflicts with no locked route
+
+        Returns True if the route was locked, a locked route is not locked
+        again.
+        """
+        index = self.__get_index(name)
+
+        with self.__lock:
+            if self.__locked & (self.__conflicts[index] | (1 << index)):
+                return False
+
+            self.__locked |= 1 << index
+
+        return True
+
+    def release(self, name):
+        """Unlock a route"""
+        index = self.__get_index(name)
+
+        with self.__lock:
+            self.__locked &= ~(1 << index)
+
+    def set_route(self, name, verify=False):
+        """Lock a route and set its turnouts
+
+        Returns False without moving anything if the route conflicts with a
+        locked route. The route stays locked until released.
+        """
+        return self.set_routes([name], verify) == [name]
+
+    def set_routes(self, names, verify=False):
+        """Lock every route that can be locked, in order, and set the
+        turnouts of all of them together
+
+        In verify mode turnouts already in position are driven too. Returns
+        the names of the routes that were locked and set.
+        """
+        names = list(names)
+        reserved = [name for name in names if self.reserve(name)]
+
+        targets = {}
+
+        for name in reserved:
+            targets.update(self.__routes[self.__index[name]])
+
+        self.__logger.info(
+            'Setting %d of %d routes', len(reserved), len(names))
+
+        try:
+            self.__planner.apply(
+                ((self.__get_turnout(turnout_id), diverging)
+                for turnout_id, diverging in sorted(targets.items())),
+                verify)
+        except Exception:
+            for name in reserved:
+                self.release(name)
+
+            raise
+
+        return reserved
+
+    def __get_index(self, name):
+        """Return the index of a route, KeyError if unknown"""
+        index = self.__index.get(name)
+
+        if index is None:
+            raise KeyError('Unknown route %s' % name)
+
+        return index
+
+    def __build_conflicts(self, conflicts):
+        """Return the bitset of the routes each route conflicts with"""
+        masks = [0] * len(self.__names)
+
+        # Index the routes using each turnout position, then a route
+        # conflicts with every route using its turnouts in another position
+        users = {}
+
+        for index, positions in enumerate(self.__routes):
+            for turnout_id, diverging in positions.items():
+                key = (turnout_id, bool(diverging))
+                users[key] = users.get(key, 0) | (1 << index)
+
+        for index, positions in enumerate(self.__routes):
+            for turnout_id, diverging in positions.items():
+                masks[index] |= users.get((turnout_id, not diverging), 0)
+
+        for name, other in conflicts:
+            index = self.__get_index(name)
+            other_index = self.__get_index(other)
+
+            masks[index] |= 1 << other_index
+            masks[other_index] |= 1 << index
+
+        return masks
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# layout.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import collections
+import logging
+import threading
+
+from src.hw.gpio.gpo_provider_pwm import GPOProviderPWM
+from src.hw.pwm.pca9685_registry import PCA9685Registry
+from src.hw.servo import Servo
+from src.hw.turnout_efrog_servo import TurnoutEFrogServo
+
+# Ids of the turnouts touched by a reload
+LayoutReload = collections.namedtuple(
+    'LayoutReload', ['added', 'removed', 'changed', 'driven'])
+
+class Layout(object):
+    """Turnouts of a layout config, each built the first time it is used
+
+    Outputs come from a PCA9685 registry so boards are only opened once a
+    turnout on them is built. Turnouts are built without homing, home them
+    in one batch with a TurnoutBank once built.
+
+    A new config can be loaded while running, only the turnouts whose config
+    changed are rebuilt. Rebuilt turnouts are new objects, so look turnouts
+    up through the layout rather than keeping them across a reload.
+    """
+
+    def __init__(self, config, registry=None, clock=None, state_store=None):
+        """Create a layout for a config
+
+        The registry provides the board outputs, a new PCA9685Registry if not
+        given. The clock and state store are handed to every turnout.
+        """
+        self.__logger = logging.getLogger('layout')
+        self.__lock = threading.Lock()
+
+        self.__config = config
+        self.__registry = registry if registry is not None else PCA9685Registry()
+        self.__clock = clock
+        self.__state_store = state_store
+
+        self.__turnouts = {}
+
+        # Frog outputs by (bus, address, pin), a rebuilt turnout keeping its
+        # frog pin reuses the output so the frog is not turned off meanwhile
+        self.__frogs = {}
+
+    def get_config(self):
+        """Return the layout config"""
+        return self.__config
+
+    def get_registry(self):
+        """Return the registry providing the board outputs"""
+        return self.__registry
+
+    def get_turnout_ids(self):
+        """Return the id of every turnout"""
+        return self.__config.get_turnout_ids()
+
+    def get_turnout(self, turnout_id):
+        """Return a turnout, building it on first use
+
+        Raises KeyError if the turnout is not in the layout.
+        """
+        with self.__lock:
+            turnout = self.__turnouts.get(turnout_id)
+
+            if turnout is None:
+                turnout = self.__build(turnout_id)
+                self.__turnouts[turnout_id] = turnout
+
+            return turnout
+
+    def get_turnouts(self):
+        """Return every turnout, building any not yet built"""
+        return [self.get_turnout(turnout_id) for turnout_id in self.get_turnout_ids()]
+
+    def get_built_count(self):
+        """Return the number of turnouts built so far"""
+        with self.__lock:
+            return len(self.__turnouts)
+
+    def reload(self, config, bank=None):
+        """Switch to a new config, rebuilding only the turnouts that changed
+
+        A changed turnout that has been set is rebuilt and set to the same
+        route again, it is only driven if its servo output, calibration or
+        angle for that route changed, otherwise just its frog is set and a frog
+        output that did not change is not turned off meanwhile. Driven
+        turnouts are moved together by the bank if one is given. Frog outputs
+        no longer used by a turnout are turned off. Unchanged turnouts are
+        left alone and keep serving.
+
+        Returns the LayoutReload of the turnouts touched.
+        """
+        targets = []
+
+        with self.__lock:
+            added, removed, changed = self.__config.diff(config)
+
+            self.__logger.info(
+                'Reloading layout, %d added, %d removed, %d changed',
+                len(added), len(removed), len(changed))
+
+            old_config, self.__config = self.__config, config
+
+            for turnout_id in removed + changed:
+                turnout = self.__turnouts.pop(turnout_id, None)
+
+                if turnout is None:
+                    continue
+
+                old = old_config.get_turnout(turnout_id)
+                new = config.get_turnout(turnout_id)
+                frog = self.__frogs.pop(old.frog, None)
+
+                if new is None or new.frog != old.frog:
+                    self.__registry.get_pwm_provider(*old.frog).turn_off()
+
+                route = turnout.get_route()
+
+                if new is None or route is None:
+                    continue
+
+                if new.frog == old.frog and frog is not None:
+                    self.__frogs[new.frog] = frog
+
+                turnout = self.__build(turnout_id)
+                self.__turnouts[turnout_id] = turnout
+
+                if self.__must_drive(old, new, route):
+                    targets.append((turnout, route))
+                else:
+                    turnout.assume_route(route)
+
+        if bank is not None:
+            bank.set_routes(targets)
+        else:
+            for turnout, route in targets:
+                turnout.set_route(route)
+
+        if len(removed) or len(changed):
+            self.__registry.flush()
+
+        return LayoutReload(
+            added, removed, changed,
+            [turnout.get_id() for turnout, route in targets])
+
+    def __len__(self):
+        """Return the number of turnouts in the layout"""
+        return len(self.__config)
+
+    @staticmethod
+    def __must_drive(old, new, route):
+        """Return True if the points must move to keep a route after a change
+        """
+        if new.servo != old.servo or new.servo_params != old.servo_params:
+            return True
+
+        if route:
+            return new.diverging != old.diverging
+
+        return new.main != old.main
+
+    def __build(self, turnout_id):
+        """Build a turnout from its config, lock must be held"""
+        config = self.__config.get_turnout(turnout_id)
+
+        if config is None:
+            raise KeyError('Turnout %d is not in the layout' % turnout_id)
+
+        self.__logger.debug('Building turnout %d', turnout_id)
+
+        servo = Servo(
+            self.__registry.get_pwm_provider(*config.servo),
+            clock=self.__clock,
+            **dict(config.servo_params))
+
+        frog = self.__frogs.get(config.frog)
+
+        if frog is None:
+            frog = GPOProviderPWM(self.__registry.get_pwm_provider(*config.frog))
+            self.__frogs[config.frog] = frog
+
+        return TurnoutEFrogServo(
+            servo,
+            frog,
+            config.main,
+            config.diverging,
+            home=False,
+            state_store=self.__state_store,
+            turnout_id=turnout_id)
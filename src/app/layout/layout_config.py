@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# layout_config.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import collections
+import hashlib
+import json
+import logging
+import os
+import pickle
+
+from src.hw.servo import Servo
+
+# File layout, JSON:
+#
+#   {
+#     "boards": [
+#       { "name": "yard", "bus": 1, "address": "0x40" }
+#     ],
+#     "turnouts": [
+#       { "id": 1, "board": "yard", "servo_pin": 0, "frog_pin": 1,
+#         "main": 45, "diverging": 135,
+#         "servo": { "speed": 360, "min_pulse": 1000, "max_pulse": 2000 } }
+#     ]
+#   }
+#
+# A turnout may put its frog on another board with "frog_board". The servo
+# calibration is optional, any of stall_current, speed, min_settle_time,
+# min_pulse and max_pulse may be given.
+
+# Bumped whenever the compiled form or its validation changes so older caches
+# are rebuilt
+COMPILED_VERSION = 2
+
+MIN_ADDRESS = 0x00
+MAX_ADDRESS = 0x7F
+
+MIN_PIN = 0
+MAX_PIN = 15
+
+MAX_TURNOUT_ID = 0xFFFF
+
+SERVO_PARAMS = [
+    'stall_current', 'speed', 'min_settle_time', 'min_pulse', 'max_pulse']
+
+# (bus, address, pin) of an output
+Output = collections.namedtuple('Output', ['bus', 'address', 'pin'])
+
+TurnoutConfig = collections.namedtuple(
+    'TurnoutConfig', ['id', 'servo', 'frog', 'main', 'diverging', 'servo_params'])
+
+class LayoutConfig(object):
+    """Validated description of the boards and turnouts of a layout
+
+    Built from a layout file by load, which keeps a compiled copy next to the
+    file keyed by the hash of its contents so an unchanged file is not parsed
+    or validated again. Invalid files raise ValueError.
+    """
+
+    def __init__(self, turnouts):
+        """Create a layout config from a list of TurnoutConfig"""
+        self.__turnouts = collections.OrderedDict(
+            (turnout.id, turnout) for turnout in turnouts)
+
+    def get_turnout_ids(self):
+        """Return the id of every turnout in file order"""
+        return list(self.__turnouts)
+
+    def get_turnout(self, turnout_id):
+        """Return the config of a turnout, None if not in the layout"""
+        return self.__turnouts.get(turnout_id)
+
+    def __len__(self):
+        """Return the number of turnouts"""
+        return len(self.__turnouts)
+
+    def __iter__(self):
+        """Iterate over the turnout configs in file order"""
+        return iter(self.__turnouts.values())
+
+    def __eq__(self, other):
+        return isinstance(other, LayoutConfig) and list(self) == list(other)
+
+    def diff(self, other):
+        """Return the ids of the turnouts added, removed and changed in
+        another config compared to this one
+        """
+        added = [
+            turnout_id for turnout_id in other.get_turnout_ids()
+            if turnout_id not in self.__turnouts]
+
+        removed = []
+        changed = []
+
+        for turnout_id, turnout in self.__turnouts.items():
+            other_turnout = other.get_turnout(turnout_id)
+
+            if other_turnout is None:
+                removed.append(turnout_id)
+            elif other_turnout != turnout:
+                changed.append(turnout_id)
+
+        return added, removed, changed
+
+    @classmethod
+    def parse(cls, text):
+        """Validate layout JSON and return its config"""
+        try:
+            layout = json.loads(text)
+        except ValueError as ex:
+            raise ValueError('Layout is not valid JSON: %s' % ex)
+
+        _check_keys('Layout', layout, ['boards', 'turnouts'], ['boards', 'turnouts'])
+
+        boards = _parse_boards(layout['boards'])
+        turnouts = []
+        used = {}
+
+        if type(layout['turnouts']) is not list:
+            raise ValueError('Layout turnouts must be a list')
+
+        for turnout in layout['turnouts']:
+            turnout = _parse_turnout(turnout, boards)
+
+            if turnout.id in used.values():
+                raise ValueError('Turnout %d defined twice' % turnout.id)
+
+            for output in [turnout.servo, turnout.frog]:
+                if output in used:
+                    raise ValueError(
+                        'Turnout %d uses pin %d of board 0x%02x on bus %d, '
+                        'already used by turnout %d' % (
+                            turnout.id, output.pin, output.address, output.bus,
+                            used[output]))
+
+                used[output] = turnout.id
+
+            turnouts.append(turnout)
+
+        return cls(turnouts)
+
+    @classmethod
+    def load(cls, path, cache_path=None):
+        """Return the config of a layout file
+
+        The compiled config is cached in the cache path, the layout path with
+        .cache appended by default, and reused while the file hash matches.
+        """
+        logger = logging.getLogger('layout_config')
+
+        if cache_path is None:
+            cache_path = path + '.cache'
+
+        with open(path, 'rb') as layout_file:
+            text = layout_file.read()
+
+        digest = hashlib.sha256(text).hexdigest()
+
+        try:
+            with open(cache_path, 'rb') as cache_file:
+                version, cached_digest, config = pickle.load(cache_file)
+
+            if version == COMPILED_VERSION and cached_digest == digest:
+                return config
+        except (IOError, OSError, ValueError, EOFError, TypeError,
+            pickle.UnpicklingError, AttributeError, ImportError):
+            logger.info('No usable compiled layout in %s', cache_path)
+
+        config = cls.parse(text.decode('utf-8'))
+
+        try:
+            _save(cache_path, (COMPILED_VERSION, digest, config))
+        except (IOError, OSError):
+            logger.warning('Could not cache compiled layout in %s', cache_path)
+
+        return config
+
+def _save(path, compiled):
+    """Write the compiled layout to a temporary file and move it into place"""
+    temp_path = path + '.tmp'
+
+    with open(temp_path, 'wb') as cache_file:
+        pickle.dump(compiled, cache_file, pickle.HIGHEST_PROTOCOL)
+
+    os.replace(temp_path, path)
+
+def _check_keys(what, item, required, allowed):
+    """Check that an object has the required keys and no unknown ones"""
+    if type(item) is not dict:
+        raise ValueError('%s must be an object' % what)
+
+    for key in required:
+        if key not in item:
+            raise ValueError('%s is missing %s' % (what, key))
+
+    for key in item:
+        if key not in allowed:
+            raise ValueError('%s has unknown key %s' % (what, key))
+
+def _check_int(what, value, minimum, maximum):
+    """Return a value that must be an int in a range, hex strings allowed"""
+    if type(value) is str:
+        try:
+            value = int(value, 0)
+        except ValueError:
+            raise ValueError('%s must be a number, not %s' % (what, value))
+
+    if type(value) is not int or value < minimum or value > maximum:
+        raise ValueError(
+            '%s must be from %d to %d, not %s' % (what, minimum, maximum, value))
+
+    return value
+
+def _parse_boards(boards):
+    """Return the (bus, address) of each board by name"""
+    if type(boards) is not list:
+        raise ValueError('Layout boards must be a list')
+
+    parsed = {}
+
+    for board in boards:
+        _check_keys('Board', board, ['name', 'bus', 'address'], ['name', 'bus', 'address'])
+
+        name = board['name']
+
+        if name in parsed:
+            raise ValueError('Board %s defined twice' % name)
+
+        what = 'Board %s' % name
+
+        bus = _check_int(what + ' bus', board['bus'], 0, 0xFFFF)
+        address = _check_int(
+            what + ' address', board['address'], MIN_ADDRESS, MAX_ADDRESS)
+
+        if (bus, address) in parsed.values():
+            raise ValueError(
+                'Board %s has the same bus and address as another' % name)
+
+        parsed[name] = (bus, address)
+
+    return parsed
+
+def _parse_turnout(turnout, boards):
+    """Return the config of a turnout"""
+    _check_keys(
+        'Turnout',
+        turnout,
+        ['id', 'board', 'servo_pin', 'frog_pin', 'main', 'diverging'],
+        ['id', 'board', 'servo_pin', 'frog_pin', 'frog_board', 'main',
+            'diverging', 'servo'])
+
+    turnout_id = _check_int('Turnout id', turnout['id'], 0, MAX_TURNOUT_ID)
+    what = 'Turnout %d' % turnout_id
+
+    outputs = []
+
+    for board_key, pin_key in [('board', 'servo_pin'), ('frog_board', 'frog_pin')]:
+        board = turnout.get(board_key, turnout['board'])
+
+        if board not in boards:
+            raise ValueError('%s uses unknown board %s' % (what, board))
+
+        bus, address = boards[board]
+        pin = _check_int(
+            '%s %s' % (what, pin_key), turnout[pin_key], MIN_PIN, MAX_PIN)
+
+        outputs.append(Output(bus, address, pin))
+
+    angles = [
+        _check_int('%s %s angle' % (what, key), turnout[key], 0, 180)
+        for key in ['main', 'diverging']]
+
+    servo_params = turnout.get('servo', {})
+    _check_keys(what + ' servo', servo_params, [], SERVO_PARAMS)
+
+    # Check the same bounds as the servo so a cached config never fails later
+    for key, value in servo_params.items():
+        if type(value) not in (int, float):
+            raise ValueError('%s servo %s must be a number' % (what, key))
+
+        if key == 'min_settle_time':
+            if value < 0:
+                raise ValueError(
+                    '%s servo %s must not be negative' % (what, key))
+        elif value <= 0:
+            raise ValueError(
+                '%s servo %s must be a positive number' % (what, key))
+
+    if servo_params.get('min_pulse', Servo.MIN_PULSE_US) >= \
+        servo_params.get('max_pulse', Servo.MAX_PULSE_US):
+        raise ValueError('%s servo min_pulse must be below max_pulse' % what)
+
+    if servo_params.get('max_pulse', Servo.MAX_PULSE_US) >= \
+        1000000 / Servo.FREQ_HZ:
+        raise ValueError(
+            '%s servo max_pulse must be below the PWM period' % what)
+
+    return TurnoutConfig(
+        turnout_id, outputs[0], outputs[1], angles[0], angles[1],
+        tuple(sorted(servo_params.items())))
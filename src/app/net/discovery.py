@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# discovery.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import asyncio
+import logging
+import random
+import socket
+import struct
+
+class Discovery(object):
+    """Finds the server of the network, or elects one, using UDP datagrams
+
+    A searching node sends a probe every probe interval. A server answers
+    probes with an announce carrying its TCP port, and announces itself once
+    when it starts serving, so a searching node finds an existing server within
+    one probe interval.
+
+    If no server is heard within an election window the node with the highest
+    id among the server capable nodes probing in that window is elected. Every
+    node sees the same probes so they all agree on the winner, which starts
+    serving and announces itself to the rest. Node ids must be unique.
+
+    All socket work happens on the given event loop, the public methods may be
+    called from any thread.
+    """
+
+    PORT = 1507
+    SERVER_PORT = 1507
+
+    PROBE_INTERVAL_S = 0.1
+    ELECTION_WINDOW_S = 0.3
+
+    MAGIC = b'TD'
+    DATAGRAM = struct.Struct('!2sBBIH')
+
+    # Datagram kinds
+    PROBE = 1
+    ANNOUNCE = 2
+
+    # Modes
+    IDLE = 'idle'
+    SEARCHING = 'searching'
+    SERVING = 'serving'
+
+    def __init__(
+        self,
+        node_id=None,
+        port=PORT,
+        server_port=SERVER_PORT,
+        targets=None,
+        can_serve=True,
+        loop=None):
+        """Create a discovery agent
+
+        The agent listens on the given UDP port and sends to the given list of
+        (host, port) targets, by default a broadcast on the same port. The
+        server port is the TCP port announced when serving.
+        """
+        self.__logger = logging.getLogger('discovery')
+
+        self.node_id = node_id if node_id is not None else random.getrandbits(32)
+
+        self.__port = port
+        self.__server_port = server_port
+        self.__targets = targets if targets is not None else [('<broadcast>', port)]
+        self.__can_serve = can_serve
+        self.__loop = loop if loop is not None else asyncio.get_event_loop()
+
+        self.__mode = self.IDLE
+        self.__transport = None
+        self.__task = None
+
+        self.__found_cb = None
+        self.__elected_cb = None
+        self.__window_end = 0
+        self.__candidates = set()
+
+    def get_mode(self):
+        """Return whether the agent is idle, searching or serving"""
+        return self.__mode
+
+    def search(self, found_cb, elected_cb):
+        """Start searching for a server
+
+        found_cb is called with the host and port of a server that was found,
+        elected_cb is called if this node should become the server. At most one
+        of them is called per search.
+        """
+        self.__loop.call_soon_threadsafe(self.__begin_search, found_cb, elected_cb)
+
+    def announce(self):
+        """Start answering probes as the server"""
+        self.__loop.call_soon_threadsafe(self.__begin_serving)
+
+    def stop(self):
+        """Stop searching or serving"""
+        self.__loop.call_soon_threadsafe(self.__end)
+
+    def __begin_search(self, found_cb, elected_cb):
+        """Start searching, on the event loop"""
+        self.__mode = self.SEARCHING
+        self.__found_cb = found_cb
+        self.__elected_cb = elected_cb
+
+        self.__start_window()
+        self.__run()
+
+    def __begin_serving(self):
+        """Start serving, on the event loop"""
+        self.__mode = self.SERVING
+        self.__run()
+
+    def __end(self):
+        """Stop and close the socket, on the event loop"""
+        self.__mode = self.IDLE
+
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
+
+        if self.__transport is not None:
+            self.__transport.close()
+            self.__transport = None
+
+    def __run(self):
+        """Make sure the probe task is running"""
+        if self.__task is None:
+            self.__task = asyncio.ensure_future(self.__probe(), loop=self.__loop)
+
+    def __start_window(self):
+        """Start a new election window"""
+        self.__window_end = self.__loop.time() + self.ELECTION_WINDOW_S
+        self.__candidates = set([self.node_id]) if self.__can_serve else set()
+
+    async def __probe(self):
+        """Probe while searching, announce once when serving"""
+        try:
+            if self.__transport is None:
+                await self.__open()
+
+            if self.__mode == self.SERVING:
+                self.__send(self.ANNOUNCE)
+
+            while self.__mode == self.SEARCHING:
+                self.__send(self.PROBE)
+
+                await asyncio.sleep(self.PROBE_INTERVAL_S)
+
+                if self.__mode == self.SEARCHING and \
+                    self.__loop.time() >= self.__window_end:
+                    self.__elect()
+        finally:
+            self.__task = None
+
+    async def __open(self):
+        """Open the datagram socket"""
+        options = {}
+
+        if hasattr(socket, 'SO_REUSEPORT'):
+            options['reuse_port'] = True
+
+        self.__transport, protocol = await self.__loop.create_datagram_endpoint(
+            lambda: _DiscoveryProtocol(self.__received),
+            local_addr=('0.0.0.0', self.__port),
+            allow_broadcast=True,
+            **options)
+
+    def __elect(self):
+        """Decide the election window that just ended"""
+        winner = max(self.__candidates) if len(self.__candidates) else None
+
+        if winner == self.node_id:
+            self.__logger.info('Elected as server')
+            self.__mode = self.IDLE
+            self.__elected_cb()
+            return
+
+        self.__start_window()
+
+    def __send(self, kind, targets=None):
+        """Send a datagram to the targets"""
+        if self.__transport is None:
+            return
+
+        datagram = self.DATAGRAM.pack(
+            self.MAGIC, kind, int(self.__can_serve), self.node_id,
+            self.__server_port)
+
+        for target in targets if targets is not None else self.__targets:
+            self.__transport.sendto(datagram, target)
+
+    def __received(self, data, address):
+        """Handle a datagram from another node"""
+        if len(data) != self.DATAGRAM.size:
+            return
+
+        magic, kind, can_serve, node_id, server_port = self.DATAGRAM.unpack(data)
+
+        if magic != self.MAGIC or node_id == self.node_id:
+            return
+
+        if kind == self.PROBE:
+            if self.__mode == self.SERVING:
+                self.__send(self.ANNOUNCE, [address])
+            elif self.__mode == self.SEARCHING and can_serve:
+                self.__candidates.add(node_id)
+
+        elif kind == self.ANNOUNCE and self.__mode == self.SEARCHING:
+            self.__logger.info('Found server at %s:%d', address[0], server_port)
+            self.__mode = self.IDLE
+            self.__found_cb(address[0], server_port)
+
+class _DiscoveryProtocol(asyncio.DatagramProtocol):
+    """Passes received datagrams to the discovery agent"""
+
+    def __init__(self, datagram_rx_cb):
+        self.__datagram_rx_cb = datagram_rx_cb
+
+    def datagram_received(self, data, address):
+        self.__datagram_rx_cb(data, address)
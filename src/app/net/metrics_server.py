@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# metrics_server.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import http.server
+import logging
+import threading
+
+def render(snapshots):
+    """Return device metrics snapshots in the Prometheus text format"""
+    metrics = [
+        ('pca9685_reads_total', 'counter', 'Bus reads per device and channel'),
+        ('pca9685_writes_total', 'counter', 'Bus writes per device and channel'),
+        ('pca9685_redundant_writes_total', 'counter',
+            'Writes that did not change the chip per device and channel'),
+        ('pca9685_transactions_total', 'counter', 'Bus transactions per device'),
+        ('pca9685_busy_seconds_total', 'counter',
+            'Time spent in bus transactions per device'),
+        ('pca9685_transaction_seconds', 'histogram',
+            'Bus transaction latency per device'),
+    ]
+
+    samples = dict((name, []) for name, kind, text in metrics)
+
+    for snapshot in snapshots:
+        device = snapshot['device']
+
+        for pin, counts in sorted(snapshot['channels'].items()):
+            labels = { 'device': device, 'channel': pin }
+
+            for key in ['reads', 'writes', 'redundant_writes']:
+                samples['pca9685_%s_total' % key].append(
+                    ('', labels, counts[key]))
+
+        for key in ['reads', 'writes']:
+            samples['pca9685_transactions_total'].append(
+                ('', { 'device': device, 'kind': key[:-1] }, snapshot[key]))
+
+        samples['pca9685_busy_seconds_total'].append(
+            ('', { 'device': device }, snapshot['busy_s']))
+
+        for kind, latency in sorted(snapshot['latency'].items()):
+            labels = { 'device': device, 'kind': kind }
+
+            for bound, count in latency['buckets']:
+                bucket_labels = dict(labels)
+                bucket_labels['le'] = '+Inf' if bound is None else repr(bound)
+
+                samples['pca9685_transaction_seconds'].append(
+                    ('_bucket', bucket_labels, count))
+
+            samples['pca9685_transaction_seconds'].append(
+                ('_sum', labels, latency['sum']))
+            samples['pca9685_transaction_seconds'].append(
+                ('_count', labels, latency['count']))
+
+    lines = []
+
+    for name, kind, text in metrics:
+        lines.append('# HELP %s %s' % (name, text))
+        lines.append('# TYPE %s %s' % (name, kind))
+
+        for suffix, labels, value in samples[name]:
+            lines.append('%s%s{%s} %s' % (
+                name,
+                suffix,
+                ','.join(
+                    '%s="%s"' % (key, labels[key]) for key in sorted(labels)),
+                repr(value)))
+
+    return '\n'.join(lines) + '\n'
+
+class MetricsServer(object):
+    """Serves device metrics over HTTP in the Prometheus text format
+
+    Sources are anything with a get_snapshot method, such as PCA9685Metrics.
+    Metrics are served at /metrics from a background thread, by default only
+    to the local host.
+    """
+
+    HOST = '127.0.0.1'
+    PORT = 9685
+
+    def __init__(self, sources, host=HOST, port=PORT):
+        """Create a metrics server for a list of metrics sources"""
+        self.__logger = logging.getLogger('metrics_server')
+
+        self.__sources = list(sources)
+        self.__host = host
+        self.__port = port
+
+        self.__server = None
+        self.__thread = None
+
+    def get_snapshots(self):
+        """Return the current snapshot of every source"""
+        return [source.get_snapshot() for source in self.__sources]
+
+    def get_port(self):
+        """Return the port being served on, the bound port once started"""
+        if self.__server is not None:
+            return self.__server.server_address[1]
+
+        return self.__port
+
+    def start(self):
+        """Start serving in a background thread"""
+        if self.is_running():
+            return
+
+        self.__server = http.server.HTTPServer(
+            (self.__host, self.__port), self.__handler())
+
+        self.__thread = threading.Thread(target=self.__server.serve_forever)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+        self.__logger.info('Serving metrics on port %d', self.get_port())
+
+    def stop(self):
+        """Stop serving"""
+        if not self.is_running():
+            return
+
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__thread.join()
+
+        self.__server = None
+        self.__thread = None
+
+    def is_running(self):
+        """Return True if serving"""
+        return self.__server is not None
+
+    def __handler(self):
+        """Return a request handler class bound to this server"""
+        metrics_server = self
+        logger = self.__logger
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+
+                body = render(metrics_server.get_snapshots()).encode('utf-8')
+
+                self.send_response(200)
+                self.send_header(
+                    'Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+        return Handler
@@ -10,25 +10,54 @@
 
 import logging
 import random
+import threading
 
 from transitions.extensions import LockedMachine as Machine
-from transitions.extensions.states import add_state_features, Timeout
 
-@add_state_features(Timeout)
+from src.app.net import protocol
+from src.clock.clock import Clock
+
 class NetworkManager(Machine):
     """Object for managing network resources for the node"""
 
     DISCOVERY_TIMEOUT_S =           10
     DISCOVERY_TIMEOUT_RAND_FACTOR = 0.25
 
+    BATCH_INTERVAL_S =              0.01
+
     def __init__(
         self,
-        endpoints,
-        client,
+        endpoints=None,
+        client=None,
         server=None,
         discovery_timeout=DISCOVERY_TIMEOUT_S,
-        randomize_timeout=True):
-        """Create a network manager"""
+        randomize_timeout=True,
+        discovery=None,
+        batch_size=None,
+        batch_interval=BATCH_INTERVAL_S,
+        outbound_queue=None,
+        clock=None):
+        """Create a network manager
+
+        Endpoints are called with received data that no registered handler
+        takes, none are needed if every message type is handled.
+
+        If a discovery agent is given it is used to find the server, or to be
+        elected as the server, when searching. The discovery timeout then only
+        acts as a fallback.
+
+        If a batch size in bytes is given sent data is buffered and passed to
+        the role in one go once the batch size is reached or the batch interval
+        has passed since the first buffered send. Batched data is concatenated
+        so it should be made of self delimiting protocol frames.
+
+        If an outbound queue is given sent data is queued rather than refused
+        while not connected, and is only passed to the role while the role is
+        writable, so a slow peer never blocks the sender.
+
+        The discovery timeout and batch interval are timed on the clock, the
+        system clock if not given.
+        """
         self.__logger = logging.getLogger('network_manager')
 
         if randomize_timeout:
@@ -40,18 +69,20 @@ class NetworkManager(Machine):
 
         self.__STATES = [
             { 'name': 'initializing',
-                'on_enter':     '_stop' },
+                'on_enter':     '_shutdown' },
             { 'name': 'searching',
-                'timeout':      self.discovery_timeout,
-                'on_timeout':   '_start_server',
-                'on_enter':     '_start_client' },
-            { 'name': 'connected' },
+                'on_enter':     ['_start_client', '_start_search_timer'],
+                'on_exit':      '_cancel_search_timer' },
+            { 'name': 'connected',
+                'on_enter':     '_drain_queue',
+                'on_exit':      '_discard_batch' },
         ]
 
         self.__TRANSITIONS = [
             { 'trigger': 'search',          'source': 'initializing',   'dest': 'searching' },
             { 'trigger': 'connected',       'source': 'searching',     'dest': 'connected' },
             { 'trigger': 'disconnected',    'source': 'connected',      'dest': 'searching' },
+            { 'trigger': 'disconnected',    'source': 'searching',      'dest': 'searching' },
             { 'trigger': 'shutdown',        'source': '*',              'dest': 'initializing' }
         ]
 
@@ -72,24 +103,130 @@ class NetworkManager(Machine):
 
         self.__role = 'client'
 
-        if type(endpoints) is not list:
+        self.__discovery = discovery
+
+        self.__clock = clock if clock is not None else Clock()
+        self.__search_timer = None
+
+        self.__batch_size = batch_size
+        self.__batch_interval = batch_interval
+        self.__batch = bytearray()
+        self.__batch_timer = None
+        self.__batch_lock = threading.Lock()
+
+        self.__queue = outbound_queue
+        self.__queue_lock = threading.Lock()
+
+        if self.__queue is not None:
+            for role in self.__roles.values():
+                if role is not None:
+                    role.set_writable_cb(self._drain_queue)
+
+        if endpoints is None:
+            self.__endpoints = []
+        elif type(endpoints) is not list:
             self.__endpoints = [endpoints]
         else:
             self.__endpoints = endpoints
 
         self.__endpoints = [endp for endp in self.__endpoints if endp is not None]
 
-        if not len(self.__endpoints):
-            raise AttributeError('No endpoints specified')
+        # Handlers of parsed frames indexed by message type
+        self.__handlers = {}
+
+    def register_handler(self, msg_type, handler):
+        """Register a handler for received frames of a given message type
+
+        The handler is called with each protocol.Frame of that type.
+        """
+        if msg_type not in protocol.RECORDS:
+            raise AttributeError('Unknown message type')
+
+        self.__handlers.setdefault(msg_type, []).append(handler)
+
+    def unregister_handler(self, msg_type, handler):
+        """Remove a handler registered for a message type"""
+        handlers = self.__handlers.get(msg_type, [])
+
+        if handler in handlers:
+            handlers.remove(handler)
 
-    def send(self, data, length):
-        """Send data using active role"""
-        if self.state is not 'connected':
+        if not len(handlers):
+            self.__handlers.pop(msg_type, None)
+
+    def send(self, data, length, key=None):
+        """Send data using active role
+
+        With an outbound queue the data is queued, under the given key if the
+        queue coalesces, and sent once connected and the role is writable.
+        """
+        if self.__queue is not None:
+            self.__queue.put(bytes(memoryview(data)[:length]), key)
+            self._drain_queue()
+            return
+
+        self.__send(data, length)
+
+    def _drain_queue(self):
+        """Send queued data while connected and the role is writable
+
+        The role stops being writable once it holds enough unwritten data, so
+        the rest stays queued under the bound and drop policy of the queue.
+        """
+        if self.__queue is None:
+            return
+
+        with self.__queue_lock:
+            while len(self.__queue) and self.state == 'connected' and \
+                self.__get_role().is_writable():
+                data = self.__queue.pop()
+
+                try:
+                    self.__send(data, len(data))
+                except SystemError:
+                    # Disconnected since the state was checked
+                    self.__queue.requeue(data)
+                    return
+
+    def __send(self, data, length):
+        """Send data using active role, buffering it if batching"""
+        if self.state != 'connected':
             raise SystemError('System must be connected to send data')
 
-        self.__logger.debug('Sending data')
+        if self.__batch_size is None:
+            self.__logger.debug('Sending data')
+            self.__get_role().send(data, length)
+            return
+
+        with self.__batch_lock:
+            self.__batch.extend(memoryview(data)[:length])
 
-        self.__get_role().send(data, length)
+            if len(self.__batch) >= self.__batch_size:
+                self.__flush_batch()
+            elif self.__batch_timer is None:
+                self.__batch_timer = self.__clock.call_later(
+                    self.__batch_interval, self.flush)
+
+    def flush(self):
+        """Send any buffered data now"""
+        with self.__batch_lock:
+            self.__flush_batch()
+
+    def _discard_batch(self):
+        """Drop buffered data that can no longer be sent"""
+        with self.__batch_lock:
+            if len(self.__batch):
+                self.__logger.warning('Dropping %d unsent bytes', len(self.__batch))
+
+            self.__cancel_batch_timer()
+            del self.__batch[:]
+
+    def _shutdown(self):
+        """Stop all roles and discovery"""
+        self._stop()
+
+        if self.__discovery is not None:
+            self.__discovery.stop()
 
     def _stop(self):
         """Stop all roles"""
@@ -100,16 +237,93 @@ class NetworkManager(Machine):
                 role_to_stop.stop()
 
     def _start_client(self):
-        """Start the client role"""
-        self.__start_role('client')
+        """Start the client role, once a server is found if discovering"""
+        if self.__discovery is None:
+            self.__start_role('client')
+            return
+
+        self._stop()
+        self.__discovery.search(self.server_found, self.elected)
+
+    def _start_search_timer(self):
+        """Fall back to serving if still searching after the discovery timeout
+        """
+        self.__search_timer = self.__clock.call_later(
+            self.discovery_timeout, self.search_timeout)
+
+    def _cancel_search_timer(self):
+        """Stop the discovery timeout"""
+        if self.__search_timer is not None:
+            self.__search_timer.cancel()
+            self.__search_timer = None
+
+    def search_timeout(self):
+        """Called by the clock once the discovery timeout has passed
+
+        Public so that it runs holding the machine lock.
+        """
+        if self.state != 'searching':
+            return
+
+        self.__search_timer = None
+        self._start_server()
 
     def _start_server(self):
         """Start the server role if available"""
-        if self.__roles['server'] is not None:
-            self.__start_role('server')
-        else:
+        if self.__roles['server'] is None:
             raise RuntimeError('No server to start')
 
+        # Already serving, e.g. elected before the discovery timeout
+        if self.__role == 'server' and self.__get_role().is_running():
+            return
+
+        self.__start_role('server')
+
+        if self.__discovery is not None:
+            self.__discovery.announce()
+
+    def server_found(self, host, port):
+        """Called by discovery with the address of the server
+
+        Public so that it runs holding the machine lock.
+        """
+        if self.state != 'searching':
+            return
+
+        self.__logger.info('Connecting to discovered server')
+
+        self.__roles['client'].set_server(host, port)
+        self.__start_role('client')
+
+    def elected(self):
+        """Called by discovery when this node should be the server
+
+        Public so that it runs holding the machine lock.
+        """
+        if self.state != 'searching' or self.__roles['server'] is None:
+            return
+
+        self._start_server()
+
+    def __flush_batch(self):
+        """Pass buffered data to the role, batch lock must be held"""
+        self.__cancel_batch_timer()
+
+        if not len(self.__batch) or self.state != 'connected':
+            return
+
+        data = bytes(self.__batch)
+        del self.__batch[:]
+
+        self.__logger.debug('Sending batch of %d bytes', len(data))
+        self.__get_role().send(data, len(data))
+
+    def __cancel_batch_timer(self):
+        """Cancel the batch interval timer, batch lock must be held"""
+        if self.__batch_timer is not None:
+            self.__batch_timer.cancel()
+            self.__batch_timer = None
+
     def __get_role(self):
         """Get the current role"""
         return self.__roles[self.__role]
@@ -128,6 +342,53 @@ class NetworkManager(Machine):
         self.__get_role().start(self.connected, self.disconnected, self.__data_rx)
 
     def __data_rx(self, data, length):
+        """Dispatch received data
+
+        Frames are passed only to the handlers registered for their message
+        type. A handler that fails is logged and does not stop the frames that
+        follow from being handled. Frames of types without handlers, and data
+        that is not made of frames, are passed to the endpoints.
+        """
+        if not len(self.__handlers):
+            self.__call_endpoints(data, length)
+            return
+
+        view = memoryview(data)[:length]
+        frames = protocol.iter_frames(view)
+        unhandled = bytearray()
+        offset = 0
+
+        while True:
+            try:
+                frame = next(frames, None)
+            except ValueError as ex:
+                if not len(self.__endpoints):
+                    self.__logger.warning('Dropping received data: %s', ex)
+
+                unhandled.extend(view[offset:])
+                break
+
+            if frame is None:
+                break
+
+            handlers = self.__handlers.get(frame.msg_type)
+
+            if handlers is None:
+                unhandled.extend(view[offset:offset + len(frame)])
+
+            for handler in handlers or []:
+                try:
+                    handler(frame)
+                except Exception:
+                    self.__logger.exception(
+                        'Handler failed for message type %d', frame.msg_type)
+
+            offset += len(frame)
+
+        if len(unhandled):
+            self.__call_endpoints(bytes(unhandled), len(unhandled))
+
+    def __call_endpoints(self, data, length):
         """Call all endpoints with received data"""
         for endpoint in self.__endpoints:
             endpoint(data, length)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# outbound_queue.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import collections
+import itertools
+import logging
+import threading
+
+class OutboundQueue(object):
+    """Bounded queue of messages waiting to be sent
+
+    Putting a message never blocks. When the queue is full the oldest message
+    is dropped. With the coalesce policy a message put with a key replaces the
+    queued message with the same key, keeping its place, so e.g. only the
+    latest state of each turnout is queued.
+
+    Producers are told about backpressure through a callback that is called
+    with True once the depth reaches the high water mark and with False once it
+    falls back to the low water mark.
+    """
+
+    DROP_OLDEST = 'drop_oldest'
+    COALESCE = 'coalesce'
+
+    def __init__(
+        self,
+        max_depth,
+        policy=DROP_OLDEST,
+        high_water=None,
+        low_water=None,
+        backpressure_cb=None):
+        """Create a queue holding at most max_depth messages
+
+        The water marks default to three quarters and one quarter of the
+        maximum depth.
+        """
+        self.__logger = logging.getLogger('outbound_queue')
+
+        if max_depth < 1:
+            raise AttributeError('Queue must hold at least one message')
+
+        if policy not in (self.DROP_OLDEST, self.COALESCE):
+            raise AttributeError('Unknown queue policy')
+
+        self.__max_depth = max_depth
+        self.__policy = policy
+        self.__high_water = high_water if high_water is not None else max(1, max_depth * 3 // 4)
+        self.__low_water = low_water if low_water is not None else max_depth // 4
+        self.__backpressure_cb = backpressure_cb
+
+        self.__lock = threading.Lock()
+        self.__messages = collections.OrderedDict()
+        self.__sequence = itertools.count()
+        self.__congested = False
+
+        self.__enqueued = 0
+        self.__sent = 0
+        self.__dropped = 0
+        self.__coalesced = 0
+        self.__peak_depth = 0
+
+    def __len__(self):
+        """Return the number of queued messages"""
+        return len(self.__messages)
+
+    def is_congested(self):
+        """Return whether producers should hold back"""
+        return self.__congested
+
+    def put(self, data, key=None):
+        """Queue a message, returns False if a message had to be dropped"""
+        with self.__lock:
+            self.__enqueued += 1
+
+            if self.__policy == self.COALESCE and key is not None:
+                slot = ('key', key)
+
+                if slot in self.__messages:
+                    self.__coalesced += 1
+                    self.__messages[slot] = data
+                    return True
+            else:
+                slot = ('seq', next(self.__sequence))
+
+            accepted = True
+
+            if len(self.__messages) >= self.__max_depth:
+                self.__messages.popitem(last=False)
+                self.__dropped += 1
+                accepted = False
+
+            self.__messages[slot] = data
+            self.__peak_depth = max(self.__peak_depth, len(self.__messages))
+
+            notify = not self.__congested and \
+                len(self.__messages) >= self.__high_water
+
+            if notify:
+                self.__congested = True
+
+        if not accepted:
+            self.__logger.warning('Queue full, dropped oldest message')
+
+        if notify:
+            self.__notify()
+
+        return accepted
+
+    def pop(self):
+        """Take the oldest message, None if the queue is empty"""
+        with self.__lock:
+            if not len(self.__messages):
+                return None
+
+            data = self.__messages.popitem(last=False)[1]
+            self.__sent += 1
+
+            notify = self.__congested and \
+                len(self.__messages) <= self.__low_water
+
+            if notify:
+                self.__congested = False
+
+        if notify:
+            self.__notify()
+
+        return data
+
+    def requeue(self, data):
+        """Put back a message taken by pop that could not be sent
+
+        The message goes back to the front of the queue, unless the queue
+        filled up meanwhile in which case it is dropped as the oldest message.
+        """
+        with self.__lock:
+            self.__sent -= 1
+
+            if len(self.__messages) >= self.__max_depth:
+                self.__dropped += 1
+                accepted = False
+            else:
+                slot = ('seq', next(self.__sequence))
+                self.__messages[slot] = data
+                self.__messages.move_to_end(slot, last=False)
+                accepted = True
+
+            notify = not self.__congested and \
+                len(self.__messages) >= self.__high_water
+
+            if notify:
+                self.__congested = True
+
+        if not accepted:
+            self.__logger.warning('Queue full, dropped oldest message')
+
+        if notify:
+            self.__notify()
+
+        return accepted
+
+    def get_metrics(self):
+        """Return a snapshot of the queue counters"""
+        with self.__lock:
+            return {
+                'depth':        len(self.__messages),
+                'max_depth':    self.__max_depth,
+                'peak_depth':   self.__peak_depth,
+                'enqueued':     self.__enqueued,
+                'sent':         self.__sent,
+                'dropped':      self.__dropped,
+                'coalesced':    self.__coalesced,
+                'congested':    self.__congested }
+
+    def __notify(self):
+        """Tell producers about a change in backpressure"""
+        if self.__backpressure_cb is not None:
+            self.__backpressure_cb(self.__congested)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# protocol.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import struct
+
+# Frame layout, all fields in network byte order:
+#
+#   magic       2 bytes     'TT'
+#   version     u8
+#   type        u8          one of the message types below
+#   sequence    u16         wraps at 65536
+#   count       u16         number of records that follow
+#   records     count * the fixed record size of the message type
+#
+# Frames are self delimiting so several can be sent back to back.
+
+MAGIC = b'TT'
+VERSION = 1
+
+HEADER = struct.Struct('!2sBBHH')
+
+# Message types
+COMMAND = 1
+STATE = 2
+SYNC_REQUEST = 3
+SYNC_DELTA = 4
+SYNC_VERSION = 5
+
+# Records of each message type
+RECORDS = {
+    # turnout id, diverging
+    COMMAND:        struct.Struct('!HB'),
+    STATE:          struct.Struct('!HB'),
+    # epoch, version: the requester's own table first, then the last version
+    # acknowledged from each known peer table
+    SYNC_REQUEST:   struct.Struct('!II'),
+    # turnout id, diverging or UNKNOWN, version of the entry, epoch the change
+    # came from
+    SYNC_DELTA:     struct.Struct('!HBII'),
+    # epoch, base version, version: ends a delta from base to version
+    SYNC_VERSION:   struct.Struct('!III'),
+}
+
+# Diverging field of a sync delta entry whose route is not known, e.g. while
+# the turnout moves
+UNKNOWN = 0xFF
+
+MAX_RECORDS = 0xFFFF
+SEQUENCE_MODULO = 0x10000
+
+class Frame(object):
+    """A received frame, records are read straight out of the receive buffer
+    """
+
+    def __init__(self, msg_type, sequence, count, records):
+        """Create a frame over a view of its records"""
+        self.msg_type = msg_type
+        self.sequence = sequence
+        self.count = count
+
+        self.__records = records
+        self.__record = RECORDS[msg_type]
+
+    def __len__(self):
+        """Return the size of the frame in bytes"""
+        return HEADER.size + len(self.__records)
+
+    def __iter__(self):
+        """Iterate over the records of the frame as tuples"""
+        return self.__record.iter_unpack(self.__records)
+
+    def get_record(self, index):
+        """Return a single record of the frame as a tuple"""
+        assert(index >= 0)
+        assert(index < self.count)
+
+        return self.__record.unpack_from(
+            self.__records, index * self.__record.size)
+
+class FrameEncoder(object):
+    """Builds frames stamped with consecutive sequence numbers"""
+
+    def __init__(self, sequence=0):
+        """Create an encoder starting at the given sequence number"""
+        self.__sequence = sequence % SEQUENCE_MODULO
+
+    def encode(self, msg_type, records):
+        """Return a frame carrying the given records"""
+        frame = encode(msg_type, self.__sequence, records)
+
+        self.__sequence = (self.__sequence + 1) % SEQUENCE_MODULO
+
+        return frame
+
+def encode(msg_type, sequence, records):
+    """Return a frame of the given type carrying a list of record tuples"""
+    record = RECORDS[msg_type]
+    records = list(records)
+
+    if len(records) > MAX_RECORDS:
+        raise ValueError('Too many records for one frame')
+
+    frame = bytearray(HEADER.size + record.size * len(records))
+
+    HEADER.pack_into(
+        frame, 0, MAGIC, VERSION, msg_type, sequence, len(records))
+
+    offset = HEADER.size
+
+    for fields in records:
+        record.pack_into(frame, offset, *fields)
+        offset += record.size
+
+    return bytes(frame)
+
+def parse(data, offset=0):
+    """Parse the frame at an offset into a buffer without copying it"""
+    view = memoryview(data)
+
+    if len(view) - offset < HEADER.size:
+        raise ValueError('Frame truncated in header')
+
+    magic, version, msg_type, sequence, count = HEADER.unpack_from(view, offset)
+
+    if magic != MAGIC:
+        raise ValueError('Not a turnout frame')
+
+    if version != VERSION:
+        raise ValueError('Unsupported protocol version %d' % version)
+
+    if msg_type not in RECORDS:
+        raise ValueError('Unknown message type %d' % msg_type)
+
+    start = offset + HEADER.size
+    end = start + count * RECORDS[msg_type].size
+
+    if end > len(view):
+        raise ValueError('Frame truncated in records')
+
+    return Frame(msg_type, sequence, count, view[start:end])
+
+def iter_frames(data):
+    """Iterate over frames sent back to back in a buffer"""
+    offset = 0
+    length = len(memoryview(data))
+
+    while offset < length:
+        frame = parse(data, offset)
+        offset += len(frame)
+
+        yield frame
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# state_sync.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+
+from src.app.net import protocol
+from src.app.net.tcp_connection import TCPConnection
+
+class StateSync(object):
+    """Resynchronizes turnout state tables with peers on every connection
+
+    On entering the connected state a sync request is sent holding the last
+    version acknowledged from each peer table. A peer answers with only the
+    entries changed since that version, or with a full snapshot if it does not
+    find its own epoch, and the requester then acknowledges the new version.
+
+    A peer that has not yet acknowledged the requester's current version asks
+    back, so both sides end up with each other's changes. Received entries are
+    recorded into the local table, the last one applied wins.
+
+    Large deltas are sent as several messages that each fit in the largest
+    message a peer accepts, the version record follows in the last one.
+    """
+
+    MAX_MESSAGE = TCPConnection.MAX_MESSAGE
+
+    def __init__(self, network_manager, table, route_cb=None):
+        """Create a sync agent for a table over a network manager
+
+        The route callback is called with (turnout id, diverging) for every
+        turnout a peer changed, diverging is None if the route is not known.
+        """
+        self.__logger = logging.getLogger('state_sync')
+
+        self.__network_manager = network_manager
+        self.__table = table
+        self.__route_cb = route_cb
+
+        # Peer epoch to last version acknowledged from that peer
+        self.__acked = {}
+
+        network_manager.register_handler(protocol.SYNC_REQUEST, self.__request_rx)
+        network_manager.register_handler(protocol.SYNC_DELTA, self.__delta_rx)
+        network_manager.register_handler(protocol.SYNC_VERSION, self.__version_rx)
+        network_manager.on_enter_connected(self.request)
+
+    def get_acked_version(self, epoch):
+        """Return the last version acknowledged from a peer table, None if
+        never synced
+        """
+        return self.__acked.get(epoch)
+
+    def request(self):
+        """Ask peers for the changes since the last acknowledged versions"""
+        records = [(self.__table.get_epoch(), self.__table.get_version())]
+        records.extend(self.__acked.items())
+
+        data = protocol.encode(protocol.SYNC_REQUEST, 0, records)
+        self.__network_manager.send(data, len(data))
+
+    def __request_rx(self, frame):
+        """Answer a sync request with the changes the requester is missing"""
+        records = list(frame)
+
+        if not len(records):
+            return
+
+        epoch = self.__table.get_epoch()
+        requester, requester_version = records[0]
+
+        if requester == epoch:
+            return
+
+        version = self.__table.get_version()
+        base = 0
+
+        for peer_epoch, acked in records[1:]:
+            if peer_epoch == epoch and acked <= version:
+                base = acked
+
+        changes = self.__table.get_changes(base, exclude=requester)
+
+        self.__logger.debug(
+            'Sending %d changes from version %d to %d',
+            len(changes), base, version)
+
+        # Leave room in the last message for the version
+        chunk = (
+            self.MAX_MESSAGE -
+            2 * protocol.HEADER.size -
+            protocol.RECORDS[protocol.SYNC_VERSION].size) // \
+            protocol.RECORDS[protocol.SYNC_DELTA].size
+
+        # Routes that are not known, e.g. while moving, go out as UNKNOWN
+        changes = [
+            (turnout_id,
+                protocol.UNKNOWN if diverging is None else diverging,
+                entry_version, origin)
+            for turnout_id, diverging, entry_version, origin in changes]
+
+        messages = [
+            protocol.encode(protocol.SYNC_DELTA, 0, changes[start:start + chunk])
+            for start in range(0, len(changes), chunk)]
+
+        last = messages.pop() if len(messages) else b''
+        messages.append(last + protocol.encode(
+            protocol.SYNC_VERSION, 0, [(epoch, base, version)]))
+
+        for data in messages:
+            self.__network_manager.send(data, len(data))
+
+        if self.__acked.get(requester, -1) < requester_version:
+            self.request()
+
+    def __delta_rx(self, frame):
+        """Record the entries a peer changed"""
+        for turnout_id, diverging, version, origin in frame:
+            diverging = None if diverging == protocol.UNKNOWN else bool(diverging)
+
+            if self.__table.set_route(turnout_id, diverging, origin) and \
+                self.__route_cb is not None:
+                self.__route_cb(turnout_id, diverging)
+
+    def __version_rx(self, frame):
+        """Acknowledge the version a delta brought this node up to
+
+        A delta from a base newer than the acknowledged version, e.g. one
+        answering another node's request, leaves gaps and is not acknowledged.
+        """
+        for epoch, base, version in frame:
+            acked = self.__acked.get(epoch)
+
+            if base == 0 or (acked is not None and base <= acked):
+                self.__acked[epoch] = max(version, acked or 0)
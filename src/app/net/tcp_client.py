@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# tcp_client.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import asyncio
+import logging
+import threading
+
+from src.app.net.tcp_connection import TCPConnection
+
+class TCPClient(object):
+    """Client role for the network manager that connects to a TCP server
+
+    All socket work happens on the given event loop, the role methods may be
+    called from any thread.
+    """
+
+    PORT = 1507
+    RETRY_INTERVAL_S = 1
+
+    MAX_PENDING = TCPConnection.MAX_MESSAGE
+
+    def __init__(self, host, port=PORT, loop=None):
+        """Create a client for the server at host and port"""
+        self.__logger = logging.getLogger('tcp_client')
+
+        self.__host = host
+        self.__port = port
+        self.__loop = loop if loop is not None else asyncio.get_event_loop()
+
+        self.__is_running = False
+        self.__writable_cb = None
+
+        # Bytes handed to the role that the event loop has not yet written
+        self.__pending = 0
+        self.__pending_lock = threading.Lock()
+        self.__task = None
+        self.__connection = None
+
+    def set_server(self, host, port=PORT):
+        """Set the server to connect to, used from the next start"""
+        self.__host = host
+        self.__port = port
+
+    def start(self, connected_cb, disconnected_cb, data_rx_cb):
+        """Start trying to connect to the server"""
+        self.__logger.debug('Starting client')
+
+        self.__connected_cb = connected_cb
+        self.__disconnected_cb = disconnected_cb
+        self.__data_rx_cb = data_rx_cb
+
+        self.__is_running = True
+
+        self.__loop.call_soon_threadsafe(self.__begin)
+
+    def stop(self):
+        """Stop the client, closing any connection"""
+        self.__logger.debug('Stopping client')
+
+        self.__is_running = False
+
+        self.__loop.call_soon_threadsafe(self.__end)
+
+    def is_running(self):
+        return self.__is_running
+
+    def is_writable(self):
+        """Return whether the connection to the server can take data
+
+        Data sent from another thread counts against the send buffer until the
+        event loop has written it.
+        """
+        connection = self.__connection
+        return connection is not None and connection.is_writable() and \
+            self.__pending < self.MAX_PENDING
+
+    def set_writable_cb(self, writable_cb):
+        """Set a callback for when the role can take data again"""
+        self.__writable_cb = writable_cb
+
+    def send(self, data, length):
+        """Send data to the server"""
+        message = bytes(memoryview(data)[:length])
+
+        with self.__pending_lock:
+            self.__pending += len(message)
+
+        self.__loop.call_soon_threadsafe(self.__send, message)
+
+    def __begin(self):
+        """Start connecting, on the event loop"""
+        if self.__is_running and self.__task is None:
+            self.__task = asyncio.ensure_future(self.__connect(), loop=self.__loop)
+
+    def __end(self):
+        """Stop connecting and close the connection, on the event loop"""
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
+
+        # Forget the connection first so closing it is not reported
+        connection, self.__connection = self.__connection, None
+
+        if connection is not None:
+            connection.close()
+
+    async def __connect(self):
+        """Try to connect to the server until connected or stopped"""
+        try:
+            while self.__is_running:
+                try:
+                    await self.__loop.create_connection(
+                        lambda: TCPConnection(
+                            self.__opened, self.__received, self.__closed,
+                            self.__writable),
+                        self.__host,
+                        self.__port)
+                    return
+                except OSError:
+                    self.__logger.debug('Server not reachable, retrying')
+                    await asyncio.sleep(self.RETRY_INTERVAL_S)
+        finally:
+            self.__task = None
+
+    def __send(self, message):
+        """Send a message on the connection, on the event loop"""
+        with self.__pending_lock:
+            was_full = self.__pending >= self.MAX_PENDING
+            self.__pending -= len(message)
+
+        if self.__connection is not None:
+            self.__connection.send(message)
+
+            if was_full:
+                self.__writable(self.__connection)
+
+    def __opened(self, connection):
+        """Called once connected to the server"""
+        if not self.__is_running:
+            connection.close()
+            return
+
+        self.__logger.info('Connected to %s:%d', self.__host, self.__port)
+
+        self.__connection = connection
+        self.__connected_cb()
+
+    def __received(self, connection, data, length):
+        """Called with each message from the server"""
+        self.__data_rx_cb(data, length)
+
+    def __writable(self, connection):
+        """Called when a connection can take data again"""
+        if self.__writable_cb is not None and self.is_writable():
+            self.__writable_cb()
+
+    def __closed(self, connection):
+        """Called once the connection to the server is lost"""
+        if connection is not self.__connection:
+            return
+
+        self.__logger.info('Disconnected from %s:%d', self.__host, self.__port)
+
+        self.__connection = None
+
+        if self.__is_running:
+            self.__disconnected_cb()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# tcp_connection.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import asyncio
+import logging
+import struct
+
+class TCPConnection(asyncio.Protocol):
+    """Message framing over a TCP stream
+
+    Each message is sent with a 4 byte length prefix so the receiver gets the
+    same messages the sender sent, however the stream splits them.
+    """
+
+    LENGTH = struct.Struct('!I')
+
+    MAX_MESSAGE = 0x10000
+
+    def __init__(self, opened_cb, data_rx_cb, closed_cb, writable_cb=None):
+        """Create a connection that reports to the given callbacks
+
+        opened_cb, closed_cb and writable_cb are called with the connection,
+        data_rx_cb is called with the connection, a received message and its
+        length. writable_cb is called when the connection can take data again
+        after its send buffer filled up.
+        """
+        self.__logger = logging.getLogger('tcp_connection')
+
+        self.__opened_cb = opened_cb
+        self.__data_rx_cb = data_rx_cb
+        self.__closed_cb = closed_cb
+        self.__writable_cb = writable_cb
+
+        self.__transport = None
+        self.__buffer = bytearray()
+        self.__writable = True
+
+    def connection_made(self, transport):
+        """Called by the event loop once the connection is up"""
+        self.__transport = transport
+        self.__opened_cb(self)
+
+    def connection_lost(self, exc):
+        """Called by the event loop once the connection is down"""
+        self.__transport = None
+        self.__closed_cb(self)
+
+    def pause_writing(self):
+        """Called by the event loop when the send buffer is full"""
+        self.__writable = False
+
+    def resume_writing(self):
+        """Called by the event loop when the send buffer has drained"""
+        self.__writable = True
+
+        if self.__writable_cb is not None:
+            self.__writable_cb(self)
+
+    def is_writable(self):
+        """Return whether the send buffer has room"""
+        return self.__transport is not None and self.__writable
+
+    def data_received(self, data):
+        """Called by the event loop with data from the stream"""
+        self.__buffer.extend(data)
+
+        view = memoryview(self.__buffer)
+        offset = 0
+
+        try:
+            while len(view) - offset >= self.LENGTH.size:
+                (length,) = self.LENGTH.unpack_from(view, offset)
+
+                if length > self.MAX_MESSAGE:
+                    self.__logger.error('Message too long, closing connection')
+                    self.close()
+                    return
+
+                start = offset + self.LENGTH.size
+
+                if len(view) - start < length:
+                    break
+
+                self.__data_rx_cb(self, bytes(view[start:start + length]), length)
+                offset = start + length
+        finally:
+            view.release()
+
+        del self.__buffer[:offset]
+
+    def send(self, data):
+        """Send a message, must be called from the event loop"""
+        if self.__transport is None:
+            return
+
+        self.__transport.writelines([self.LENGTH.pack(len(data)), data])
+
+    def close(self):
+        """Close the connection"""
+        if self.__transport is not None:
+            self.__transport.close()
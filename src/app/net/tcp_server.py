@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# tcp_server.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import asyncio
+import logging
+import threading
+
+from src.app.net.outbound_queue import OutboundQueue
+from src.app.net.tcp_connection import TCPConnection
+
+class TCPServer(object):
+    """Server role for the network manager that accepts many TCP clients
+
+    The role is connected while at least one client is connected. Data sent by
+    the role goes to every client.
+
+    Each client has its own bounded queue, so a slow client only holds back
+    itself. Data for a client that cannot take it is queued, dropping the
+    oldest message once full, and the role stays writable while any client
+    can take data. If the port cannot be listened on the role
+    stops and reports itself disconnected. All socket work happens on the
+    given event loop, the role methods may be called from any thread.
+    """
+
+    PORT = 1507
+
+    MAX_PENDING = TCPConnection.MAX_MESSAGE
+
+    QUEUE_DEPTH = 256
+
+    def __init__(self, host='', port=PORT, loop=None, queue_depth=QUEUE_DEPTH):
+        """Create a server listening on host and port
+
+        Each client queues at most queue_depth messages while it is slow.
+        """
+        self.__logger = logging.getLogger('tcp_server')
+
+        self.__host = host
+        self.__port = port
+        self.__queue_depth = queue_depth
+        self.__loop = loop if loop is not None else asyncio.get_event_loop()
+
+        self.__is_running = False
+        self.__writable_cb = None
+
+        # Bytes handed to the role that the event loop has not yet written
+        self.__pending = 0
+        self.__pending_lock = threading.Lock()
+        self.__task = None
+        self.__server = None
+
+        # Queue of messages waiting for each client connection
+        self.__connections = {}
+
+    def start(self, connected_cb, disconnected_cb, data_rx_cb):
+        """Start listening for clients"""
+        self.__logger.debug('Starting server')
+
+        self.__connected_cb = connected_cb
+        self.__disconnected_cb = disconnected_cb
+        self.__data_rx_cb = data_rx_cb
+
+        self.__is_running = True
+
+        self.__loop.call_soon_threadsafe(self.__begin)
+
+    def stop(self):
+        """Stop listening and close every client connection"""
+        self.__logger.debug('Stopping server')
+
+        self.__is_running = False
+
+        self.__loop.call_soon_threadsafe(self.__end)
+
+    def is_running(self):
+        return self.__is_running
+
+    def get_port(self):
+        """Return the port being listened on, None if not listening"""
+        if self.__server is None:
+            return None
+
+        return self.__server.sockets[0].getsockname()[1]
+
+    def get_connection_count(self):
+        """Return the number of connected clients"""
+        return len(self.__connections)
+
+    def is_writable(self):
+        """Return whether any client connection can take data
+
+        Data sent from another thread counts against the send buffers until the
+        event loop has written it.
+        """
+        return self.__pending < self.MAX_PENDING and any(
+            connection.is_writable() for connection in list(self.__connections))
+
+    def set_writable_cb(self, writable_cb):
+        """Set a callback for when the role can take data again"""
+        self.__writable_cb = writable_cb
+
+    def send(self, data, length):
+        """Send data to every client"""
+        message = bytes(memoryview(data)[:length])
+
+        with self.__pending_lock:
+            self.__pending += len(message)
+
+        self.__loop.call_soon_threadsafe(self.__send, message)
+
+    def __begin(self):
+        """Start listening, on the event loop"""
+        if self.__is_running and self.__task is None and self.__server is None:
+            self.__task = asyncio.ensure_future(self.__listen(), loop=self.__loop)
+
+    def __end(self):
+        """Stop listening and close connections, on the event loop"""
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
+
+        if self.__server is not None:
+            self.__server.close()
+            self.__server = None
+
+        # Forget the connections first so closing them is not reported
+        connections, self.__connections = self.__connections, {}
+
+        for connection in connections:
+            connection.close()
+
+    async def __listen(self):
+        """Open the listening socket"""
+        try:
+            self.__server = await self.__loop.create_server(
+                lambda: TCPConnection(
+                    self.__opened, self.__received, self.__closed,
+                    self.__writable),
+                self.__host,
+                self.__port,
+                reuse_address=True)
+
+            self.__logger.info('Listening on port %d', self.get_port())
+        except OSError:
+            self.__logger.exception('Unable to listen on port %d', self.__port)
+
+            # Report the role as lost so the network manager searches again
+            if self.__is_running:
+                self.__is_running = False
+                self.__disconnected_cb()
+        finally:
+            self.__task = None
+
+    def __send(self, message):
+        """Send a message to every client, on the event loop"""
+        with self.__pending_lock:
+            was_full = self.__pending >= self.MAX_PENDING
+            self.__pending -= len(message)
+
+        for connection, queue in self.__connections.items():
+            if len(queue) or not connection.is_writable():
+                queue.put(message)
+            else:
+                connection.send(message)
+
+        if was_full:
+            self.__writable(None)
+
+    def __opened(self, connection):
+        """Called when a client connects"""
+        if not self.__is_running:
+            connection.close()
+            return
+
+        self.__connections[connection] = OutboundQueue(self.__queue_depth)
+
+        self.__logger.info('Client connected, %d clients', len(self.__connections))
+
+        if len(self.__connections) == 1:
+            self.__connected_cb()
+
+    def __received(self, connection, data, length):
+        """Called with each message from a client"""
+        self.__data_rx_cb(data, length)
+
+    def __writable(self, connection):
+        """Called when a connection can take data again"""
+        queue = self.__connections.get(connection)
+
+        while queue is not None and len(queue) and connection.is_writable():
+            connection.send(queue.pop())
+
+        if self.__writable_cb is not None and self.is_writable():
+            self.__writable_cb()
+
+    def __closed(self, connection):
+        """Called when a client disconnects"""
+        if connection not in self.__connections:
+            return
+
+        del self.__connections[connection]
+
+        self.__logger.info('Client disconnected, %d clients', len(self.__connections))
+
+        if self.__is_running and not len(self.__connections):
+            self.__disconnected_cb()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# turnout_dispatcher.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+
+class TurnoutDispatcher(object):
+    """Passes each record of a frame to the handler of its turnout
+
+    Handlers are indexed by turnout id so a record costs one lookup however
+    many turnouts the node hosts. Register the dispatcher with the network
+    manager for the message types it should handle.
+    """
+
+    def __init__(self):
+        """Create a dispatcher with no turnouts"""
+        self.__logger = logging.getLogger('turnout_dispatcher')
+
+        self.__handlers = {}
+
+    def register(self, turnout_id, handler):
+        """Register the handler for a turnout, called with (diverging, frame)
+        """
+        if turnout_id in self.__handlers:
+            raise AttributeError('Turnout %d already has a handler' % turnout_id)
+
+        self.__handlers[turnout_id] = handler
+
+    def unregister(self, turnout_id):
+        """Remove the handler for a turnout"""
+        self.__handlers.pop(turnout_id, None)
+
+    def __call__(self, frame):
+        """Dispatch the records of a frame"""
+        for turnout_id, diverging in frame:
+            handler = self.__handlers.get(turnout_id)
+
+            if handler is None:
+                continue
+
+            handler(bool(diverging), frame)
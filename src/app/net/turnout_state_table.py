@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# turnout_state_table.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import collections
+import logging
+import random
+import threading
+
+class TurnoutStateTable(object):
+    """Versioned view of the route of every turnout
+
+    Each change bumps the table version and stamps the changed entry with it.
+    Entries are kept in version order so the changes since a version cost as
+    much as the number of changes, not the number of turnouts.
+
+    The epoch identifies this instance of the table, a peer holding a version
+    of another epoch must start over from a full snapshot. Each entry also
+    keeps the epoch of the table the change was made in, so a change is not
+    sent back to where it came from. Provides the same route interface as
+    TurnoutStateStore so turnouts can record into it.
+    """
+
+    EPOCH_MODULO = 0x100000000
+
+    def __init__(self, epoch=None):
+        """Create an empty table, with a random epoch unless one is given"""
+        self.__logger = logging.getLogger('turnout_state_table')
+        self.__lock = threading.Lock()
+
+        if epoch is None:
+            epoch = random.randrange(1, TurnoutStateTable.EPOCH_MODULO)
+
+        self.__epoch = epoch
+        self.__version = 0
+
+        # Turnout id to (diverging, version, origin), oldest version first
+        self.__entries = collections.OrderedDict()
+
+    def get_epoch(self):
+        """Return the epoch of the table"""
+        return self.__epoch
+
+    def get_version(self):
+        """Return the version of the latest change"""
+        with self.__lock:
+            return self.__version
+
+    def get_route(self, turnout_id):
+        """Return the route of a turnout, None if not known"""
+        with self.__lock:
+            entry = self.__entries.get(turnout_id)
+
+        return None if entry is None else entry[0]
+
+    def get_routes(self):
+        """Return the route of every turnout"""
+        with self.__lock:
+            return dict(
+                (turnout_id, entry[0])
+                for turnout_id, entry in self.__entries.items())
+
+    def set_route(self, turnout_id, diverging, origin=None):
+        """Record the route of a turnout, return whether it changed
+
+        A route of None records that the route is not known. The origin is the epoch of the table the change was made in, this
+        table if not given.
+        """
+        if origin is None:
+            origin = self.__epoch
+
+        with self.__lock:
+            entry = self.__entries.get(turnout_id)
+
+            if entry is not None and entry[0] == diverging:
+                return False
+
+            self.__version += 1
+            self.__entries[turnout_id] = (diverging, self.__version, origin)
+            self.__entries.move_to_end(turnout_id)
+
+            return True
+
+    def get_changes(self, version=0, exclude=None):
+        """Return (turnout id, diverging, version, origin) of each entry
+        changed since a version, oldest first. Version 0 returns a full
+        snapshot. Changes that came from the excluded epoch are skipped.
+        """
+        changes = []
+
+        with self.__lock:
+            for turnout_id in reversed(self.__entries):
+                diverging, entry_version, origin = self.__entries[turnout_id]
+
+                if entry_version <= version:
+                    break
+
+                if origin != exclude:
+                    changes.append(
+                        (turnout_id, diverging, entry_version, origin))
+
+        changes.reverse()
+
+        return changes
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# clock.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+import threading
+import time
+
+class Clock(object):
+    """Source of time, delays and timers backed by the system clock
+
+    Objects that wait or time out take a clock so a simulation can swap in
+    virtual time.
+    """
+
+    def __init__(self):
+        """Create a system clock"""
+        self.__logger = logging.getLogger('clock')
+
+    def time(self):
+        """Return a monotonic time in s"""
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        """Block for a period in s"""
+        time.sleep(seconds)
+
+    def call_later(self, delay, callback, *args):
+        """Call a callback with args after a delay in s
+
+        The callback runs on a timer thread. Returns a handle whose cancel
+        method stops the callback if it has not yet run.
+        """
+        timer = threading.Timer(delay, callback, args)
+        timer.daemon = True
+        timer.start()
+
+        return timer
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# clock_virtual.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import heapq
+import itertools
+import logging
+import threading
+
+from src.clock.clock import Clock
+
+class ClockVirtual(Clock):
+    """Discrete event clock whose time only moves when told to
+
+    Sleeping or advancing the clock runs every timer that falls due in the
+    period, in order and on the calling thread, and returns straight away. An
+    operating session of hours can then be simulated in seconds.
+    """
+
+    def __init__(self, start=0.0):
+        """Create a virtual clock at a start time in s"""
+        self.__logger = logging.getLogger('clock_virtual')
+        self.__lock = threading.RLock()
+
+        self.__now = start
+        self.__timers = []
+        self.__order = itertools.count()
+
+    def time(self):
+        """Return the virtual time in s"""
+        return self.__now
+
+    def sleep(self, seconds):
+        """Advance the virtual time, running the timers due meanwhile"""
+        self.advance(seconds)
+
+    def call_later(self, delay, callback, *args):
+        """Call a callback with args once the clock has advanced by a delay
+
+        Returns a handle whose cancel method stops the callback if it has not
+        yet run.
+        """
+        assert(delay >= 0)
+
+        timer = VirtualTimer(self.__now + delay, callback, args)
+
+        with self.__lock:
+            heapq.heappush(self.__timers, (timer.when, next(self.__order), timer))
+
+        return timer
+
+    def advance(self, seconds):
+        """Move the virtual time forward by a period in s
+
+        Returns the number of timers that were run.
+        """
+        assert(seconds >= 0)
+
+        return self.run(self.__now + seconds)
+
+    def run(self, until=None):
+        """Run timers in time order until a time, or until none are left
+
+        The clock ends at the given time, or at the time of the last timer.
+        Returns the number of timers that were run.
+        """
+        count = 0
+
+        while True:
+            with self.__lock:
+                if not len(self.__timers):
+                    break
+
+                when, order, timer = self.__timers[0]
+
+                if until is not None and when > until:
+                    break
+
+                heapq.heappop(self.__timers)
+
+            if timer.is_cancelled():
+                continue
+
+            self.__now = max(self.__now, when)
+            timer.run()
+            count += 1
+
+        if until is not None:
+            self.__now = max(self.__now, until)
+
+        return count
+
+    def get_pending_count(self):
+        """Return the number of timers waiting to run"""
+        with self.__lock:
+            return len([t for w, o, t in self.__timers if not t.is_cancelled()])
+
+class VirtualTimer(object):
+    """Callback scheduled on a virtual clock"""
+
+    def __init__(self, when, callback, args):
+        """Create a timer due at a virtual time"""
+        self.when = when
+
+        self.__callback = callback
+        self.__args = args
+        self.__cancelled = False
+
+    def cancel(self):
+        """Stop the callback from running"""
+        self.__cancelled = True
+
+    def is_cancelled(self):
+        """Return True if cancelled"""
+        return self.__cancelled
+
+    def run(self):
+        """Call the callback"""
+        self.__callback(*self.__args)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# i2c_bus_worker.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import concurrent.futures
+import logging
+import queue
+import threading
+
+class I2CBusWorker(object):
+    """Runs the transactions of one I2C bus in order on its own thread
+
+    Each bus gets a worker so transactions to separate buses run in parallel
+    while those on the same bus keep the order they were submitted in.
+
+    Posted transactions do not make the caller wait, the first one to fail is
+    raised by the next sync.
+    """
+
+    def __init__(self, bus_number):
+        """Create and start the worker for a bus"""
+        self.__logger = logging.getLogger('hw.pwm.i2c-bus-worker')
+
+        self.__bus_number = bus_number
+        self.__queue = queue.Queue()
+        self.__failure = None
+
+        self.__thread = threading.Thread(
+            target=self.__run, name='i2c-bus-%s' % bus_number)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def get_bus_number(self):
+        """Return the number of the bus"""
+        return self.__bus_number
+
+    def get_pending_count(self):
+        """Return the number of transactions waiting to run"""
+        return self.__queue.qsize()
+
+    def submit(self, transaction, *args):
+        """Queue a transaction, returns a future for its result"""
+        future = concurrent.futures.Future()
+
+        if not self.is_running():
+            future.set_exception(RuntimeError('Bus worker stopped'))
+            return future
+
+        self.__queue.put((future, transaction, args))
+
+        return future
+
+    def call(self, transaction, *args):
+        """Run a transaction after those already queued and return its result
+
+        Called from the worker thread the transaction is run straight away.
+        """
+        if threading.current_thread() is self.__thread:
+            return transaction(*args)
+
+        return self.submit(transaction, *args).result()
+
+    def post(self, transaction, *args):
+        """Queue a transaction without waiting for it"""
+        self.submit(transaction, *args).add_done_callback(self.__check)
+
+    def sync(self):
+        """Wait for every queued transaction to run
+
+        Raises the first failure of a posted transaction since the last sync.
+        """
+        self.call(lambda: None)
+
+        failure, self.__failure = self.__failure, None
+
+        if failure is not None:
+            raise failure
+
+    def stop(self):
+        """Run the queued transactions then stop the worker"""
+        if not self.is_running():
+            return
+
+        self.__queue.put(None)
+        self.__thread.join()
+
+    def is_running(self):
+        """Return True if the worker is running"""
+        return self.__thread.is_alive()
+
+    def __check(self, future):
+        """Keep the first failure of a posted transaction"""
+        failure = future.exception()
+
+        if failure is not None:
+            self.__logger.error(
+                'Transaction on bus %s failed: %s', self.__bus_number, failure)
+
+            if self.__failure is None:
+                self.__failure = failure
+
+    def __run(self):
+        """Run queued transactions until stopped"""
+        while True:
+            item = self.__queue.get()
+
+            if item is None:
+                break
+
+            future, transaction, args = item
+
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                future.set_result(transaction(*args))
+            except Exception as ex:
+                future.set_exception(ex)
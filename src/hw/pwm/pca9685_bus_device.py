@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# pca9685_bus_device.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+
+class PCA9685BusDevice(object):
+    """PCA9685 whose transactions run on the worker of its bus
+
+    Writes are posted to the worker so the caller carries on while the bus is
+    busy, reads wait for the writes queued before them. Presents the same
+    interface as the device, flush waits for the posted writes.
+    """
+
+    def __init__(self, device, worker):
+        """Create a device running its transactions on a bus worker"""
+        self.__logger = logging.getLogger('hw.pwm.pca9685-bus-device')
+
+        self.__dev = device
+        self.__worker = worker
+
+    def get_worker(self):
+        """Return the worker of the bus"""
+        return self.__worker
+
+    def get_pwm_frequency(self):
+        """Read the PWM frequency"""
+        return self.__worker.call(self.__dev.get_pwm_frequency)
+
+    def set_pwm_frequency(self, freq):
+        """Write the PWM frequency"""
+        self.__worker.post(self.__dev.set_pwm_frequency, freq)
+
+    def get_pwm(self, pin):
+        """Read the duty of a pin"""
+        return self.__worker.call(self.__dev.get_pwm, pin)
+
+    def set_pwm(self, pin, duty):
+        """Write the duty of a pin"""
+        self.__worker.post(self.__dev.set_pwm, pin, duty)
+
+    def write_block(self, register, data):
+        """Write a run of channel registers
+
+        The data is copied as the caller may reuse its buffer before the
+        write runs.
+        """
+        self.__worker.post(self.__dev.write_block, register, bytes(data))
+
+    def flush(self):
+        """Wait for the writes posted to the bus"""
+        self.__worker.sync()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# # -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# pca9685_device.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+
+from pca9685_driver import Device
+from pca9685_driver.device import Mode1, Registers
+
+class PCA9685Device(Device):
+    """PCA9685 device that can write runs of registers in block transfers"""
+
+    # Largest block the SMBus block write allows
+    BLOCK_MAX = 32
+
+    def __init__(self, address, bus_number=None):
+        """Create a PCA9685 device with register auto increment enabled"""
+        super(PCA9685Device, self).__init__(address, bus_number)
+
+        self.__logger = logging.getLogger('hw.pwm.pca9685-device')
+        self.__address = address
+
+        self.write(Registers.MODE_1, self.mode_1 | (1 << Mode1.AI))
+
+    def write_block(self, register, data):
+        """Write consecutive registers starting at the given register"""
+        self.__logger.debug('Block write of %d bytes to %d', len(data), register)
+
+        for offset in range(0, len(data), self.BLOCK_MAX):
+            self.bus.write_i2c_block_data(
+                self.__address,
+                register + offset,
+                list(data[offset:offset + self.BLOCK_MAX]))
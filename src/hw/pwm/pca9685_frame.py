@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# # -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# pca9685_frame.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import struct
+
+class PCA9685Frame(object):
+    """Image of the LEDn_ON/OFF registers of all channels of a PCA9685
+
+    The registers of all channels are held in one contiguous buffer laid out
+    the same way as on the chip, so any run of channels can be sent with a
+    single auto increment block write starting at the first channel's
+    register.
+    """
+
+    CHANNELS = 16
+
+    LED0_ON_L = 0x06
+    REGISTERS_PER_CHANNEL = 4
+
+    __CHANNEL_FORMAT = struct.Struct('<HH')
+
+    def __init__(self):
+        """Create a frame with every channel off"""
+        self.__buffer = bytearray(self.CHANNELS * self.REGISTERS_PER_CHANNEL)
+
+    @classmethod
+    def register(cls, pin):
+        """Return the LEDn_ON_L register of a channel"""
+        return cls.LED0_ON_L + (pin * cls.REGISTERS_PER_CHANNEL)
+
+    @classmethod
+    def pin(cls, register):
+        """Return the channel whose LEDn_ON_L register is given"""
+        offset = register - cls.LED0_ON_L
+
+        assert(offset >= 0)
+        assert(offset % cls.REGISTERS_PER_CHANNEL == 0)
+
+        return offset // cls.REGISTERS_PER_CHANNEL
+
+    @classmethod
+    def decode(cls, data):
+        """Return the duty of each channel in a block of register data"""
+        view = memoryview(data)
+
+        return [
+            cls.__CHANNEL_FORMAT.unpack_from(view, offset)[1]
+            for offset in range(0, len(view), cls.REGISTERS_PER_CHANNEL)]
+
+    def set_channel(self, pin, duty):
+        """Set the duty of a channel, the output turns on at count 0"""
+        assert(pin >= 0)
+        assert(pin < self.CHANNELS)
+
+        self.__CHANNEL_FORMAT.pack_into(
+            self.__buffer, pin * self.REGISTERS_PER_CHANNEL, 0, duty)
+
+    def get_channel(self, pin):
+        """Return the duty of a channel"""
+        return self.__CHANNEL_FORMAT.unpack_from(
+            self.__buffer, pin * self.REGISTERS_PER_CHANNEL)[1]
+
+    def get_span(self, first_pin, last_pin):
+        """Return the start register and register data for a run of channels
+
+        The data is a view onto the frame so no copy is made.
+        """
+        assert(first_pin <= last_pin)
+
+        start = first_pin * self.REGISTERS_PER_CHANNEL
+        end = (last_pin + 1) * self.REGISTERS_PER_CHANNEL
+
+        return self.register(first_pin), memoryview(self.__buffer)[start:end]
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# pca9685_metrics.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import bisect
+import logging
+import threading
+
+from src.clock.clock import Clock
+from src.hw.pwm.pca9685_frame import PCA9685Frame
+
+class LatencyHistogram(object):
+    """Cumulative histogram of durations in s"""
+
+    def __init__(self, buckets):
+        """Create a histogram with the given ascending bucket upper bounds"""
+        assert(list(buckets) == sorted(buckets))
+
+        self.__buckets = list(buckets)
+        self.__counts = [0] * (len(self.__buckets) + 1)
+        self.__sum = 0.0
+
+    def observe(self, seconds):
+        """Record a duration"""
+        self.__counts[bisect.bisect_left(self.__buckets, seconds)] += 1
+        self.__sum += seconds
+
+    def get_snapshot(self):
+        """Return the count and sum of the durations and the cumulative
+        count of each bucket as (upper bound, count), the last bound is None
+        """
+        buckets = []
+        total = 0
+
+        for bound, count in zip(self.__buckets + [None], self.__counts):
+            total += count
+            buckets.append((bound, total))
+
+        return { 'count': total, 'sum': self.__sum, 'buckets': buckets }
+
+class PCA9685Metrics(object):
+    """Counts and times the bus transactions made to a PCA9685
+
+    Wraps a device, or anything presenting its interface, and counts reads,
+    writes and writes that would not change the chip per device and channel.
+    The duration of each transaction is recorded in a histogram per kind of
+    transaction, and their total shows how busy the bus is.
+
+    Place it between a PCA9685Proxy and the device to see the traffic that
+    actually reaches the bus.
+    """
+
+    # Upper bounds in s, a 100kHz bus takes about 0.5ms per channel write
+    LATENCY_BUCKETS_S = [
+        0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1]
+
+    READ = 'read'
+    WRITE = 'write'
+    BLOCK_WRITE = 'block_write'
+
+    def __init__(self, device, name, clock=None, buckets=LATENCY_BUCKETS_S):
+        """Create metrics for a device, labelled with a name such as the bus
+        and address of the device
+        """
+        self.__logger = logging.getLogger('hw.pwm.pca9685-metrics')
+        self.__lock = threading.Lock()
+
+        self.__dev = device
+        self.__name = name
+        self.__clock = clock if clock is not None else Clock()
+
+        self.__latency = dict(
+            (kind, LatencyHistogram(buckets))
+            for kind in [self.READ, self.WRITE, self.BLOCK_WRITE])
+
+        self.__reads = 0
+        self.__writes = 0
+        self.__redundant_writes = 0
+        self.__busy = 0.0
+
+        # Pin to reads, writes, redundant writes
+        self.__channels = dict(
+            (pin, [0, 0, 0]) for pin in range(PCA9685Frame.CHANNELS))
+
+        # Last value written, None until known
+        self.__freq = None
+        self.__duty = [None] * PCA9685Frame.CHANNELS
+
+    def get_name(self):
+        """Return the name the metrics are labelled with"""
+        return self.__name
+
+    def get_pwm_frequency(self):
+        """Read the PWM frequency from the device"""
+        return self.__time(self.READ, self.__dev.get_pwm_frequency)
+
+    def set_pwm_frequency(self, freq):
+        """Write the PWM frequency to the device"""
+        with self.__lock:
+            if freq == self.__freq:
+                self.__redundant_writes += 1
+
+            self.__freq = freq
+
+        self.__time(self.WRITE, self.__dev.set_pwm_frequency, freq)
+
+    def get_pwm(self, pin):
+        """Read the duty of a pin from the device"""
+        duty = self.__time(self.READ, self.__dev.get_pwm, pin)
+
+        with self.__lock:
+            self.__channels[pin][0] += 1
+
+        return duty
+
+    def set_pwm(self, pin, duty):
+        """Write the duty of a pin to the device"""
+        with self.__lock:
+            self.__count_channel_write(pin, duty)
+
+        self.__time(self.WRITE, self.__dev.set_pwm, pin, duty)
+
+    def write_block(self, register, data):
+        """Write a run of channel registers to the device in one transaction
+        """
+        first_pin = PCA9685Frame.pin(register)
+
+        with self.__lock:
+            for offset, duty in enumerate(PCA9685Frame.decode(data)):
+                self.__count_channel_write(first_pin + offset, duty)
+
+        self.__time(self.BLOCK_WRITE, self.__dev.write_block, register, data)
+
+    def get_snapshot(self):
+        """Return the counts and latencies recorded so far as a dict"""
+        with self.__lock:
+            return {
+                'device': self.__name,
+                'reads': self.__reads,
+                'writes': self.__writes,
+                'redundant_writes': self.__redundant_writes,
+                'busy_s': self.__busy,
+                'channels': dict(
+                    (pin, {
+                        'reads': counts[0],
+                        'writes': counts[1],
+                        'redundant_writes': counts[2] })
+                    for pin, counts in self.__channels.items()),
+                'latency': dict(
+                    (kind, histogram.get_snapshot())
+                    for kind, histogram in self.__latency.items()) }
+
+    def __count_channel_write(self, pin, duty):
+        """Count a write to a channel, lock must be held"""
+        counts = self.__channels[pin]
+        counts[1] += 1
+
+        if self.__duty[pin] == duty:
+            counts[2] += 1
+            self.__redundant_writes += 1
+
+        self.__duty[pin] = duty
+
+    def __time(self, kind, transaction, *args):
+        """Run a bus transaction and record how long it took"""
+        start = self.__clock.time()
+
+        try:
+            return transaction(*args)
+        finally:
+            elapsed = self.__clock.time() - start
+
+            with self.__lock:
+                if kind == self.READ:
+                    self.__reads += 1
+                else:
+                    self.__writes += 1
+
+                self.__busy += elapsed
+                self.__latency[kind].observe(elapsed)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# # -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# pca9685_proxy.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+import threading
+import weakref
+
+from src.hw.pwm.pca9685_frame import PCA9685Frame
+
+class PCA9685Proxy(object):
+    """Shadow register proxy for a PCA9685
+
+    Keeps a copy of every channel and of the prescaler so that reads are
+    answered without touching the bus and writes that would not change the
+    chip are dropped. Presents the same interface as the device so it can be
+    handed to PWM providers in its place.
+
+    In write through mode every changed channel is written straight away, in
+    deferred mode changed channels are marked dirty and written by flush.
+
+    With block writes the dirty channels are written by flush as a single run
+    of registers, which needs a device with write_block and auto increment
+    enabled, such as PCA9685Device.
+    """
+
+    CHANNELS = 16
+
+    OSC_CLOCK_HZ = 25000000
+    PWM_STEPS = 4096
+
+    # Range of the prescaler register, about 1526Hz down to 24Hz
+    PRESCALE_MIN = 3
+    PRESCALE_MAX = 255
+
+    __shared = weakref.WeakKeyDictionary()
+    __shared_lock = threading.Lock()
+
+    def __init__(self, device, write_through=True, block_writes=False):
+        """Create a proxy for a PCA9685 device"""
+        self.__logger = logging.getLogger('hw.pwm.pca9685-proxy')
+        self.__lock = threading.RLock()
+
+        self.__dev = device
+        self.__write_through = write_through
+        self.__block_writes = block_writes
+        self.__frame = PCA9685Frame()
+
+        # None means the chip value is not yet known
+        self.__freq = None
+        self.__prescale = None
+        self.__channels = [None] * self.CHANNELS
+        self.__dirty = {}
+
+        self.__dropped_writes = 0
+
+    @classmethod
+    def shared(cls, device):
+        """Return the proxy shared by everything using the given device"""
+        with cls.__shared_lock:
+            proxy = cls.__shared.get(device)
+
+            if proxy is None:
+                proxy = cls(device)
+                cls.__shared[device] = proxy
+
+            return proxy
+
+    @classmethod
+    def prescale(cls, freq):
+        """Return the prescaler value the chip uses for a given frequency"""
+        assert(freq > 0)
+
+        return int(round(cls.OSC_CLOCK_HZ / float(cls.PWM_STEPS * freq)) - 1)
+
+    def get_pwm_frequency(self):
+        """Return the PWM frequency, only the first call reads the chip"""
+        with self.__lock:
+            if self.__freq is None:
+                self.__freq = self.__dev.get_pwm_frequency()
+                self.__prescale = self.prescale(self.__freq) \
+                    if self.__freq else None
+
+            return self.__freq
+
+    def set_pwm_frequency(self, freq):
+        """Set the PWM frequency, dropped if the prescaler would not change"""
+        with self.__lock:
+            self.get_pwm_frequency()
+
+            prescale = self.prescale(freq)
+
+            # Check that the chip can run at the requested freq
+            assert(prescale >= self.PRESCALE_MIN)
+            assert(prescale <= self.PRESCALE_MAX)
+
+            if prescale == self.__prescale:
+                self.__dropped_writes += 1
+                return
+
+            self.__dev.set_pwm_frequency(freq)
+
+            self.__freq = freq
+            self.__prescale = prescale
+
+    def get_pwm(self, pin):
+        """Return the duty of a pin including changes not yet flushed"""
+        with self.__lock:
+            if pin in self.__dirty:
+                return self.__dirty[pin]
+
+            if self.__channels[pin] is None:
+                self.__channels[pin] = self.__dev.get_pwm(pin)
+
+            return self.__channels[pin]
+
+    def set_pwm(self, pin, duty):
+        """Set the duty of a pin, dropped if the chip already has that duty"""
+        assert(pin >= 0)
+        assert(pin < self.CHANNELS)
+
+        with self.__lock:
+            if self.__channels[pin] == duty:
+                self.__dropped_writes += 1
+                self.__dirty.pop(pin, None)
+                return
+
+            if not self.__write_through:
+                self.__dirty[pin] = duty
+                return
+
+            self.__write(pin, duty)
+
+    def get_dirty_channels(self):
+        """Return the pins with changes that have not been flushed"""
+        with self.__lock:
+            return sorted(self.__dirty)
+
+    def get_dropped_write_count(self):
+        """Return the number of writes dropped because nothing changed"""
+        return self.__dropped_writes
+
+    def flush(self):
+        """Write every dirty channel to the chip"""
+        with self.__lock:
+            dirty, self.__dirty = self.__dirty, {}
+
+            if not len(dirty):
+                return
+
+            self.__logger.debug('Flushing %d channels', len(dirty))
+
+            if self.__block_writes:
+                self.__write_span(dirty)
+                return
+
+            for pin in sorted(dirty):
+                self.__write(pin, dirty[pin])
+
+    def invalidate(self):
+        """Forget the shadow so the next access reads the chip
+
+        Pending changes are kept and still written by the next flush.
+        """
+        with self.__lock:
+            self.__freq = None
+            self.__prescale = None
+            self.__channels = [None] * self.CHANNELS
+
+    def __write_span(self, dirty):
+        """Write the run of channels covering every dirty channel in one go
+
+        Clean channels inside the run are rewritten with their current value,
+        so any that are not yet known are read first.
+        """
+        first_pin = min(dirty)
+        last_pin = max(dirty)
+
+        for pin in range(first_pin, last_pin + 1):
+            if pin in dirty:
+                self.__channels[pin] = dirty[pin]
+            elif self.__channels[pin] is None:
+                self.__channels[pin] = self.__dev.get_pwm(pin)
+
+            self.__frame.set_channel(pin, self.__channels[pin])
+
+        register, data = self.__frame.get_span(first_pin, last_pin)
+
+        self.__dev.write_block(register, data)
+
+    def __write(self, pin, duty):
+        """Write a channel to the chip and the shadow"""
+        self.__dev.set_pwm(pin, duty)
+        self.__channels[pin] = duty
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# pca9685_registry.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+import threading
+
+from src.hw.pwm.i2c_bus_worker import I2CBusWorker
+from src.hw.pwm.pca9685_bus_device import PCA9685BusDevice
+from src.hw.pwm.pca9685_proxy import PCA9685Proxy
+from src.hw.pwm.pwm_provider_pca9685 import PWMProviderPCA9685
+
+class PCA9685Registry(object):
+    """Maps every (bus, address, pin) to its board and its bus worker
+
+    Each bus gets one worker thread, boards on separate buses are driven in
+    parallel and the order of transactions on a bus is kept. Every board is
+    fronted by a proxy so reads come from its shadow rather than waiting on
+    the bus.
+
+    Flush flushes every board then waits for every bus, so the registry can be
+    handed to a TurnoutBank as its only device.
+    """
+
+    def __init__(self, device_factory=None, write_through=True, block_writes=False):
+        """Create an empty registry
+
+        The device factory is called with (bus, address) to create a board,
+        PCA9685Device by default. The proxies of the boards are created with
+        the given write through and block write modes.
+        """
+        self.__logger = logging.getLogger('hw.pwm.pca9685-registry')
+        self.__lock = threading.Lock()
+
+        if device_factory is None:
+            device_factory = self.__create_device
+
+        self.__device_factory = device_factory
+        self.__write_through = write_through
+        self.__block_writes = block_writes
+
+        self.__workers = {}
+        self.__boards = {}
+        self.__providers = {}
+
+    def get_board(self, bus, address):
+        """Return the proxy of a board, creating the board if needed"""
+        with self.__lock:
+            return self.__get_board(bus, address)
+
+    def get_boards(self):
+        """Return the proxies of every board"""
+        with self.__lock:
+            return [self.__boards[key] for key in sorted(self.__boards)]
+
+    def get_worker(self, bus):
+        """Return the worker of a bus, None if no board is on it"""
+        with self.__lock:
+            return self.__workers.get(bus)
+
+    def get_pwm_provider(self, bus, address, pin):
+        """Return the PWM provider of a pin, the same one for every call"""
+        key = (bus, address, pin)
+
+        with self.__lock:
+            provider = self.__providers.get(key)
+
+            if provider is None:
+                provider = PWMProviderPCA9685(
+                    self.__get_board(bus, address), pin)
+                self.__providers[key] = provider
+
+            return provider
+
+    def flush(self):
+        """Write the changes staged on every board and wait for every bus
+
+        The boards on a bus where a write failed forget their shadow, so the
+        writes that never reached a chip are not later dropped as unchanged.
+        The first failure is raised once every bus has been waited for.
+        """
+        for board in self.get_boards():
+            board.flush()
+
+        with self.__lock:
+            workers = list(self.__workers.items())
+
+        failure = None
+
+        for bus, worker in workers:
+            try:
+                worker.sync()
+            except Exception as error:
+                self.__invalidate_bus(bus)
+
+                if failure is None:
+                    failure = error
+
+        if failure is not None:
+            raise failure
+
+    def stop(self):
+        """Run the queued transactions then stop every bus worker"""
+        with self.__lock:
+            workers = list(self.__workers.values())
+
+        for worker in workers:
+            worker.stop()
+
+    def __invalidate_bus(self, bus):
+        """Forget the shadow of every board on a bus"""
+        with self.__lock:
+            boards = [
+                board for (board_bus, address), board in self.__boards.items()
+                if board_bus == bus]
+
+        for board in boards:
+            board.invalidate()
+
+    def __get_board(self, bus, address):
+        """Return the proxy of a board, lock must be held"""
+        board = self.__boards.get((bus, address))
+
+        if board is not None:
+            return board
+
+        worker = self.__workers.get(bus)
+
+        if worker is None:
+            self.__logger.info('Starting worker for bus %s', bus)
+
+            worker = I2CBusWorker(bus)
+            self.__workers[bus] = worker
+
+        self.__logger.info('Adding board 0x%02x on bus %s', address, bus)
+
+        device = PCA9685BusDevice(
+            worker.call(self.__device_factory, bus, address), worker)
+
+        board = PCA9685Proxy(
+            device,
+            write_through=self.__write_through,
+            block_writes=self.__block_writes)
+
+        self.__boards[(bus, address)] = board
+
+        return board
+
+    @staticmethod
+    def __create_device(bus, address):
+        """Create a PCA9685 on the bus"""
+        from src.hw.pwm.pca9685_device import PCA9685Device
+
+        return PCA9685Device(address, bus)
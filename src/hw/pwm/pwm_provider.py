@@ -12,20 +12,33 @@ Class definition to abstract PWM generation
 import logging
 
 class PWMProvider(object):
-    def __init__(self, min_freq, max_freq, min_duty=0, max_duty=100):
-        """Create a PWM provider"""
+    def __init__(
+        self, min_freq, max_freq, min_duty=0, max_duty=100, resolution=100):
+        """Create a PWM provider
+
+        The resolution is the raw duty count that gives a 100% duty cycle.
+        """
         self.__logger = logging.getLogger('hw.pwm.pwm-provider')
         self._duty = 0
         self._min_duty = min_duty
         self._max_duty = max_duty
         self._min_freq = min_freq
         self._max_freq = max_freq
+        self._resolution = resolution
 
     def set_duty(self, duty):
         """Set the duty cycle of the PWM provider"""
         self.__logger.info('Duty Cycle: %d', duty)
         self._duty = duty
 
+    def get_resolution(self):
+        """Return the raw duty count that gives a 100% duty cycle"""
+        return self._resolution
+
+    def set_raw_duty(self, count):
+        """Set the duty cycle as a raw count, with no scaling or logging"""
+        self._duty = count
+
     def set_freq(self, freq):
         """Set the frequency of the PWM provider"""
         raise NotImplementedError("You're trying to use an abstract method to get frequency.")
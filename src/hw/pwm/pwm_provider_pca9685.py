@@ -21,6 +21,8 @@ class PWMProviderPCA9685(PWMProvider):
     MIN_PIN = 0
     MAX_PIN = 15
 
+    RESOLUTION = 0x0FFF
+
     def __init__(self, device, pin):
         """Creates a PWM provider
 
@@ -36,7 +38,8 @@ class PWMProviderPCA9685(PWMProvider):
         assert(self.__pin >= self.MIN_PIN)
         assert(self.__pin <= self.MAX_PIN)
 
-        super(PWMProviderPCA9685, self).__init__(self.MIN_FREQ, self.MAX_FREQ)
+        super(PWMProviderPCA9685, self).__init__(
+            self.MIN_FREQ, self.MAX_FREQ, resolution=self.RESOLUTION)
 
     def set_duty(self, duty):
         """Sets the duty cycle of the pin specified by the PWM provider.
@@ -53,18 +56,27 @@ class PWMProviderPCA9685(PWMProvider):
         self.__logger.info('Limited duty: %d', duty)
 
         # Scale duty to send it to the PCA9685
-        duty = int(duty * 0x0FFF / 100)
+        duty = int(duty * self.RESOLUTION / 100)
 
         self.__logger.info('Scaled duty: %d', duty)
 
         PWMProvider.set_duty(self, duty)
 
+    def set_raw_duty(self, count):
+        """Sets the duty cycle as a PCA9685 register count"""
+        assert(count >= 0)
+        assert(count <= self.RESOLUTION)
+
+        self._duty = count
+
     def set_freq(self, freq):
         """Set PWM frequency for the PWM provider.
 
         For the PCA9685 this affects all pins simulatneously.
         """
-        self.__logger.info('Current freq: %d', self.__dev.get_pwm_frequency())
+        current_freq = self.__dev.get_pwm_frequency()
+
+        self.__logger.info('Current freq: %d', current_freq)
         self.__logger.info('Requested freq: %d', freq)
 
         # TODO: these checks should probably be moved to the base class
@@ -72,7 +84,7 @@ class PWMProviderPCA9685(PWMProvider):
         assert(freq > self._min_freq)
         assert(freq < self._max_duty)
 
-        if(freq == self.__dev.get_pwm_frequency()):
+        if(freq == current_freq):
             return
 
         self.__dev.set_pwm_frequency(freq)
@@ -8,64 +8,229 @@
 # 2018
 #-------------------------------------------------------------------------------
 
+import asyncio
 import logging
-import time
+import math
+
+from src.clock.clock import Clock
 
 class Servo(object):
     """Servo object that is able to go to a given angle using a PWM source"""
 
-    def __init__(self, pwm_provider):
-        """Create a servo object with a PWM source"""
+    # Typical stall current of a micro servo
+    STALL_CURRENT_MA = 650
+
+    # Default calibration gives a full 180deg sweep 0.5s to settle
+    SPEED_DEG_S = 360
+    MIN_SETTLE_TIME_S = 0.1
+
+    # Default endpoints are the nominal 1ms to 2ms servo pulse
+    MIN_PULSE_US = 1000
+    MAX_PULSE_US = 2000
+
+    FREQ_HZ = 50
+
+    def __init__(
+        self,
+        pwm_provider,
+        stall_current=STALL_CURRENT_MA,
+        speed=SPEED_DEG_S,
+        min_settle_time=MIN_SETTLE_TIME_S,
+        min_pulse=MIN_PULSE_US,
+        max_pulse=MAX_PULSE_US,
+        clock=None):
+        """Create a servo object with a PWM source
+
+        The stall current in mA is the most the servo draws while moving. The
+        speed in deg/s and the minimum settle time in s calibrate how long the
+        servo is given to reach a new angle. The pulse widths in us at 0deg and
+        180deg calibrate the endpoints of the servo. The clock is waited on
+        while the servo settles, the system clock if not given.
+        """
         self.__logger = logging.getLogger('servo')
 
+        assert(stall_current > 0)
+        assert(speed > 0)
+        assert(min_settle_time >= 0)
+
+        assert(min_pulse > 0)
+        assert(min_pulse < max_pulse)
+        assert(max_pulse < 1000000 / self.FREQ_HZ)
+
         self.__pwm = pwm_provider
         self.__angle = -90
+        self.__stall_current = stall_current
+        self.__speed = speed
+        self.__min_settle_time = min_settle_time
+        self.__clock = clock if clock is not None else Clock()
+
+        self.__off_handle = None
+        self.__settle_waiters = []
+
+        self.__duty_table = self.__build_duty_table(min_pulse, max_pulse)
 
     def set_angle(self, angle):
         """Sets the angle of the servo
 
         Makes sure the servo is only moved between min and max angle values.
-        Gives 0.5s for the servo to move then the servo is turned off to reduce
-        power consumption and keep things quiet.
+        Gives the servo time to travel to the angle then the servo is turned off
+        to reduce power consumption and keep things quiet.
+        """
+        settle_time = self.__set_position(angle)
+
+        # Cause the servo to move
+        self.__move(settle_time)
+
+    def set_angle_async(self, angle):
+        """Sets the angle of the servo without blocking the event loop
+
+        Must be called from the event loop. The servo is turned on and the turn
+        off is scheduled on the event loop after the settle time. Returns a
+        future that completes once the servo has been turned off.
+        """
+        loop = asyncio.get_event_loop()
+        settled = loop.create_future()
+
+        settle_time = self.__set_position(angle)
+
+        # If still travelling to a previous angle allow for the rest of that
+        # move before this one
+        if self.__off_handle is not None:
+            settle_time += max(0, self.__off_handle.when() - loop.time())
+
+        self.__energize()
+
+        self.__settle_waiters.append(settled)
+        self.__off_handle = loop.call_later(settle_time, self.__deenergize)
+
+        return settled
+
+    def get_stall_current(self):
+        """Return the most current in mA the servo draws while moving"""
+        return self.__stall_current
+
+    def get_speed(self):
+        """Return the calibrated speed in deg/s"""
+        return self.__speed
+
+    def get_min_settle_time(self):
+        """Return the calibrated minimum settle time in s"""
+        return self.__min_settle_time
+
+    def get_settle_time(self, angle):
+        """Return the time needed to settle at an angle from the current one"""
+
+        # The starting position is unknown until the first move so allow for a
+        # full sweep
+        if self.__angle < 0:
+            travel = 180
+        else:
+            travel = abs(angle - self.__angle)
+
+        return max(self.__min_settle_time, travel / float(self.__speed))
+
+    def assume_angle(self, angle):
+        """Take the servo to already be at an angle without moving it
+
+        The position is set so the next move knows where it is starting from,
+        the servo is not turned on.
+        """
+        self.__set_position(angle)
+
+    def begin_move(self, angle):
+        """Turn the servo on at the requested angle and leave it on
+
+        Used to move several servos within the same settle window, returns the
+        time needed for the servo to settle. end_move must be called once the
+        servo has settled.
+        """
+        settle_time = self.__set_position(angle)
+        self.__energize()
+
+        return settle_time
+
+    def end_move(self):
+        """Turn the servo off after a move started with begin_move"""
+        self.__deenergize()
+
+    def __set_position(self, angle):
+        """Set the duty cycle of the PWM source for the requested angle
+
+        Returns the time needed for the servo to settle at the angle.
         """
 
         # Check that the angle is in range
         assert(angle >= 0)
         assert(angle <= 180)
 
-        # Do nothing if there is no change in angle from the last request
+        settle_time = self.get_settle_time(angle)
+
+        # Do nothing if there is no change in angle from the last request, the
+        # servo will be moved to the previously set position
         if(self.__angle == angle):
-            # Cause the servo to move to the previously set position
-            self.__move()
-            return
-        else:
-            self.__angle = angle
+            return settle_time
 
-        # Calculate the duty cycle as a percentage
-        # 50Hz => 20ms
-        # 1ms => 0deg => 5%
-        # 2ms => 180deg => 10%
-        # duty = angle/180deg * (1ms * 50Hz / 1000) + (1ms * 50Hz / 1000)
-        # duty = (1ms * 50Hz / 1000) * (1 + angle/180deg)
-        duty = 5 * (1 + (angle / 180))
+        self.__angle = angle
 
-        # Set the desired position
-        self.__pwm.set_duty(duty)
+        # Set the desired position, to the nearest whole degree
+        self.__pwm.set_raw_duty(self.__duty_table[int(round(angle))])
 
-        # Cause the servo to move
-        self.__move()
+        return settle_time
+
+    def __build_duty_table(self, min_pulse, max_pulse):
+        """Build the raw duty count of the PWM source for every whole angle
+
+        The pulse for an angle is interpolated between the endpoints, e.g. at
+        50Hz, 20ms, a 1ms pulse at 0deg is 5% duty and 2ms at 180deg is 10%.
+        The endpoints are rounded inwards so the pulse never leaves the
+        calibrated range.
+        """
+        counts_per_us = self.__pwm.get_resolution() * self.FREQ_HZ / 1000000.0
+
+        min_count = int(math.ceil(min_pulse * counts_per_us))
+        max_count = int(math.floor(max_pulse * counts_per_us))
+
+        table = []
+
+        for angle in range(181):
+            pulse = min_pulse + (max_pulse - min_pulse) * angle / 180.0
+            count = int(round(pulse * counts_per_us))
 
-    def __move(self):
+            table.append(min(max(count, min_count), max_count))
+
+        return table
+
+    def __move(self, settle_time):
         """Move the servo to the set position"""
+        self.__energize()
+
+        # Allow time for transistion
+        self.__clock.sleep(settle_time)
+
+        self.__deenergize()
+
+    def __energize(self):
+        """Turn the servo on at the set position"""
+
+        # A pending turn off belongs to a previous move, the servo will now be
+        # turned off once this move has settled
+        if self.__off_handle is not None:
+            self.__off_handle.cancel()
+            self.__off_handle = None
 
         # Make sure that the freq is set correctly
-        self.__pwm.set_freq(50)
+        self.__pwm.set_freq(self.FREQ_HZ)
 
         self.__pwm.turn_on()
 
-        # Allow time for transistion
-        time.sleep(0.5)
+    def __deenergize(self):
+        """Turn the servo off to reduce current and noise"""
+        self.__off_handle = None
 
-        # Turn the servo off to reduce current and noise
         self.__pwm.turn_off()
 
+        waiters, self.__settle_waiters = self.__settle_waiters, []
+
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
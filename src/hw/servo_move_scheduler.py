@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# servo_move_scheduler.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import itertools
+import logging
+import threading
+
+from src.hw.turnout_bank import TurnoutBank
+
+class ServoMoveScheduler(object):
+    """Schedules turnout moves within the current budget of the servo supply
+
+    Pending moves are packed into as few waves as the budget allows, each wave
+    being thrown by a turnout bank in a single settle period. Higher priority
+    moves are packed first and moves of equal priority are packed in the order
+    they were submitted, so a move is never held back by a later one.
+    """
+
+    def __init__(self, budget, bank=None):
+        """Create a scheduler for a supply that can provide budget mA"""
+        self.__logger = logging.getLogger('servo_move_scheduler')
+
+        assert(budget > 0)
+
+        self.__budget = budget
+        self.__bank = bank if bank is not None else TurnoutBank()
+
+        self.__lock = threading.Lock()
+        self.__sequence = itertools.count()
+        self.__pending = {}
+
+    def get_budget(self):
+        """Return the current budget in mA"""
+        return self.__budget
+
+    def get_pending_count(self):
+        """Return the number of moves waiting to be run"""
+        with self.__lock:
+            return len(self.__pending)
+
+    def submit(self, turnout, diverging, priority=0):
+        """Queue a move of a turnout, larger priorities are moved first
+
+        A turnout that already has a pending move keeps its place in the queue
+        and takes the new route and the higher of the two priorities.
+        """
+        current = turnout.get_stall_current()
+
+        # A move that can never fit would stall the queue forever
+        assert(current <= self.__budget)
+
+        with self.__lock:
+            if turnout in self.__pending:
+                pending = self.__pending[turnout]
+                priority = max(priority, pending['priority'])
+                sequence = pending['sequence']
+            else:
+                sequence = next(self.__sequence)
+
+            self.__pending[turnout] = {
+                'diverging':    diverging,
+                'current':      current,
+                'priority':     priority,
+                'sequence':     sequence }
+
+    def plan(self):
+        """Take every pending move and pack them into waves
+
+        Returns a list of waves, each a list of (turnout, diverging) pairs whose
+        combined stall current is within the budget.
+        """
+        with self.__lock:
+            pending, self.__pending = self.__pending, {}
+
+        moves = sorted(
+            pending.items(),
+            key=lambda move: (-move[1]['priority'], move[1]['sequence']))
+
+        waves = []
+        loads = []
+
+        for turnout, move in moves:
+            for index, load in enumerate(loads):
+                if load + move['current'] <= self.__budget:
+                    break
+            else:
+                index = len(waves)
+                waves.append([])
+                loads.append(0)
+
+            waves[index].append((turnout, move['diverging']))
+            loads[index] += move['current']
+
+        self.__logger.debug(
+            'Packed %d moves into %d waves', len(moves), len(waves))
+
+        return waves
+
+    def run(self):
+        """Run every pending move, returns the number of waves used"""
+        waves = self.plan()
+
+        for wave in waves:
+            self.__bank.set_routes(wave)
+
+        return len(waves)
+
+    async def run_async(self):
+        """Run every pending move without blocking the event loop
+
+        Returns the number of waves used.
+        """
+        waves = self.plan()
+
+        for wave in waves:
+            await self.__bank.set_routes_async(wave)
+
+        return len(waves)
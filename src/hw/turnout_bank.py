@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# turnout_bank.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import asyncio
+import logging
+
+from src.clock.clock import Clock
+
+class TurnoutBank(object):
+    """Sets the routes of several turnouts at the same time
+
+    All servos are turned on together, given a single settle period and then
+    turned off together, so a route takes about one settle period no matter
+    how many turnouts it throws.
+
+    Deferred PCA9685 proxies given to the bank are flushed once the servos
+    have been turned on and again once they have been turned off, so each
+    board sees one bus transfer per phase.
+    """
+
+    def __init__(self, devices=None, clock=None):
+        """Create a turnout bank, optionally with devices to flush
+
+        The clock is waited on while the servos settle, the system clock if
+        not given.
+        """
+        self.__logger = logging.getLogger('turnout_bank')
+
+        self.__devices = list(devices) if devices is not None else []
+        self.__clock = clock if clock is not None else Clock()
+
+    def set_routes(self, targets):
+        """Set the routes of the given turnouts
+
+        Takes an iterable of (turnout, diverging) pairs. If a turnout fails to
+        start moving, or the devices fail to flush, the turnouts already
+        started are still let settle and finished before the failure is
+        raised.
+        """
+        targets = list(targets)
+
+        if not len(targets):
+            return
+
+        self.__logger.info('Setting %d turnouts', len(targets))
+
+        settle_time = 0
+        started = []
+
+        try:
+            for turnout, diverging in targets:
+                settle_time = max(settle_time, turnout.begin_route(diverging))
+                started.append(turnout)
+        finally:
+            # A failed flush still lets the started servos settle and turn off
+            try:
+                self.__flush()
+            finally:
+                # Allow time for all servos to transition
+                self.__clock.sleep(settle_time)
+
+                for turnout in started:
+                    turnout.end_route()
+
+                self.__flush()
+
+    async def set_routes_async(self, targets):
+        """Set the routes of the given turnouts without blocking the event loop
+
+        Takes an iterable of (turnout, diverging) pairs and completes once all
+        of the servos have settled.
+        """
+        settled = []
+
+        for turnout, diverging in targets:
+            settled.append(turnout.set_route_async(diverging))
+
+        self.__logger.info('Setting %d turnouts', len(settled))
+
+        await asyncio.gather(*settled)
+
+    def home(self, turnouts, state_store=None):
+        """Align turnouts built without homing to the main route in one batch
+
+        Turnouts whose route is known to the state store are taken to already
+        be in position and only have their frog set. Returns the number of
+        turnouts that were driven.
+        """
+        turnouts = list(turnouts)
+        targets = []
+
+        for turnout in turnouts:
+            known_route = None
+
+            if state_store is not None:
+                known_route = state_store.get_route(turnout.get_id())
+
+            if known_route is None:
+                targets.append((turnout, False))
+            else:
+                turnout.assume_route(known_route)
+
+        self.__logger.info(
+            'Homing %d of %d turnouts', len(targets), len(turnouts))
+
+        self.set_routes(targets)
+
+        return len(targets)
+
+    def __flush(self):
+        """Flush the staged outputs of every device"""
+        for device in self.__devices:
+            device.flush()
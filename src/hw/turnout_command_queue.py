@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# turnout_command_queue.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import asyncio
+import logging
+
+class TurnoutCommandQueue(object):
+    """Latest wins queue of route commands for each turnout
+
+    Each turnout runs one move at a time. Commands that arrive while a turnout
+    is moving wait, and a newer command for the same turnout replaces one that
+    is waiting, so at most one move per turnout is ever queued.
+
+    Every command gets a future that completes with what happened to it:
+    COMPLETED if its move ran, SUPERSEDED if a newer command replaced it before
+    it ran, or COALESCED if it asked for the route a move already running or
+    waiting was setting.
+    """
+
+    COMPLETED = 'completed'
+    SUPERSEDED = 'superseded'
+    COALESCED = 'coalesced'
+
+    def __init__(self):
+        """Create an empty command queue"""
+        self.__logger = logging.getLogger('turnout_command_queue')
+
+        # Per turnout [diverging, futures] of the move running and waiting
+        self.__running = {}
+        self.__waiting = {}
+
+        # Tasks running the moves, kept so they are not collected mid run
+        self.__tasks = set()
+
+    def get_waiting_count(self):
+        """Return the number of turnouts with a move waiting to run"""
+        return len(self.__waiting)
+
+    def is_idle(self):
+        """Return whether no turnout is moving or waiting to move"""
+        return not len(self.__running) and not len(self.__waiting)
+
+    def submit(self, turnout, diverging):
+        """Queue a route command for a turnout
+
+        Must be called from the event loop, returns a future for the outcome
+        of the command.
+        """
+        loop = asyncio.get_event_loop()
+        outcome = loop.create_future()
+
+        waiting = self.__waiting.get(turnout)
+        running = self.__running.get(turnout)
+
+        if waiting is not None:
+            if waiting[0] == diverging:
+                waiting[1].append(outcome)
+                return outcome
+
+            self.__logger.debug('Superseding %d commands', len(waiting[1]))
+            self.__resolve(waiting[1], self.SUPERSEDED)
+            del self.__waiting[turnout]
+
+        if running is not None:
+            if running[0] == diverging:
+                running[1].append(outcome)
+                return outcome
+
+            self.__waiting[turnout] = [diverging, [outcome]]
+            return outcome
+
+        self.__running[turnout] = [diverging, [outcome]]
+
+        task = loop.create_task(self.__run(turnout))
+        self.__tasks.add(task)
+        task.add_done_callback(self.__task_done)
+
+        return outcome
+
+    async def close(self):
+        """Cancel every move running or waiting and wait for them to stop
+
+        Outcomes not yet completed are cancelled.
+        """
+        tasks = list(self.__tasks)
+
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        for diverging, outcomes in \
+            list(self.__running.values()) + list(self.__waiting.values()):
+            for outcome in outcomes:
+                if not outcome.done():
+                    outcome.cancel()
+
+        self.__running.clear()
+        self.__waiting.clear()
+
+    async def __run(self, turnout):
+        """Run the moves of a turnout until none are waiting"""
+        while turnout in self.__running:
+            diverging, outcomes = self.__running[turnout]
+
+            try:
+                await turnout.set_route_async(diverging)
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                self.__logger.error('Turnout move failed')
+                self.__fail(outcomes, ex)
+            else:
+                self.__resolve(outcomes[:1], self.COMPLETED)
+                self.__resolve(outcomes[1:], self.COALESCED)
+
+            if turnout in self.__waiting:
+                self.__running[turnout] = self.__waiting.pop(turnout)
+            else:
+                del self.__running[turnout]
+
+    def __task_done(self, task):
+        """Forget a finished task, logging it if it failed"""
+        self.__tasks.discard(task)
+
+        if not task.cancelled() and task.exception() is not None:
+            self.__logger.error(
+                'Turnout command task failed: %s', task.exception())
+
+    def __resolve(self, outcomes, result):
+        """Complete outcome futures that are still waiting"""
+        for outcome in outcomes:
+            if not outcome.done():
+                outcome.set_result(result)
+
+    def __fail(self, outcomes, ex):
+        """Fail outcome futures that are still waiting"""
+        for outcome in outcomes:
+            if not outcome.done():
+                outcome.set_exception(ex)
@@ -8,16 +8,35 @@
 # 2018
 #-------------------------------------------------------------------------------
 
+import asyncio
 import logging
+import threading
 
 class TurnoutEFrogServo(object):
-    """Object for controlling an electro frog Turnout"""
+    """Object for controlling an electro frog Turnout, its route is recorded
+    once the points settle and forgotten while they move
+    """
 
-    def __init__(self, servo, gpo_provider, main_angle, diverging_angle):
+    def __init__(
+        self,
+        servo,
+        gpo_provider,
+        main_angle,
+        diverging_angle,
+        home=True,
+        state_store=None,
+        turnout_id=None,
+        store_writer=None):
         """Create a turnout object
 
         Takes a servo to move the points along with the angles for the main and
-        diverging angles, and a GPO to control the frog
+        diverging angles, and a GPO to control the frog. Unless home is False
+        the turnout is aligned to the main route straight away. If a state
+        store is given every route set is recorded in it under the turnout id.
+
+        The async path writes records on the store writer executor, the event
+        loop's default executor if not given, so the loop never waits on the
+        store.
         """
         self.__logger = logging.getLogger('turnout')
 
@@ -25,6 +44,16 @@ class TurnoutEFrogServo(object):
         self.__diverging_angle = diverging_angle
         self.__gpo = gpo_provider
         self.__servo = servo
+        self.__state_store = state_store
+        self.__id = turnout_id
+        self.__store_writer = store_writer
+
+        # Route the points have settled at, and the route and number of the
+        # moves in progress
+        self.__route = None
+        self.__target = None
+        self.__moves = 0
+        self.__settled = threading.Condition()
 
         # Check that the given angles are within range
         assert(main_angle <= 180)
@@ -33,22 +62,202 @@ class TurnoutEFrogServo(object):
         assert(diverging_angle <= 180)
         assert(diverging_angle >= 0)
 
+        # A turnout can only be recorded if it can be told apart from others
+        assert(state_store is None or turnout_id is not None)
+
         # Align the turnout to the main route
-        self.set_route(False)
+        if home:
+            self.set_route(False)
+
+    def get_id(self):
+        """Return the id of the turnout, None if not given"""
+        return self.__id
+
+    def get_route(self):
+        """Return True if diverging, False if main or None if not known
+
+        The route is only known once the points have settled, it is None while
+        they are moving away from it.
+        """
+        return self.__route
+
+    def get_moving_route(self):
+        """Return the route a move in progress is setting, None if not moving
+        """
+        return self.__target if self.__moves else None
+
+    def wait_settled(self, timeout=None):
+        """Wait until no move is in progress, returns False on timeout"""
+        with self.__settled:
+            return self.__settled.wait_for(lambda: not self.__moves, timeout)
 
     def set_route(self, diverging):
         """Set the route of the turnout"""
+        self.__forget_route(diverging)
+        angle = self.__begin(diverging)
+
+        try:
+            self.__servo.set_angle(angle)
+        except Exception:
+            self.__end(False)
+            raise
+
+        self.__record_route(self.__end(True))
+
+    def set_route_async(self, diverging):
+        """Set the route of the turnout without blocking the event loop
+
+        Must be called from the event loop, returns a future that completes
+        once the servo has settled and the route has been recorded.
+        """
+        forgotten = self.__forget_route(diverging, wait=False)
+        angle = self.__begin(diverging)
+
+        try:
+            settled = self.__servo.set_angle_async(angle)
+        except Exception:
+            self.__end(False)
+            raise
+
+        return asyncio.ensure_future(self.__settle_async(settled, forgotten))
+
+    def get_stall_current(self):
+        """Return the most current in mA the turnout draws while moving"""
+        return self.__servo.get_stall_current()
+
+    def assume_route(self, diverging):
+        """Take the turnout to already be set to a route without moving it
+
+        Used when the position of the points is known, e.g. from a state store,
+        only the frog is set. The route is not recorded as it is already known.
+        """
+        angle = self.__set_frog(diverging)
+
+        self.__servo.assume_angle(angle)
+
+        with self.__settled:
+            self.__route = bool(diverging)
+
+        self.__logger.info('Route assumed')
+
+    def begin_route(self, diverging):
+        """Start setting the route of the turnout, leaving the servo powered
+
+        Returns the time needed for the servo to settle, end_route must be
+        called once it has elapsed.
+        """
+        self.__forget_route(diverging)
+        angle = self.__begin(diverging)
+
+        try:
+            return self.__servo.begin_move(angle)
+        except Exception:
+            self.__end(False)
+            raise
+
+    def end_route(self):
+        """Finish setting the route of the turnout"""
+        self.__servo.end_move()
 
-        angle = self.__main_angle
-        text = 'Route set to main'
+        self.__record_route(self.__end(True))
 
+    async def __settle_async(self, settled, forgotten):
+        """Record the route once the servo has settled and the route has been
+        forgotten
+        """
+        try:
+            await settled
+        except BaseException:
+            self.__end(False)
+            raise
+        finally:
+            if forgotten is not None:
+                await forgotten
+
+        recorded = self.__record_route(self.__end(True), wait=False)
+
+        if recorded is not None:
+            await recorded
+
+    def __begin(self, diverging):
+        """Start a move to a route, returns the servo angle for the route"""
+        with self.__settled:
+            self.__target = bool(diverging)
+            self.__moves += 1
+
+            if self.__route != self.__target:
+                self.__route = None
+
+        return self.__set_frog(diverging)
+
+    def __end(self, succeeded):
+        """Finish a move, returns the route the points settled at
+
+        Returns None while other moves are still in progress, or if any move
+        failed since the points last settled.
+        """
+        with self.__settled:
+            if not succeeded:
+                self.__target = None
+
+            self.__moves -= 1
+
+            if self.__moves:
+                return None
+
+            route = self.__route = self.__target
+            self.__settled.notify_all()
+
+        if route is not None:
+            self.__log_route(route)
+
+        return route
+
+    def __forget_route(self, diverging, wait=True):
+        """Clear the recorded route if the points are about to move away from it
+
+        Unless wait is True returns a future for the write, None if there is
+        nothing to write.
+        """
+        if self.__state_store is None or self.__route == bool(diverging):
+            return None
+
+        return self.__write_route(None, wait)
+
+    def __record_route(self, diverging, wait=True):
+        """Record the route the points have settled at
+
+        Unless wait is True returns a future for the write, None if there is
+        nothing to write.
+        """
+        if self.__state_store is None or diverging is None:
+            return None
+
+        return self.__write_route(bool(diverging), wait)
+
+    def __write_route(self, route, wait):
+        """Write the route to the state store, on the store writer unless wait
+        is True
+        """
+        if wait:
+            self.__state_store.set_route(self.__id, route)
+            return None
+
+        return asyncio.get_event_loop().run_in_executor(
+            self.__store_writer, self.__state_store.set_route, self.__id, route)
+
+    def __set_frog(self, diverging):
+        """Set the frog for the route, returns the servo angle for the route"""
         if(diverging):
-            angle = self.__diverging_angle
-            text = 'Route set to diverging'
             self.__gpo.enable()
-        else:
-            self.__gpo.disable()
+            return self.__diverging_angle
 
-        self.__servo.set_angle(angle)
-        self.__logger.info(text)
+        self.__gpo.disable()
+        return self.__main_angle
 
+    def __log_route(self, diverging):
+        """Log the route that was set"""
+        if(diverging):
+            self.__logger.info('Route set to diverging')
+        else:
+            self.__logger.info('Route set to main')
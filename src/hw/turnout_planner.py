@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# turnout_planner.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import collections
+import logging
+
+from src.hw.turnout_bank import TurnoutBank
+
+# Moves as (turnout, diverging), the turnouts already set as desired and the
+# turnouts already moving to the desired route as (turnout, diverging)
+TurnoutPlan = collections.namedtuple(
+    'TurnoutPlan', ['moves', 'unchanged', 'joined'])
+
+class TurnoutPlanner(object):
+    """Sets a desired state moving only the turnouts not already set to it
+
+    The route each turnout has settled at is compared with the desired one,
+    a turnout whose route is not known is always moved. Setting the same full
+    state twice therefore moves nothing the second time, where setting every
+    turnout would give each one a full settle period.
+
+    A turnout already moving to the desired route, e.g. for a route being set
+    from another thread, is joined rather than moved again. Applying the state
+    then waits for that move to settle, and moves the turnout again if the
+    move failed. A turnout moving to any other route is moved.
+
+    In verify mode every turnout is driven, e.g. to recover points that were
+    knocked out of position by hand.
+    """
+
+    def __init__(self, bank=None):
+        """Create a planner moving turnouts with a bank"""
+        self.__logger = logging.getLogger('turnout_planner')
+
+        self.__bank = bank if bank is not None else TurnoutBank()
+
+    def plan(self, targets, verify=False):
+        """Return the TurnoutPlan for an iterable of (turnout, diverging)
+
+        A turnout given more than once takes the last route given.
+        """
+        desired = collections.OrderedDict()
+
+        for turnout, diverging in targets:
+            desired.pop(turnout, None)
+            desired[turnout] = bool(diverging)
+
+        moves = []
+        unchanged = []
+        joined = []
+
+        for turnout, diverging in desired.items():
+            moving = turnout.get_moving_route()
+
+            if verify:
+                moves.append((turnout, diverging))
+            elif moving is not None:
+                if moving == diverging:
+                    joined.append((turnout, diverging))
+                else:
+                    moves.append((turnout, diverging))
+            elif turnout.get_route() != diverging:
+                moves.append((turnout, diverging))
+            else:
+                unchanged.append(turnout)
+
+        return TurnoutPlan(moves, unchanged, joined)
+
+    def apply(self, targets, verify=False):
+        """Move the turnouts that differ from a desired state together
+
+        Returns the TurnoutPlan that was carried out once every turnout has
+        settled.
+        """
+        plan = self.plan(targets, verify)
+
+        self.__logger.info(
+            'Moving %d turnouts, %d already set, %d already moving',
+            len(plan.moves), len(plan.unchanged), len(plan.joined))
+
+        self.__bank.set_routes(plan.moves)
+
+        for turnout, diverging in plan.joined:
+            turnout.wait_settled()
+
+        # Moves joined that did not end up where wanted are made again
+        missed = [
+            (turnout, diverging) for turnout, diverging in plan.joined
+            if turnout.get_route() != diverging]
+
+        if len(missed):
+            self.__bank.set_routes(missed)
+
+        return plan
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# turnout_state_journal.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+class TurnoutStateJournal(object):
+    """Persists the last known route of each turnout in a journal and a
+    memory mapped snapshot
+
+    Every change is appended to the journal and synced before it is applied
+    to the snapshot, which holds one byte per turnout id so it is read without
+    any parsing. Once the journal grows long enough the snapshot is synced,
+    stamped with the sequence number of the last change and the journal is
+    emptied.
+
+    At startup journal records newer than the snapshot stamp are replayed. A
+    record torn by a power loss fails its checksum and the journal is cut
+    there, so either the old or the new route of a turnout is found.
+
+    Provides the same interface as TurnoutStateStore.
+    """
+
+    # Snapshot header: magic, sequence number of the last change applied,
+    # checksum of both
+    SNAPSHOT_MAGIC = b'TSS1'
+    SNAPSHOT_HEADER = struct.Struct('!4sII')
+
+    # Journal record: sequence number, turnout id, route, checksum of the rest
+    JOURNAL_RECORD = struct.Struct('!IHBI')
+
+    # Snapshot route of a turnout
+    UNKNOWN = 0
+    MAIN = 1
+    DIVERGING = 2
+
+    TURNOUT_IDS = 0x10000
+
+    COMPACT_RECORDS = 4096
+
+    def __init__(self, path, compact_records=COMPACT_RECORDS):
+        """Create a journal backed by files starting with the given path,
+        loading any state
+
+        The journal is compacted into the snapshot once it holds the given
+        number of records.
+        """
+        self.__logger = logging.getLogger('turnout_state_journal')
+        self.__lock = threading.Lock()
+
+        self.__compact_records = compact_records
+
+        self.__snapshot_file = self.__open(path + '.snapshot')
+        self.__snapshot_file.truncate(
+            self.SNAPSHOT_HEADER.size + self.TURNOUT_IDS)
+
+        self.__snapshot = mmap.mmap(
+            self.__snapshot_file.fileno(),
+            self.SNAPSHOT_HEADER.size + self.TURNOUT_IDS)
+
+        self.__journal_file = self.__open(path + '.journal')
+
+        self.__sequence = self.__read_header()
+        self.__records = self.__replay()
+
+    def get_route(self, turnout_id):
+        """Return the last known route of a turnout, None if not known"""
+        with self.__lock:
+            return self.__route(self.__snapshot[self.__offset(turnout_id)])
+
+    def get_routes(self):
+        """Return the last known route of every turnout"""
+        with self.__lock:
+            values = self.__snapshot[self.SNAPSHOT_HEADER.size:]
+
+        return dict(
+            (turnout_id, self.__route(value))
+            for turnout_id, value in enumerate(values.rstrip(b'\0'))
+            if value != self.UNKNOWN)
+
+    def set_route(self, turnout_id, diverging):
+        """Record the route of a turnout, None forgets it"""
+        if diverging is None:
+            value = self.UNKNOWN
+        else:
+            value = self.DIVERGING if diverging else self.MAIN
+
+        with self.__lock:
+            offset = self.__offset(turnout_id)
+
+            if self.__snapshot[offset] == value:
+                return
+
+            self.__sequence += 1
+
+            self.__journal_file.write(
+                self.__pack_record(self.__sequence, turnout_id, value))
+            self.__journal_file.flush()
+            os.fsync(self.__journal_file.fileno())
+
+            self.__snapshot[offset] = value
+            self.__records += 1
+
+            if self.__records >= self.__compact_records:
+                self.__compact()
+
+    def compact(self):
+        """Sync the snapshot and empty the journal"""
+        with self.__lock:
+            self.__compact()
+
+    def close(self):
+        """Compact the journal and close the files"""
+        with self.__lock:
+            if self.__snapshot.closed:
+                return
+
+            self.__compact()
+
+            self.__snapshot.close()
+            self.__snapshot_file.close()
+            self.__journal_file.close()
+
+    def __compact(self):
+        """Stamp a synced snapshot with the last change then empty the
+        journal, lock must be held
+
+        Replaying a journal the snapshot already covers is harmless, so a
+        power loss at any point leaves a usable state.
+        """
+        self.__snapshot.flush()
+
+        self.SNAPSHOT_HEADER.pack_into(
+            self.__snapshot, 0,
+            self.SNAPSHOT_MAGIC,
+            self.__sequence,
+            self.__header_crc(self.__sequence))
+        self.__snapshot.flush()
+
+        self.__journal_file.seek(0)
+        self.__journal_file.truncate()
+        self.__journal_file.flush()
+        os.fsync(self.__journal_file.fileno())
+
+        self.__records = 0
+
+    def __read_header(self):
+        """Return the sequence number the snapshot is stamped with
+
+        A snapshot never stamped, or whose stamp is torn, is taken to cover
+        nothing so the whole journal is replayed over it.
+        """
+        magic, sequence, crc = self.SNAPSHOT_HEADER.unpack_from(self.__snapshot)
+
+        if magic != self.SNAPSHOT_MAGIC or crc != self.__header_crc(sequence):
+            if magic != b'\0' * len(self.SNAPSHOT_MAGIC):
+                self.__logger.warning('Turnout state snapshot stamp is not valid')
+
+            return 0
+
+        return sequence
+
+    def __replay(self):
+        """Apply journal records newer than the snapshot, returns the number
+        of records in the journal
+
+        The journal is cut at the first incomplete or corrupt record.
+        """
+        self.__journal_file.seek(0)
+        data = self.__journal_file.read()
+
+        size = self.JOURNAL_RECORD.size
+        count = 0
+
+        for offset in range(0, len(data) - size + 1, size):
+            sequence, turnout_id, value, crc = \
+                self.JOURNAL_RECORD.unpack_from(data, offset)
+
+            if crc != self.__record_crc(data, offset) or \
+                value not in (self.UNKNOWN, self.MAIN, self.DIVERGING):
+                break
+
+            if sequence > self.__sequence:
+                self.__snapshot[self.__offset(turnout_id)] = value
+                self.__sequence = sequence
+
+            count += 1
+
+        if count * size != len(data):
+            self.__logger.warning(
+                'Dropping %d bytes of torn turnout state journal',
+                len(data) - count * size)
+
+            self.__journal_file.seek(count * size)
+            self.__journal_file.truncate()
+            self.__journal_file.flush()
+            os.fsync(self.__journal_file.fileno())
+
+        self.__journal_file.seek(0, os.SEEK_END)
+
+        return count
+
+    def __pack_record(self, sequence, turnout_id, value):
+        """Return a journal record"""
+        record = bytearray(self.JOURNAL_RECORD.size)
+        self.JOURNAL_RECORD.pack_into(record, 0, sequence, turnout_id, value, 0)
+        self.JOURNAL_RECORD.pack_into(
+            record, 0, sequence, turnout_id, value, self.__record_crc(record, 0))
+
+        return bytes(record)
+
+    def __record_crc(self, data, offset):
+        """Return the checksum of the journal record at an offset"""
+        return zlib.crc32(
+            bytes(data[offset:offset + self.JOURNAL_RECORD.size - 4]))
+
+    def __header_crc(self, sequence):
+        """Return the checksum of a snapshot stamp"""
+        return zlib.crc32(self.SNAPSHOT_MAGIC + struct.pack('!I', sequence))
+
+    def __offset(self, turnout_id):
+        """Return the snapshot offset of a turnout"""
+        assert(turnout_id >= 0)
+        assert(turnout_id < self.TURNOUT_IDS)
+
+        return self.SNAPSHOT_HEADER.size + turnout_id
+
+    def __route(self, value):
+        """Return the route stored in the snapshot"""
+        if value == self.UNKNOWN:
+            return None
+
+        return value == self.DIVERGING
+
+    @staticmethod
+    def __open(path):
+        """Open a file for reading and writing, creating it if needed"""
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+        return os.fdopen(fd, 'r+b')
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# turnout_state_store.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import json
+import logging
+import os
+import threading
+
+class TurnoutStateStore(object):
+    """Persists the last known route of each turnout in a JSON file
+
+    Routes are keyed by turnout id. The file is replaced atomically on every
+    change so a power loss leaves either the old or the new state.
+    """
+
+    def __init__(self, path):
+        """Create a state store backed by the given file, loading any state"""
+        self.__logger = logging.getLogger('turnout_state_store')
+        self.__lock = threading.Lock()
+
+        self.__path = path
+        self.__routes = {}
+
+        try:
+            with open(path) as state_file:
+                routes = json.load(state_file)
+        except (IOError, OSError, ValueError):
+            self.__logger.warning('No usable turnout state in %s', path)
+            routes = {}
+
+        for turnout_id, diverging in routes.items():
+            self.__routes[int(turnout_id)] = bool(diverging)
+
+    def get_route(self, turnout_id):
+        """Return the last known route of a turnout, None if not known"""
+        with self.__lock:
+            return self.__routes.get(turnout_id)
+
+    def get_routes(self):
+        """Return the last known route of every turnout"""
+        with self.__lock:
+            return dict(self.__routes)
+
+    def set_route(self, turnout_id, diverging):
+        """Record the route of a turnout, None forgets it"""
+        with self.__lock:
+            if self.__routes.get(turnout_id) == diverging:
+                return
+
+            if diverging is None:
+                del self.__routes[turnout_id]
+            else:
+                self.__routes[turnout_id] = diverging
+
+            self.__save()
+
+    def __save(self):
+        """Write the state to a temporary file and move it into place"""
+        temp_path = self.__path + '.tmp'
+
+        with open(temp_path, 'w') as state_file:
+            json.dump(
+                dict((str(key), value) for key, value in self.__routes.items()),
+                state_file)
+            state_file.flush()
+            os.fsync(state_file.fileno())
+
+        os.replace(temp_path, self.__path)
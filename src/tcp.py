@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# tcp.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import asyncio
+import logging
+import os
+
+from src.app.net.discovery import Discovery
+from src.app.net.network_manager import NetworkManager
+from src.app.net.tcp_client import TCPClient
+from src.app.net.tcp_server import TCPServer
+
+def log_data(data, length):
+    """Endpoint that logs received data"""
+    logging.getLogger('tcp').info('Received %d bytes', length)
+
+def main():
+    """Run the node's network roles on a single event loop"""
+    logging.basicConfig(level=logging.INFO)
+
+    loop = asyncio.get_event_loop()
+
+    port = int(os.environ.get('TURNOUT_PORT', TCPServer.PORT))
+    server_host = os.environ.get('TURNOUT_SERVER_HOST', 'localhost')
+
+    net_man = NetworkManager(
+        log_data,
+        client=TCPClient(server_host, port, loop),
+        server=TCPServer(port=port, loop=loop),
+        discovery=Discovery(server_port=port, loop=loop))
+
+    net_man.search()
+
+    try:
+        loop.run_forever()
+    finally:
+        net_man.shutdown()
+        loop.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# benchmarks.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+"""Hardware in the loop benchmarks run against fake PCA9685 boards
+
+Settle periods run on a virtual clock so the suite finishes in seconds. Each
+benchmark returns a dict of results, run as a module the results are written
+as JSON and optionally compared against a baseline from an earlier release:
+
+    python -m tests.bench.benchmarks -o results.json
+    python -m tests.bench.benchmarks --baseline results.json
+"""
+
+import argparse
+import json
+import logging
+import math
+import sys
+import time
+
+from src.app.net import protocol
+from src.app.net.network_manager import NetworkManager
+from src.app.net.turnout_dispatcher import TurnoutDispatcher
+from src.clock.clock_virtual import ClockVirtual
+from src.hw.gpio.gpo_provider_pwm import GPOProviderPWM
+from src.hw.pwm.pca9685_proxy import PCA9685Proxy
+from src.hw.pwm.pwm_provider_pca9685 import PWMProviderPCA9685
+from src.hw.servo import Servo
+from src.hw.turnout_bank import TurnoutBank
+from src.hw.turnout_efrog_servo import TurnoutEFrogServo
+
+from tests.unit.app.net.fake_client import FakeClient
+from tests.unit.hw.pwm.fake_pca9685 import FakePCA9685
+
+RESULTS_VERSION = 1
+
+ANGLE_MAIN = 45
+ANGLE_DIV = 135
+
+# Each turnout uses one channel for its servo and one for its frog
+TURNOUTS_PER_BOARD = PWMProviderPCA9685.MAX_PIN // 2 + 1
+
+THROW_COUNTS = [1, 16, 64, 256]
+NETWORK_TURNOUTS = 64
+NETWORK_MESSAGES = 5000
+STARTUP_TURNOUTS = 64
+
+# Bus access of the boards, see Layout
+DIRECT = 'direct'
+WRITE_THROUGH = 'write_through'
+DEFERRED = 'deferred'
+
+class Layout(object):
+    """Turnouts spread over as many fake boards as they need
+
+    Boards are accessed directly, through write through proxies or through
+    deferred proxies doing block writes that the bank flushes once per phase.
+    Turnouts are built without homing and settle on the given clock.
+    """
+
+    def __init__(self, turnout_count, clock, access=DEFERRED):
+        """Create the boards and turnouts of a layout"""
+        board_count = int(math.ceil(turnout_count / float(TURNOUTS_PER_BOARD)))
+
+        self.devices = [FakePCA9685() for i in range(board_count)]
+
+        if access == DIRECT:
+            boards = self.devices
+        else:
+            boards = [
+                PCA9685Proxy(
+                    device,
+                    write_through=(access == WRITE_THROUGH),
+                    block_writes=(access == DEFERRED))
+                for device in self.devices]
+
+        self.bank = TurnoutBank(boards if access == DEFERRED else None, clock)
+        self.turnouts = []
+
+        for turnout_id in range(turnout_count):
+            board = boards[turnout_id // TURNOUTS_PER_BOARD]
+            pin = 2 * (turnout_id % TURNOUTS_PER_BOARD)
+
+            self.turnouts.append(TurnoutEFrogServo(
+                Servo(PWMProviderPCA9685(board, pin), clock=clock),
+                GPOProviderPWM(PWMProviderPCA9685(board, pin + 1)),
+                ANGLE_MAIN,
+                ANGLE_DIV,
+                home=False,
+                turnout_id=turnout_id))
+
+    def get_write_count(self):
+        """Return the bus writes made to all boards"""
+        return sum(device.get_write_count() for device in self.devices)
+
+    def get_read_count(self):
+        """Return the bus reads made from all boards"""
+        return sum(device.get_read_count() for device in self.devices)
+
+class Measurement(object):
+    """Virtual time, wall clock time and bus traffic taken by a block"""
+
+    def __init__(self, clock, layout=None):
+        """Create a measurement on a virtual clock, of a layout if given"""
+        self.__clock = clock
+        self.__layout = layout
+
+    def __enter__(self):
+        self.__virtual = self.__clock.time()
+        self.__wall = time.perf_counter()
+
+        if self.__layout is not None:
+            self.__writes = self.__layout.get_write_count()
+            self.__reads = self.__layout.get_read_count()
+
+        return self
+
+    def __exit__(self, *exc_info):
+        self.wall_s = time.perf_counter() - self.__wall
+        self.virtual_s = self.__clock.time() - self.__virtual
+
+        if self.__layout is not None:
+            self.i2c_writes = self.__layout.get_write_count() - self.__writes
+            self.i2c_reads = self.__layout.get_read_count() - self.__reads
+
+    def get_results(self):
+        """Return the measured values"""
+        results = { 'virtual_s': self.virtual_s, 'wall_s': self.wall_s }
+
+        if self.__layout is not None:
+            results['i2c_writes'] = self.i2c_writes
+            results['i2c_reads'] = self.i2c_reads
+
+        return results
+
+def bench_i2c_per_route_change(access):
+    """Bus transactions to throw one turnout and a full board of turnouts"""
+    clock = ClockVirtual()
+    results = {}
+
+    layout = Layout(TURNOUTS_PER_BOARD, clock, access)
+    layout.bank.home(layout.turnouts)
+
+    for name, turnouts in [
+        ('single', layout.turnouts[:1]),
+        ('board', layout.turnouts)]:
+        with Measurement(clock, layout) as measurement:
+            layout.bank.set_routes(
+                [(turnout, not turnout.get_route()) for turnout in turnouts])
+
+        results[name] = {
+            'turnouts': len(turnouts),
+            'i2c_writes': measurement.i2c_writes,
+            'i2c_reads': measurement.i2c_reads }
+
+    return results
+
+def bench_throw_latency(turnout_count):
+    """Time to throw every turnout of a layout at once"""
+    clock = ClockVirtual()
+
+    layout = Layout(turnout_count, clock)
+    layout.bank.home(layout.turnouts)
+
+    with Measurement(clock, layout) as measurement:
+        layout.bank.set_routes(
+            [(turnout, True) for turnout in layout.turnouts])
+
+    return measurement.get_results()
+
+def bench_network(turnout_count, message_count):
+    """Command messages per second received by the network manager and
+    applied to turnouts
+    """
+    clock = ClockVirtual()
+
+    layout = Layout(turnout_count, clock, WRITE_THROUGH)
+
+    for turnout in layout.turnouts:
+        turnout.assume_route(False)
+
+    client = FakeClient()
+    net_man = NetworkManager(
+        lambda data, length: None, client, randomize_timeout=False,
+        clock=clock)
+
+    dispatcher = TurnoutDispatcher()
+    net_man.register_handler(protocol.COMMAND, dispatcher)
+
+    applied = []
+
+    def apply(turnout, diverging):
+        turnout.set_route(diverging)
+        applied.append(turnout.get_id())
+
+    for turnout in layout.turnouts:
+        dispatcher.register(
+            turnout.get_id(),
+            lambda diverging, frame, turnout=turnout: apply(turnout, diverging))
+
+    # Every message throws the next turnout to the other route
+    messages = [
+        protocol.encode(
+            protocol.COMMAND,
+            sequence % protocol.SEQUENCE_MODULO,
+            [(sequence % turnout_count, (sequence // turnout_count + 1) % 2)])
+        for sequence in range(message_count)]
+
+    net_man.search()
+    net_man.connected()
+
+    try:
+        with Measurement(clock) as measurement:
+            for data in messages:
+                client.receive(data, len(data))
+    finally:
+        net_man.shutdown()
+
+    return {
+        'turnouts': turnout_count,
+        'messages': message_count,
+        'applied': len(applied),
+        'wall_s': measurement.wall_s,
+        'messages_per_s': message_count / measurement.wall_s }
+
+def bench_startup(turnout_count):
+    """Time to build a layout and home all of its turnouts"""
+    clock = ClockVirtual()
+
+    with Measurement(clock) as measurement:
+        layout = Layout(turnout_count, clock)
+        layout.bank.home(layout.turnouts)
+
+    results = measurement.get_results()
+    results['turnouts'] = turnout_count
+    results['i2c_writes'] = layout.get_write_count()
+    results['i2c_reads'] = layout.get_read_count()
+
+    return results
+
+def run(
+    throw_counts=THROW_COUNTS,
+    network_turnouts=NETWORK_TURNOUTS,
+    network_messages=NETWORK_MESSAGES,
+    startup_turnouts=STARTUP_TURNOUTS):
+    """Run every benchmark and return the results"""
+    return {
+        'version': RESULTS_VERSION,
+        'i2c_per_route_change': dict(
+            (access, bench_i2c_per_route_change(access))
+            for access in [DIRECT, WRITE_THROUGH, DEFERRED]),
+        'throw_latency': dict(
+            (str(count), bench_throw_latency(count)) for count in throw_counts),
+        'network': bench_network(network_turnouts, network_messages),
+        'startup': bench_startup(startup_turnouts) }
+
+def flatten(results, prefix=''):
+    """Return nested results as a dict keyed by dotted paths"""
+    flat = {}
+
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + key + '.'))
+        else:
+            flat[prefix + key] = value
+
+    return flat
+
+def compare(results, baseline, tolerance):
+    """Return a description of each result worse than the baseline by more
+    than a fraction of it
+
+    Rates, named per_s, regress when they drop, everything else when it grows.
+    Wall clock times of single runs are too noisy to compare and are skipped,
+    the network rate covers wall clock regressions.
+    """
+    results = flatten(results)
+    regressions = []
+
+    for key, old in sorted(flatten(baseline).items()):
+        new = results.get(key)
+
+        if new is None or key == 'version' or key.endswith('wall_s') or not old:
+            continue
+
+        change = (new - old) / float(old)
+
+        if key.endswith('_per_s'):
+            change = -change
+
+        if change > tolerance:
+            regressions.append(
+                '%s: %g -> %g (%+.0f%%)' % (key, old, new, 100 * change))
+
+    return regressions
+
+def main(argv=None):
+    """Run the benchmarks, write the results and check for regressions"""
+    parser = argparse.ArgumentParser(description='Turnout benchmarks')
+    parser.add_argument('-o', '--output', help='write results to a file')
+    parser.add_argument('--baseline', help='results of an earlier release')
+    parser.add_argument(
+        '--tolerance', type=float, default=0.2,
+        help='fraction a result may be worse than the baseline')
+    args = parser.parse_args(argv)
+
+    results = run()
+    text = json.dumps(results, indent=2, sort_keys=True)
+
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'w') as results_file:
+            results_file.write(text + '\n')
+
+    if args.baseline is None:
+        return 0
+
+    with open(args.baseline) as baseline_file:
+        regressions = compare(results, json.load(baseline_file), args.tolerance)
+
+    for regression in regressions:
+        logging.getLogger('benchmarks').error('Regression %s', regression)
+
+    return 1 if len(regressions) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
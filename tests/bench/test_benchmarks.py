@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# test_benchmarks.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import json
+import logging
+import pytest
+
+from src.hw.servo import Servo
+
+from tests.bench import benchmarks
+
+#-------------------------------------------------------------------------------
+# Test constants
+#-------------------------------------------------------------------------------
+THROW_S = (benchmarks.ANGLE_DIV - benchmarks.ANGLE_MAIN) / float(Servo.SPEED_DEG_S)
+
+#-------------------------------------------------------------------------------
+# Benchmark tests
+#-------------------------------------------------------------------------------
+def test_i2c_deferred_board():
+    """Check that a board of turnouts costs one block write per phase"""
+    results = benchmarks.bench_i2c_per_route_change(benchmarks.DEFERRED)
+
+    assert(results['board']['i2c_writes'] == 2)
+    assert(results['board']['i2c_reads'] == 0)
+
+def test_i2c_write_through():
+    """Check that cached proxies never read the frequency back"""
+    results = benchmarks.bench_i2c_per_route_change(benchmarks.WRITE_THROUGH)
+
+    assert(results['single']['i2c_reads'] == 0)
+
+@pytest.mark.parametrize('turnout_count', [1, 16, 64])
+def test_throw_latency(turnout_count):
+    """Check that throwing any number of turnouts takes one settle period"""
+    results = benchmarks.bench_throw_latency(turnout_count)
+
+    assert(results['virtual_s'] == pytest.approx(THROW_S))
+
+def test_network():
+    """Check that every message reaches its turnout"""
+    results = benchmarks.bench_network(4, 40)
+
+    assert(results['messages'] == 40)
+    assert(results['applied'] == 40)
+    assert(results['messages_per_s'] > 0)
+
+def test_startup():
+    """Check that homing a layout takes one full sweep"""
+    results = benchmarks.bench_startup(16)
+
+    assert(results['virtual_s'] == pytest.approx(180.0 / Servo.SPEED_DEG_S))
+
+#-------------------------------------------------------------------------------
+# Result tests
+#-------------------------------------------------------------------------------
+def test_results_json(tmpdir):
+    """Check that the results are written as JSON"""
+    path = str(tmpdir.join('results.json'))
+
+    assert(benchmarks.main(['-o', path]) == 0)
+
+    with open(path) as results_file:
+        results = json.load(results_file)
+
+    assert(results['version'] == benchmarks.RESULTS_VERSION)
+    assert(sorted(results['throw_latency']) == ['1', '16', '256', '64'])
+
+def test_compare():
+    """Check that only results worse than the tolerance are reported"""
+    baseline = {
+        'version': 1,
+        'throw': { 'i2c_writes': 10, 'wall_s': 0.1 },
+        'network': { 'messages_per_s': 1000 } }
+
+    results = {
+        'version': 1,
+        'throw': { 'i2c_writes': 11, 'wall_s': 1.0 },
+        'network': { 'messages_per_s': 500 } }
+
+    regressions = benchmarks.compare(results, baseline, 0.2)
+
+    assert(len(regressions) == 1)
+    assert(regressions[0].startswith('network.messages_per_s'))
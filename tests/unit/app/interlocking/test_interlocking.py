@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# test_interlocking.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+import pytest
+import threading
+import time
+
+from src.app.interlocking.interlocking import Interlocking
+from src.clock.clock_virtual import ClockVirtual
+from src.hw.servo import Servo
+from src.hw.turnout_bank import TurnoutBank
+from src.hw.turnout_efrog_servo import TurnoutEFrogServo
+
+from tests.unit.hw.fake_gpo_provider import FakeGPOProvider
+from tests.unit.hw.pwm.fake_pwm_provider import FakePWMProvider
+
+#-------------------------------------------------------------------------------
+# Test constants
+#-------------------------------------------------------------------------------
+# A passing loop with a yard lead, turnouts 1 and 2 at either end of the
+# loop and 3 into the yard off the loop line
+ROUTES = {
+    'main':         { 1: False, 2: False },
+    'loop':         { 1: True, 2: True },
+    'loop_east':    { 2: True },
+    'main_east':    { 2: False },
+    'yard':         { 1: True, 3: True },
+    'shed':         { 4: True },
+}
+
+CONFLICTS = [('shed', 'main')]
+
+SETTLE_S = 0.1
+
+#-------------------------------------------------------------------------------
+# Test fixtures
+#-------------------------------------------------------------------------------
+@pytest.fixture
+def clock():
+    """Create a virtual clock"""
+    return ClockVirtual()
+
+@pytest.fixture
+def turnouts(clock):
+    """Create turnouts 1 to 4 set to main"""
+    return dict(
+        (turnout_id, TurnoutEFrogServo(
+            Servo(FakePWMProvider(), clock=clock), FakeGPOProvider(), 45, 135))
+        for turnout_id in range(1, 5))
+
+@pytest.fixture
+def interlocking(turnouts, clock):
+    """Create an interlocking for the passing loop"""
+    return Interlocking(
+        ROUTES, turnouts.__getitem__, CONFLICTS, TurnoutBank(clock=clock))
+
+#-------------------------------------------------------------------------------
+# Conflict tests
+#-------------------------------------------------------------------------------
+@pytest.mark.parametrize('name, other, conflict', [
+    ('main', 'loop', True),
+    ('main', 'loop_east', True),
+    ('main', 'main_east', False),
+    ('loop', 'yard', False),
+    ('main', 'yard', True),
+    ('shed', 'main', True),
+    ('shed', 'loop', False),
+])
+def test_conflicts(interlocking, name, other, conflict):
+    """Check that routes conflict when they need a turnout set differently"""
+    assert(interlocking.conflicts(name, other) == conflict)
+    assert(interlocking.conflicts(other, name) == conflict)
+
+def test_unknown_route(interlocking):
+    """Check that unknown routes are reported"""
+    with pytest.raises(KeyError):
+        interlocking.reserve('siding')
+
+    with pytest.raises(KeyError):
+        Interlocking(ROUTES, None, [('main', 'siding')])
+
+#-------------------------------------------------------------------------------
+# Reservation tests
+#-------------------------------------------------------------------------------
+def test_reserve(interlocking):
+    """Check that a conflicting route cannot be locked until released"""
+    assert(interlocking.reserve('main'))
+    assert(not interlocking.reserve('loop'))
+    assert(not interlocking.reserve('main'))
+    assert(interlocking.reserve('main_east'))
+
+    assert(interlocking.get_locked() == ['main', 'main_east'])
+
+    interlocking.release('main')
+    interlocking.release('main_east')
+
+    assert(interlocking.reserve('loop'))
+
+def test_reserve_race(interlocking):
+    """Check that two conflicting routes are never locked together"""
+    results = []
+
+    def contend(name):
+        for i in range(1000):
+            if interlocking.reserve(name):
+                results.append(interlocking.is_locked('main') and
+                    interlocking.is_locked('loop'))
+                interlocking.release(name)
+
+    threads = [
+        threading.Thread(target=contend, args=(name,))
+        for name in ['main', 'loop']]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert(not any(results))
+
+#-------------------------------------------------------------------------------
+# Route tests
+#-------------------------------------------------------------------------------
+def test_set_route(interlocking, turnouts):
+    """Check that setting a route sets its turnouts and locks it"""
+    assert(interlocking.set_route('yard'))
+
+    assert(turnouts[1].get_route() is True)
+    assert(turnouts[3].get_route() is True)
+    assert(turnouts[2].get_route() is False)
+    assert(interlocking.is_locked('yard'))
+
+def test_set_route_conflict(interlocking, turnouts):
+    """Check that a conflicting route moves nothing"""
+    interlocking.set_route('main')
+
+    assert(not interlocking.set_route('yard'))
+    assert(turnouts[3].get_route() is False)
+
+def test_set_routes_together(interlocking, clock):
+    """Check that routes that do not conflict are set in one settle period"""
+    interlocking.set_route('main')
+    interlocking.release('main')
+
+    start = clock.time()
+    assert(interlocking.set_routes(['loop', 'yard', 'main', 'shed']) ==
+        ['loop', 'yard', 'shed'])
+
+    assert(clock.time() - start == pytest.approx(90.0 / Servo.SPEED_DEG_S))
+
+def test_failed_route_released(interlocking, turnouts, mocker):
+    """Check that a route whose turnouts fail to move is not left locked"""
+    mocker.patch.object(
+        turnouts[4], 'begin_route', side_effect=RuntimeError('Servo fault'))
+
+    with pytest.raises(RuntimeError):
+        interlocking.set_route('shed')
+
+    assert(not interlocking.is_locked('shed'))
+
+def test_concurrent_routes():
+    """Check that routes set from separate threads move at the same time"""
+    servos = dict(
+        (turnout_id, TurnoutEFrogServo(
+            Servo(FakePWMProvider(), min_settle_time=SETTLE_S, speed=1e6),
+            FakeGPOProvider(), 45, 135, home=False))
+        for turnout_id in range(1, 5))
+
+    interlocking = Interlocking(ROUTES, servos.__getitem__)
+
+    threads = [
+        threading.Thread(target=interlocking.set_route, args=(name,))
+        for name in ['loop', 'shed']]
+
+    start = time.time()
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert(time.time() - start < 1.8 * SETTLE_S)
+    assert(interlocking.get_locked() == ['loop', 'shed'])
+
+def test_concurrent_shared_turnout():
+    """Check that a route sharing a moving turnout waits for it to settle"""
+    pwm_providers = dict(
+        (turnout_id, FakePWMProvider()) for turnout_id in range(1, 5))
+    turnouts = dict(
+        (turnout_id, TurnoutEFrogServo(
+            Servo(pwm, min_settle_time=SETTLE_S, speed=1e6),
+            FakeGPOProvider(), 45, 135, home=False))
+        for turnout_id, pwm in pwm_providers.items())
+
+    interlocking = Interlocking(ROUTES, turnouts.__getitem__)
+
+    thread = threading.Thread(target=interlocking.set_route, args=('loop',))
+    thread.start()
+
+    while turnouts[2].get_moving_route() is None:
+        time.sleep(0.001)
+
+    assert(turnouts[2].get_route() is None)
+
+    start = time.time()
+    assert(interlocking.set_route('loop_east'))
+
+    assert(time.time() - start > 0.5 * SETTLE_S)
+    assert(turnouts[2].get_route() is True)
+    assert(turnouts[2].get_moving_route() is None)
+    assert(pwm_providers[2].get_on_count() == 1)
+
+    thread.join()
+
+def test_set_route_in_position(interlocking, clock):
+    """Check that turnouts already in position are not moved"""
+    interlocking.set_route('main')
+    interlocking.release('main')
+
+    start = clock.time()
+    interlocking.set_route('main')
+
+    assert(clock.time() == start)
+
+def test_set_route_verify(interlocking, clock):
+    """Check that verify mode drives turnouts already in position"""
+    start = clock.time()
+    interlocking.set_route('main', verify=True)
+
+    assert(clock.time() > start)
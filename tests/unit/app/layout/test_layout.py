@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# test_layout.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import json
+import logging
+import pytest
+import time
+
+from src.app.layout.layout import Layout
+from src.app.layout.layout_config import LayoutConfig
+from src.clock.clock_virtual import ClockVirtual
+from src.hw.pwm.pca9685_registry import PCA9685Registry
+from src.hw.turnout_bank import TurnoutBank
+
+from tests.unit.hw.pwm.fake_pca9685 import FakePCA9685
+
+#-------------------------------------------------------------------------------
+# Test constants
+#-------------------------------------------------------------------------------
+BOARD_COUNT = 32
+
+#-------------------------------------------------------------------------------
+# Test helpers
+#-------------------------------------------------------------------------------
+def large_layout():
+    """Return a layout with 8 turnouts on each of many boards over 2 buses,
+    and a spare board
+    """
+    boards = [
+        { 'name': 'b%d' % i, 'bus': i % 2, 'address': 0x40 + i // 2 }
+        for i in range(BOARD_COUNT)]
+
+    boards.append({ 'name': 'spare', 'bus': 0, 'address': 0x60 })
+
+    turnouts = [
+        { 'id': i, 'board': 'b%d' % (i // 8), 'servo_pin': 2 * (i % 8),
+            'frog_pin': 2 * (i % 8) + 1, 'main': 45, 'diverging': 135 }
+        for i in range(8 * BOARD_COUNT)]
+
+    return { 'boards': boards, 'turnouts': turnouts }
+
+#-------------------------------------------------------------------------------
+# Test fixtures
+#-------------------------------------------------------------------------------
+@pytest.fixture
+def devices():
+    """Create a record of the boards opened"""
+    return {}
+
+@pytest.fixture
+def registry(devices):
+    """Create a registry of fake boards"""
+    def create(bus, address):
+        devices[(bus, address)] = FakePCA9685()
+        return devices[(bus, address)]
+
+    registry = PCA9685Registry(create)
+
+    yield registry
+
+    registry.stop()
+
+@pytest.fixture
+def layout(registry):
+    """Create a large layout on a virtual clock"""
+    config = LayoutConfig.parse(json.dumps(large_layout()))
+
+    return Layout(config, registry, ClockVirtual())
+
+#-------------------------------------------------------------------------------
+# Lazy build tests
+#-------------------------------------------------------------------------------
+def test_nothing_built(layout, devices):
+    """Check that creating a layout builds no turnouts and opens no boards"""
+    assert(len(layout) == 8 * BOARD_COUNT)
+    assert(layout.get_built_count() == 0)
+    assert(devices == {})
+
+def test_built_on_first_use(layout, devices):
+    """Check that a turnout is built once and only opens its own board"""
+    turnout = layout.get_turnout(10)
+
+    assert(layout.get_turnout(10) is turnout)
+    assert(turnout.get_id() == 10)
+    assert(layout.get_built_count() == 1)
+    assert(list(devices) == [(1, 0x40)])
+
+def test_unknown_turnout(layout):
+    """Check that a turnout not in the layout is reported"""
+    with pytest.raises(KeyError):
+        layout.get_turnout(9999)
+
+def test_home_layout(layout, registry, devices):
+    """Check that a built layout drives the configured pins"""
+    turnouts = layout.get_turnouts()
+
+    TurnoutBank([registry], ClockVirtual()).home(turnouts)
+
+    assert(all(turnout.get_route() is False for turnout in turnouts))
+    assert(len(devices) == BOARD_COUNT)
+    assert(devices[(0, 0x40)].get_pwm(0) == 0)
+
+#-------------------------------------------------------------------------------
+# Startup tests
+#-------------------------------------------------------------------------------
+def test_cached_startup(tmp_path, registry):
+    """Check that a large cached layout starts without building anything"""
+    path = str(tmp_path / 'layout.json')
+
+    with open(path, 'w') as layout_file:
+        json.dump(large_layout(), layout_file)
+
+    LayoutConfig.load(path)
+
+    start = time.perf_counter()
+    layout = Layout(LayoutConfig.load(path), registry)
+    elapsed = time.perf_counter() - start
+
+    assert(len(layout) == 8 * BOARD_COUNT)
+    assert(elapsed < 0.1)
+
+#-------------------------------------------------------------------------------
+# Reload tests
+#-------------------------------------------------------------------------------
+def changed_layout(change):
+    """Return the large layout config with a change applied"""
+    layout = large_layout()
+    change(layout['turnouts'])
+
+    return LayoutConfig.parse(json.dumps(layout))
+
+def home(layout, registry):
+    """Build and home every turnout of a layout, returns them"""
+    turnouts = layout.get_turnouts()
+    TurnoutBank([registry], ClockVirtual()).home(turnouts)
+
+    return turnouts
+
+def test_config_diff(layout):
+    """Check that a config diff finds added, removed and changed turnouts"""
+    def change(turnouts):
+        turnouts[3]['main'] = 50
+        turnouts.pop(4)
+        turnouts.append(dict(turnouts[0], id=1000, board='spare'))
+
+    config = changed_layout(change)
+
+    assert(layout.get_config().diff(config) == ([1000], [4], [3]))
+
+def test_reload_unchanged(layout, registry):
+    """Check that reloading the same config touches nothing"""
+    turnouts = home(layout, registry)
+
+    reload = layout.reload(changed_layout(lambda turnouts: None))
+
+    assert(reload == ([], [], [], []))
+    assert(layout.get_turnouts() == turnouts)
+
+def test_reload_angle(layout, registry, devices):
+    """Check that only a turnout whose set route angle changed is driven"""
+    turnouts = home(layout, registry)
+    layout.get_turnout(2).set_route(True)
+
+    def change(turnouts):
+        turnouts[1]['main'] = 60
+        turnouts[2]['main'] = 50
+
+    reload = layout.reload(changed_layout(change))
+
+    assert(reload.changed == [1, 2])
+    assert(reload.driven == [1])
+    assert(layout.get_turnout(0) is turnouts[0])
+    assert(layout.get_turnout(1) is not turnouts[1])
+    assert(layout.get_turnout(2).get_route() is True)
+
+    # The diverging frog of turnout 2 stays on
+    assert(devices[(0, 0x40)].get_pwm(5) != 0)
+
+def test_reload_keeps_frog(layout, registry, devices, mocker):
+    """Check that a rebuilt turnout on the same frog pin does not turn it off
+    """
+    home(layout, registry)
+    layout.get_turnout(2).set_route(True)
+    set_pwm = mocker.spy(devices[(0, 0x40)], 'set_pwm')
+
+    def change(turnouts):
+        turnouts[2]['main'] = 50
+
+    assert(layout.reload(changed_layout(change)).driven == [])
+
+    assert(mocker.call(5, 0) not in set_pwm.call_args_list)
+    assert(devices[(0, 0x40)].get_pwm(5) != 0)
+
+def test_reload_pins(layout, registry, devices):
+    """Check that a turnout moved to other pins releases its old frog"""
+    home(layout, registry)
+    layout.get_turnout(0).set_route(True)
+
+    def change(turnouts):
+        turnouts[0]['board'] = 'spare'
+
+    reload = layout.reload(changed_layout(change))
+
+    assert(reload.driven == [0])
+    assert(devices[(0, 0x40)].get_pwm(1) == 0)
+    assert(devices[(0, 0x60)].get_pwm(1) != 0)
+
+def test_reload_removed(layout, registry, devices):
+    """Check that a removed turnout is forgotten and its frog turned off"""
+    home(layout, registry)
+    layout.get_turnout(0).set_route(True)
+
+    layout.reload(changed_layout(lambda turnouts: turnouts.pop(0)))
+
+    assert(devices[(0, 0x40)].get_pwm(1) == 0)
+
+    with pytest.raises(KeyError):
+        layout.get_turnout(0)
+
+def test_reload_unbuilt(layout):
+    """Check that reloading does not build turnouts not yet used"""
+    def change(turnouts):
+        turnouts[0]['main'] = 50
+
+    assert(layout.reload(changed_layout(change)).driven == [])
+    assert(layout.get_built_count() == 0)
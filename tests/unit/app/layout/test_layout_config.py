@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# test_layout_config.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import copy
+import json
+import logging
+import pytest
+
+from src.app.layout import layout_config
+from src.app.layout.layout_config import LayoutConfig, Output
+from src.hw.servo import Servo
+
+from tests.unit.hw.pwm.fake_pwm_provider import FakePWMProvider
+
+#-------------------------------------------------------------------------------
+# Test constants
+#-------------------------------------------------------------------------------
+LAYOUT = {
+    'boards': [
+        { 'name': 'yard', 'bus': 1, 'address': '0x40' },
+        { 'name': 'main', 'bus': 2, 'address': 65 } ],
+    'turnouts': [
+        { 'id': 1, 'board': 'yard', 'servo_pin': 0, 'frog_pin': 1,
+            'main': 45, 'diverging': 135 },
+        { 'id': 2, 'board': 'yard', 'servo_pin': 2, 'frog_pin': 0,
+            'frog_board': 'main', 'main': 135, 'diverging': 45,
+            'servo': { 'speed': 180, 'min_pulse': 500, 'max_pulse': 2500 } } ] }
+
+#-------------------------------------------------------------------------------
+# Test helpers
+#-------------------------------------------------------------------------------
+def parse(layout):
+    """Parse a layout given as a dict"""
+    return LayoutConfig.parse(json.dumps(layout))
+
+def broken(change):
+    """Return a copy of the test layout with a change applied"""
+    layout = copy.deepcopy(LAYOUT)
+    change(layout)
+
+    return layout
+
+#-------------------------------------------------------------------------------
+# Test fixtures
+#-------------------------------------------------------------------------------
+@pytest.fixture
+def layout_path(tmp_path):
+    """Write the test layout to a file"""
+    path = tmp_path / 'layout.json'
+    path.write_text(json.dumps(LAYOUT))
+
+    return str(path)
+
+#-------------------------------------------------------------------------------
+# Parse tests
+#-------------------------------------------------------------------------------
+def test_parse():
+    """Check that boards and pins resolve to bus outputs"""
+    config = parse(LAYOUT)
+
+    assert(config.get_turnout_ids() == [1, 2])
+
+    turnout = config.get_turnout(2)
+
+    assert(turnout.servo == Output(1, 0x40, 2))
+    assert(turnout.frog == Output(2, 0x41, 0))
+    assert((turnout.main, turnout.diverging) == (135, 45))
+    assert(dict(turnout.servo_params) == {
+        'speed': 180, 'min_pulse': 500, 'max_pulse': 2500 })
+
+@pytest.mark.parametrize('change', [
+    lambda layout: layout.pop('boards'),
+    lambda layout: layout['boards'][0].update(address='0x80'),
+    lambda layout: layout['boards'][1].update(bus=1, address=64),
+    lambda layout: layout['boards'].append(dict(layout['boards'][0])),
+    lambda layout: layout['turnouts'][0].update(board='shed'),
+    lambda layout: layout['turnouts'][0].update(servo_pin=16),
+    lambda layout: layout['turnouts'][0].update(frog_pin=2),
+    lambda layout: layout['turnouts'][0].update(diverging=190),
+    lambda layout: layout['turnouts'][1].update(id=1),
+    lambda layout: layout['turnouts'][1].update(colour='red'),
+    lambda layout: layout['turnouts'][1]['servo'].update(min_pulse=3000),
+    lambda layout: layout['turnouts'][1]['servo'].update(speed='fast'),
+    lambda layout: layout['turnouts'][1]['servo'].update(speed=0),
+    lambda layout: layout['turnouts'][1]['servo'].update(stall_current=0),
+    lambda layout: layout['turnouts'][1]['servo'].update(min_pulse=0),
+    lambda layout: layout['turnouts'][1]['servo'].update(min_settle_time=-1),
+    lambda layout: layout['turnouts'][1]['servo'].update(max_pulse=20000),
+])
+def test_invalid(change):
+    """Check that layout mistakes are reported"""
+    with pytest.raises(ValueError):
+        parse(broken(change))
+
+def test_servo_bounds_usable():
+    """Check that servo calibration at its limits gives a servo that builds"""
+    layout = broken(lambda layout: layout['turnouts'][1]['servo'].update(
+        min_settle_time=0, min_pulse=1, max_pulse=19999))
+    params = dict(parse(layout).get_turnout(2).servo_params)
+
+    Servo(FakePWMProvider(), **params)
+
+def test_not_json():
+    """Check that a file that is not JSON is reported"""
+    with pytest.raises(ValueError):
+        LayoutConfig.parse('{ boards')
+
+#-------------------------------------------------------------------------------
+# Cache tests
+#-------------------------------------------------------------------------------
+def test_load_compiles_once(layout_path, mocker):
+    """Check that an unchanged layout is not parsed again"""
+    first = LayoutConfig.load(layout_path)
+
+    spy = mocker.spy(LayoutConfig, 'parse')
+    second = LayoutConfig.load(layout_path)
+
+    assert(first == second)
+    assert(not spy.called)
+
+def test_load_changed_file(layout_path):
+    """Check that a changed layout is compiled again"""
+    LayoutConfig.load(layout_path)
+
+    with open(layout_path, 'w') as layout_file:
+        json.dump(broken(lambda layout: layout['turnouts'].pop()), layout_file)
+
+    assert(LayoutConfig.load(layout_path).get_turnout_ids() == [1])
+
+def test_load_corrupt_cache(layout_path):
+    """Check that a corrupt cache is compiled again"""
+    with open(layout_path + '.cache', 'wb') as cache_file:
+        cache_file.write(b'not a pickle')
+
+    assert(len(LayoutConfig.load(layout_path)) == 2)
+
+def test_load_old_cache(layout_path, mocker):
+    """Check that a cache from an older compiled version is not used"""
+    LayoutConfig.load(layout_path)
+
+    mocker.patch.object(
+        layout_config, 'COMPILED_VERSION', layout_config.COMPILED_VERSION + 1)
+    spy = mocker.spy(LayoutConfig, 'parse')
+
+    LayoutConfig.load(layout_path)
+
+    assert(spy.called)
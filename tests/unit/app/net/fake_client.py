@@ -21,6 +21,15 @@ class FakeClient(object):
 
         self.__is_running = False
 
+        self.writable = True
+        self.writable_cb = None
+
+        # Client whose receive side gets sent data, the client itself if None
+        self.peer = None
+
+    def set_server(self, host, port):
+        self.server = (host, port)
+
     def start(self, connected_cb, disconnected_cb, data_rx_cb):
         self.__logger.debug('Starting client')
 
@@ -39,7 +48,16 @@ class FakeClient(object):
     def is_running(self):
         return self.__is_running
 
+    def is_writable(self):
+        return self.__is_running and self.writable
+
+    def set_writable_cb(self, writable_cb):
+        self.writable_cb = writable_cb
+
     def send(self, data, length):
         self.__logger.debug('Sending data back')
 
+        (self.peer or self).receive(data, length)
+
+    def receive(self, data, length):
         self.__data_rx_cb(data, length)
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# fake_discovery.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+
+class FakeDiscovery(object):
+    """Discovery test double, the test decides the outcome of a search"""
+
+    def __init__(self):
+        self.__logger = logging.getLogger('fake_discovery')
+
+        self.mode = 'idle'
+
+    def search(self, found_cb, elected_cb):
+        self.mode = 'searching'
+
+        self.found = found_cb
+        self.elected = elected_cb
+
+    def announce(self):
+        self.mode = 'serving'
+
+    def stop(self):
+        self.mode = 'idle'
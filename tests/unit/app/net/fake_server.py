@@ -21,6 +21,9 @@ class FakeServer(object):
 
         self.__is_running = False
 
+        self.writable = True
+        self.writable_cb = None
+
     def start(self, connected_cb, disconnected_cb, data_rx_cb):
         self.__logger.debug('Starting server')
 
@@ -39,6 +42,12 @@ class FakeServer(object):
     def is_running(self):
         return self.__is_running
 
+    def is_writable(self):
+        return self.__is_running and self.writable
+
+    def set_writable_cb(self, writable_cb):
+        self.writable_cb = writable_cb
+
     def send(self, data, length):
         self.__logger.debug('Sending data back')
 
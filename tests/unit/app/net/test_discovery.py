@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# test_discovery.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import asyncio
+import logging
+import pytest
+import socket
+import time
+
+from src.app.net.discovery import Discovery
+
+#-------------------------------------------------------------------------------
+# Test helpers
+#-------------------------------------------------------------------------------
+def free_ports(count):
+    """Return UDP ports free on the loopback interface"""
+    sockets = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for i in range(count)]
+
+    for sock in sockets:
+        sock.bind(('127.0.0.1', 0))
+
+    ports = [sock.getsockname()[1] for sock in sockets]
+
+    for sock in sockets:
+        sock.close()
+
+    return ports
+
+def make_nodes(node_ids, can_serve=None):
+    """Create discovery agents on loopback that all send to each other"""
+    ports = free_ports(len(node_ids))
+    can_serve = can_serve if can_serve is not None else [True] * len(node_ids)
+
+    return [
+        Discovery(
+            node_id,
+            port=port,
+            server_port=1500 + node_id,
+            targets=[('127.0.0.1', other) for other in ports if other != port],
+            can_serve=serve,
+            loop=asyncio.get_event_loop())
+        for node_id, port, serve in zip(node_ids, ports, can_serve)]
+
+async def wait_for(condition, timeout=2):
+    """Wait on the event loop until a condition holds"""
+    for i in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+
+    raise AssertionError('Timed out waiting')
+
+#-------------------------------------------------------------------------------
+# Election tests
+#-------------------------------------------------------------------------------
+@pytest.mark.asyncio
+async def test_lone_node_elected(mocker):
+    """A node that hears nothing elects itself within the election window"""
+    node, = make_nodes([1])
+    found_cb = mocker.stub()
+    elected_cb = mocker.stub()
+
+    start = time.time()
+    node.search(found_cb, elected_cb)
+
+    await wait_for(lambda: elected_cb.called)
+
+    assert(time.time() - start < 2 * Discovery.ELECTION_WINDOW_S)
+    assert(not found_cb.called)
+
+    node.stop()
+
+@pytest.mark.asyncio
+async def test_highest_id_elected(mocker):
+    """Of nodes searching together only the highest id is elected"""
+    nodes = make_nodes([3, 7, 5])
+    callbacks = [(mocker.stub(), mocker.stub()) for node in nodes]
+
+    for node, (found_cb, elected_cb) in zip(nodes, callbacks):
+        node.search(found_cb, elected_cb)
+
+    await wait_for(lambda: callbacks[1][1].called)
+    nodes[1].announce()
+
+    await wait_for(lambda: callbacks[0][0].called and callbacks[2][0].called)
+
+    callbacks[0][0].assert_called_once_with('127.0.0.1', 1507)
+    assert(not callbacks[0][1].called)
+    assert(not callbacks[2][1].called)
+
+    for node in nodes:
+        node.stop()
+
+@pytest.mark.asyncio
+async def test_client_only_not_elected(mocker):
+    """A node that cannot serve is never elected"""
+    nodes = make_nodes([9, 2], can_serve=[False, True])
+    callbacks = [(mocker.stub(), mocker.stub()) for node in nodes]
+
+    for node, (found_cb, elected_cb) in zip(nodes, callbacks):
+        node.search(found_cb, elected_cb)
+
+    await wait_for(lambda: callbacks[1][1].called)
+    assert(not callbacks[0][1].called)
+
+    for node in nodes:
+        node.stop()
+
+#-------------------------------------------------------------------------------
+# Server tests
+#-------------------------------------------------------------------------------
+@pytest.mark.asyncio
+async def test_existing_server_found(mocker):
+    """A searching node finds a serving node within a probe interval"""
+    server, client = make_nodes([1, 2])
+    found_cb = mocker.stub()
+    elected_cb = mocker.stub()
+
+    server.announce()
+    await wait_for(lambda: server.get_mode() == Discovery.SERVING)
+    await asyncio.sleep(0.05)
+
+    start = time.time()
+    client.search(found_cb, elected_cb)
+
+    await wait_for(lambda: found_cb.called)
+
+    assert(time.time() - start < Discovery.ELECTION_WINDOW_S)
+    found_cb.assert_called_once_with('127.0.0.1', 1501)
+    assert(not elected_cb.called)
+    assert(client.get_mode() == Discovery.IDLE)
+
+    server.stop()
+    client.stop()
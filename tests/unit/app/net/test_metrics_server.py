@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# test_metrics_server.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+import pytest
+import urllib.error
+import urllib.request
+
+from src.app.net.metrics_server import MetricsServer, render
+from src.hw.pwm.pca9685_metrics import PCA9685Metrics
+
+from tests.unit.hw.pwm.fake_pca9685 import FakePCA9685
+
+#-------------------------------------------------------------------------------
+# Test fixtures
+#-------------------------------------------------------------------------------
+@pytest.fixture
+def metrics():
+    """Create metrics for two fake boards with some traffic"""
+    metrics = [
+        PCA9685Metrics(FakePCA9685(), '1:0x40'),
+        PCA9685Metrics(FakePCA9685(), '1:0x41')]
+
+    metrics[0].set_pwm(3, 100)
+    metrics[0].set_pwm(3, 100)
+    metrics[1].get_pwm(0)
+
+    return metrics
+
+@pytest.fixture
+def server(metrics):
+    """Start a metrics server on a free port"""
+    server = MetricsServer(metrics, port=0)
+    server.start()
+
+    yield server
+
+    server.stop()
+
+#-------------------------------------------------------------------------------
+# Render tests
+#-------------------------------------------------------------------------------
+def test_render(metrics):
+    """Check that counts are labelled with their device and channel"""
+    text = render([source.get_snapshot() for source in metrics])
+
+    assert('# TYPE pca9685_writes_total counter' in text)
+    assert('pca9685_writes_total{channel="3",device="1:0x40"} 2' in text)
+    assert('pca9685_redundant_writes_total{channel="3",device="1:0x40"} 1' in text)
+    assert('pca9685_reads_total{channel="0",device="1:0x41"} 1' in text)
+    assert('pca9685_transaction_seconds_count{device="1:0x40",kind="write"} 2' in text)
+    assert('pca9685_transaction_seconds_bucket{device="1:0x40",kind="write",le="+Inf"} 2' in text)
+
+#-------------------------------------------------------------------------------
+# Server tests
+#-------------------------------------------------------------------------------
+def test_scrape(server):
+    """Check that the metrics are served over HTTP"""
+    url = 'http://127.0.0.1:%d/metrics' % server.get_port()
+
+    with urllib.request.urlopen(url) as response:
+        text = response.read().decode('utf-8')
+
+    assert('pca9685_writes_total{channel="3",device="1:0x40"} 2' in text)
+
+def test_unknown_path(server):
+    """Check that only the metrics path is served"""
+    url = 'http://127.0.0.1:%d/other' % server.get_port()
+
+    with pytest.raises(urllib.error.HTTPError):
+        urllib.request.urlopen(url)
+
+def test_stop(server):
+    """Check that a stopped server is no longer running"""
+    server.stop()
+
+    assert(not server.is_running())
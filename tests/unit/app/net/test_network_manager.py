@@ -10,11 +10,16 @@
 
 import logging
 import pytest
+import threading
 import time
 
+from src.app.net import protocol
 from src.app.net.network_manager import NetworkManager
+from src.app.net.outbound_queue import OutboundQueue
+from src.clock.clock_virtual import ClockVirtual
 
 from tests.unit.app.net.fake_client import FakeClient
+from tests.unit.app.net.fake_discovery import FakeDiscovery
 from tests.unit.app.net.fake_server import FakeServer
 
 #-------------------------------------------------------------------------------
@@ -30,6 +35,11 @@ def server():
     """Create a fake server object"""
     return FakeServer()
 
+@pytest.fixture
+def discovery():
+    """Create a fake discovery agent"""
+    return FakeDiscovery()
+
 @pytest.fixture(name='s_endp')
 def single_endpoint(mocker):
     """Create a single network manager endpoint mock"""
@@ -58,10 +68,14 @@ def test_invalid_client_init(s_endp):
     with pytest.raises(AttributeError):
         NetworkManager(s_endp, None)
 
-def test_client_invalid_endpoint_init(client):
-    """Check that initialization with an invalid endpoint fails"""
-    with pytest.raises(AttributeError):
-        NetworkManager(None, client, discovery_timeout=0.1, randomize_timeout=False)
+def test_client_no_endpoint_init(client):
+    """Check that a network manager can be created without endpoints"""
+    net_man = NetworkManager(
+        client=client, discovery_timeout=0.1, randomize_timeout=False)
+    net_man.search()
+    client.connected()
+
+    net_man.send(b'Test', 4)
 
 def test_discovery_timeout_randomizer(s_endp, client):
     """Check that discovery timeout randomizer falls within limits"""
@@ -171,6 +185,105 @@ def test_cs_connected_server_disconnect(nm_client_server, client, server):
     assert not server.is_running()
     assert 'searching' == nm_client_server.state
 
+#-------------------------------------------------------------------------------
+# Discovery tests
+#-------------------------------------------------------------------------------
+@pytest.fixture(name='nm_discovery')
+def nm_discovery(s_endp, client, server, discovery):
+    """Create a client-server network manager with discovery"""
+    return NetworkManager(
+        s_endp, client=client, server=server, discovery_timeout=0.1,
+        randomize_timeout=False, discovery=discovery)
+
+def test_disc_search(nm_discovery, client, server, discovery):
+    """Searching with discovery waits for a server before starting the client"""
+    nm_discovery.search()
+    assert('searching' == discovery.mode)
+    assert(not client.is_running())
+    assert(not server.is_running())
+
+def test_disc_found(nm_discovery, client, server, discovery):
+    """A discovered server is connected to by the client"""
+    nm_discovery.search()
+    discovery.found('10.0.0.2', 1507)
+
+    assert(client.is_running())
+    assert(client.server == ('10.0.0.2', 1507))
+
+    client.connected()
+    assert('connected' == nm_discovery.state)
+
+def test_disc_elected(nm_discovery, client, server, discovery):
+    """An elected node starts serving and announces itself"""
+    nm_discovery.search()
+    discovery.elected()
+
+    assert(server.is_running())
+    assert(not client.is_running())
+    assert('serving' == discovery.mode)
+
+def test_disc_elected_then_timeout(nm_discovery, server, discovery, mocker):
+    """The discovery timeout does not restart an elected server"""
+    nm_discovery.search()
+    discovery.elected()
+    mocker.spy(server, 'start')
+
+    time.sleep(nm_discovery.discovery_timeout + 0.05)
+
+    assert(server.is_running())
+    assert(not server.start.called)
+
+def test_disc_elected_with_timeout(nm_discovery, server, discovery, mocker):
+    """Election racing the discovery timeout starts the server only once"""
+    start = server.start
+
+    def slow_start(*args):
+        time.sleep(0.01)
+        start(*args)
+
+    mocker.patch.object(server, 'start', side_effect=slow_start)
+
+    nm_discovery.search()
+
+    threads = [
+        threading.Thread(target=discovery.elected),
+        threading.Thread(target=nm_discovery.search_timeout)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert(server.is_running())
+    assert(server.start.call_count == 1)
+
+def test_disc_timeout_fallback(nm_discovery, server, discovery):
+    """The discovery timeout still starts the server if nothing is heard"""
+    nm_discovery.search()
+    time.sleep(nm_discovery.discovery_timeout + 0.05)
+
+    assert(server.is_running())
+    assert('serving' == discovery.mode)
+
+def test_disc_found_after_connect(nm_discovery, client, server, discovery):
+    """A late discovery result is ignored once connected"""
+    nm_discovery.search()
+    discovery.elected()
+    server.connected()
+
+    discovery.found('10.0.0.2', 1507)
+
+    assert(server.is_running())
+    assert(not client.is_running())
+
+def test_disc_shutdown(nm_discovery, discovery):
+    """Shutting down stops discovery"""
+    nm_discovery.search()
+    nm_discovery.shutdown()
+
+    assert('idle' == discovery.mode)
+
 #-------------------------------------------------------------------------------
 # Communication tests
 #-------------------------------------------------------------------------------
@@ -215,3 +328,323 @@ def test_server_transmission(s_endp, client, server):
     net_man.send('Test', 4)
 
     s_endp.assert_called_once_with('Test', 4)
+
+#-------------------------------------------------------------------------------
+# Dispatch tests
+#-------------------------------------------------------------------------------
+def test_dispatch_by_type(s_endp, client, mocker):
+    """Check that frames only reach handlers for their message type"""
+    net_man = NetworkManager(s_endp, client, discovery_timeout=0.1, randomize_timeout=False)
+    command_handler = mocker.stub()
+    state_handler = mocker.stub()
+
+    net_man.register_handler(protocol.COMMAND, command_handler)
+    net_man.register_handler(protocol.STATE, state_handler)
+    net_man.search()
+    client.connected()
+
+    frame = protocol.encode(protocol.COMMAND, 0, [(1, 1)])
+    net_man.send(frame, len(frame))
+
+    assert(not s_endp.called)
+    assert(command_handler.call_count == 1)
+    assert(not state_handler.called)
+    assert(list(command_handler.call_args[0][0]) == [(1, 1)])
+
+def test_dispatch_unhandled_to_endpoints(s_endp, client, mocker):
+    """Check that only frames without handlers reach the endpoints"""
+    net_man = NetworkManager(s_endp, client, discovery_timeout=0.1, randomize_timeout=False)
+    handler = mocker.stub()
+
+    net_man.register_handler(protocol.COMMAND, handler)
+    net_man.search()
+    client.connected()
+
+    command = protocol.encode(protocol.COMMAND, 0, [(1, 1)])
+    state = protocol.encode(protocol.STATE, 0, [(2, 0)])
+    net_man.send(command + state + command, 2 * len(command) + len(state))
+
+    assert(handler.call_count == 2)
+    s_endp.assert_called_once_with(state, len(state))
+
+def test_dispatch_unregister(s_endp, client, mocker):
+    """Check that an unregistered handler is no longer called"""
+    net_man = NetworkManager(s_endp, client, discovery_timeout=0.1, randomize_timeout=False)
+    handler = mocker.stub()
+
+    net_man.register_handler(protocol.COMMAND, handler)
+    net_man.unregister_handler(protocol.COMMAND, handler)
+    net_man.search()
+    client.connected()
+
+    frame = protocol.encode(protocol.COMMAND, 0, [(1, 1)])
+    net_man.send(frame, len(frame))
+
+    assert(not handler.called)
+
+def test_dispatch_invalid_frame(s_endp, client, mocker):
+    """Check that malformed data still reaches the endpoints only"""
+    net_man = NetworkManager(s_endp, client, discovery_timeout=0.1, randomize_timeout=False)
+    handler = mocker.stub()
+
+    net_man.register_handler(protocol.COMMAND, handler)
+    net_man.search()
+    client.connected()
+
+    net_man.send(b'Test', 4)
+
+    s_endp.assert_called_once_with(b'Test', 4)
+    assert(not handler.called)
+
+def test_dispatch_handler_failure(s_endp, client, mocker):
+    """Check that a failing handler does not stop the frames that follow"""
+    net_man = NetworkManager(s_endp, client, discovery_timeout=0.1, randomize_timeout=False)
+    failing_handler = mocker.stub()
+    failing_handler.side_effect = ValueError('Bad command')
+    handler = mocker.stub()
+
+    net_man.register_handler(protocol.COMMAND, failing_handler)
+    net_man.register_handler(protocol.COMMAND, handler)
+    net_man.search()
+    client.connected()
+
+    frames = protocol.encode(protocol.COMMAND, 0, [(1, 1)]) + \
+        protocol.encode(protocol.COMMAND, 0, [(2, 0)])
+    net_man.send(frames, len(frames))
+
+    assert(failing_handler.call_count == 2)
+    assert(handler.call_count == 2)
+
+def test_register_unknown_type(s_endp, client, mocker):
+    """Check that handlers can only be registered for known message types"""
+    net_man = NetworkManager(s_endp, client, discovery_timeout=0.1, randomize_timeout=False)
+
+    with pytest.raises(AttributeError):
+        net_man.register_handler(99, mocker.stub())
+
+#-------------------------------------------------------------------------------
+# Batching tests
+#-------------------------------------------------------------------------------
+@pytest.fixture(name='nm_batching')
+def nm_batching(s_endp, client):
+    """Create a connected client network manager that batches sends"""
+    net_man = NetworkManager(
+        s_endp, client, discovery_timeout=0.1, randomize_timeout=False,
+        batch_size=8, batch_interval=0.05)
+    net_man.search()
+    client.connected()
+    return net_man
+
+def test_batch_size_flush(nm_batching, s_endp):
+    """Check that buffered sends go out together once the batch is full"""
+    nm_batching.send(b'abcd', 4)
+    assert(not s_endp.called)
+
+    nm_batching.send(b'efghij', 4)
+    s_endp.assert_called_once_with(b'abcdefgh', 8)
+
+def test_batch_interval_flush(nm_batching, s_endp):
+    """Check that a partial batch goes out after the batch interval"""
+    nm_batching.send(b'abc', 3)
+    nm_batching.send(b'de', 2)
+    assert(not s_endp.called)
+
+    time.sleep(0.1)
+    s_endp.assert_called_once_with(b'abcde', 5)
+
+def test_batch_forced_flush(nm_batching, s_endp):
+    """Check that a flush sends buffered data straight away"""
+    nm_batching.send(b'abc', 3)
+    nm_batching.flush()
+    s_endp.assert_called_once_with(b'abc', 3)
+
+    time.sleep(0.1)
+    assert(s_endp.call_count == 1)
+
+def test_batch_discarded_on_disconnect(nm_batching, s_endp, client):
+    """Check that data buffered when the connection drops is not sent later"""
+    nm_batching.send(b'abc', 3)
+    client.disconnected()
+    client.connected()
+    nm_batching.flush()
+
+    assert(not s_endp.called)
+
+def test_batch_frames(s_endp, client, mocker):
+    """Check that batched frames are still dispatched one by one"""
+    net_man = NetworkManager(
+        s_endp, client, discovery_timeout=0.1, randomize_timeout=False,
+        batch_size=1024)
+    handler = mocker.stub()
+    net_man.register_handler(protocol.STATE, handler)
+    net_man.search()
+    client.connected()
+
+    for turnout_id in range(20):
+        frame = protocol.encode(protocol.STATE, turnout_id, [(turnout_id, 1)])
+        net_man.send(frame, len(frame))
+
+    net_man.flush()
+
+    assert(not s_endp.called)
+    assert(handler.call_count == 20)
+
+#-------------------------------------------------------------------------------
+# Outbound queue tests
+#-------------------------------------------------------------------------------
+@pytest.fixture(name='nm_queued')
+def nm_queued(s_endp, client):
+    """Create a client network manager with a coalescing outbound queue"""
+    return NetworkManager(
+        s_endp, client, discovery_timeout=0.1, randomize_timeout=False,
+        outbound_queue=OutboundQueue(4, OutboundQueue.COALESCE))
+
+def test_queue_while_searching(nm_queued, s_endp, client):
+    """Check that data sent while searching is sent once connected"""
+    nm_queued.search()
+    nm_queued.send(b'abc', 3)
+    assert(not s_endp.called)
+
+    client.connected()
+    s_endp.assert_called_once_with(b'abc', 3)
+
+def test_queue_coalesce_while_disconnected(nm_queued, s_endp, client):
+    """Check that only the latest state of a turnout survives a reconnect"""
+    nm_queued.search()
+    client.connected()
+    client.disconnected()
+
+    nm_queued.send(b'1-main', 6, key=1)
+    nm_queued.send(b'1-div', 5, key=1)
+
+    client.connected()
+    s_endp.assert_called_once_with(b'1-div', 5)
+
+def test_queue_slow_peer(nm_queued, s_endp, client):
+    """Check that sending waits for the role to become writable"""
+    nm_queued.search()
+    client.connected()
+    client.writable = False
+
+    nm_queued.send(b'abc', 3)
+    assert(not s_endp.called)
+
+    client.writable = True
+    client.writable_cb()
+    s_endp.assert_called_once_with(b'abc', 3)
+
+def test_queue_drain_bounded(nm_queued, s_endp, client, mocker):
+    """Check that draining stops once the role holds enough data"""
+    nm_queued.search()
+    client.writable = False
+
+    for key in range(3):
+        nm_queued.send(b'abc', 3, key=key)
+
+    mocker.patch.object(client, 'send', side_effect=lambda data, length:
+        setattr(client, 'writable', False))
+
+    client.connected()
+    client.writable = True
+    client.writable_cb()
+
+    assert(client.send.call_count == 1)
+    assert(len(nm_queued._NetworkManager__queue) == 2)
+
+def test_queue_disconnect_mid_drain(nm_queued, s_endp, client, mocker):
+    """Check that data is kept if the role is lost while draining"""
+    nm_queued.search()
+    client.connected()
+    client.writable = False
+
+    nm_queued.send(b'abc', 3)
+
+    def lost():
+        client.disconnected()
+        return True
+
+    mocker.patch.object(client, 'is_writable', side_effect=lost)
+    client.writable_cb()
+
+    assert('searching' == nm_queued.state)
+    assert(not s_endp.called)
+
+    mocker.stopall()
+    client.writable = True
+    client.connected()
+
+    s_endp.assert_called_once_with(b'abc', 3)
+
+#-------------------------------------------------------------------------------
+# Virtual time tests
+#-------------------------------------------------------------------------------
+def test_virtual_search_timeout(s_endp, client, server):
+    """Check that the discovery timeout runs on the given clock"""
+    clock = ClockVirtual()
+    net_man = NetworkManager(
+        s_endp, client, server, discovery_timeout=10, randomize_timeout=False,
+        clock=clock)
+
+    net_man.search()
+    clock.advance(9)
+    assert(client.is_running())
+
+    clock.advance(1)
+    assert(server.is_running())
+
+def test_virtual_server_failed(s_endp, client, server):
+    """Check that a server role that cannot start sends the node searching"""
+    clock = ClockVirtual()
+    net_man = NetworkManager(
+        s_endp, client, server, discovery_timeout=10, randomize_timeout=False,
+        clock=clock)
+
+    net_man.search()
+    clock.advance(10)
+    assert(server.is_running())
+
+    server.stop()
+    server.disconnected()
+
+    assert('searching' == net_man.state)
+    assert(client.is_running())
+    assert(clock.get_pending_count() == 1)
+
+    clock.advance(10)
+    assert(server.is_running())
+
+def test_virtual_reconnect_cycles(s_endp, client, server):
+    """Check that many reconnects leave a single discovery timeout pending"""
+    clock = ClockVirtual()
+    net_man = NetworkManager(
+        s_endp, client, server, discovery_timeout=10, randomize_timeout=False,
+        clock=clock)
+
+    net_man.search()
+
+    for cycle in range(1000):
+        client.connected()
+        clock.advance(60)
+        client.disconnected()
+        clock.advance(5)
+
+    assert(client.is_running())
+    assert(clock.get_pending_count() == 1)
+    assert(clock.time() == 65000)
+
+def test_virtual_batch_interval(s_endp, client):
+    """Check that batched data is sent once the interval passes on the clock"""
+    clock = ClockVirtual()
+    net_man = NetworkManager(
+        s_endp, client, discovery_timeout=10, randomize_timeout=False,
+        batch_size=100, batch_interval=1, clock=clock)
+
+    net_man.search()
+    client.connected()
+    net_man.send(b'abc', 3)
+
+    clock.advance(0.5)
+    assert(not s_endp.called)
+
+    clock.advance(0.5)
+    s_endp.assert_called_once_with(b'abc', 3)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# test_outbound_queue.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+import pytest
+
+from src.app.net.outbound_queue import OutboundQueue
+
+#-------------------------------------------------------------------------------
+# Test helpers
+#-------------------------------------------------------------------------------
+def drain(queue):
+    """Return every queued message in order"""
+    messages = []
+
+    while len(queue):
+        messages.append(queue.pop())
+
+    return messages
+
+#-------------------------------------------------------------------------------
+# Init tests
+#-------------------------------------------------------------------------------
+def test_invalid_depth():
+    """Check that a queue must hold something"""
+    with pytest.raises(AttributeError):
+        OutboundQueue(0)
+
+def test_invalid_policy():
+    """Check that only known policies are accepted"""
+    with pytest.raises(AttributeError):
+        OutboundQueue(4, 'drop_newest')
+
+#-------------------------------------------------------------------------------
+# Drop policy tests
+#-------------------------------------------------------------------------------
+def test_fifo():
+    """Check that messages come out in the order they went in"""
+    queue = OutboundQueue(4)
+
+    for message in [b'a', b'b', b'c']:
+        assert(queue.put(message))
+
+    assert(drain(queue) == [b'a', b'b', b'c'])
+    assert(queue.pop() is None)
+
+def test_drop_oldest():
+    """Check that a full queue drops its oldest message"""
+    queue = OutboundQueue(2)
+
+    queue.put(b'a')
+    queue.put(b'b')
+
+    assert(not queue.put(b'c'))
+    assert(drain(queue) == [b'b', b'c'])
+    assert(queue.get_metrics()['dropped'] == 1)
+
+def test_requeue_at_front():
+    """Check that a message put back is the next one out"""
+    queue = OutboundQueue(4)
+
+    queue.put(b'a')
+    queue.put(b'b')
+
+    assert(queue.requeue(queue.pop()))
+    assert(drain(queue) == [b'a', b'b'])
+    assert(queue.get_metrics()['sent'] == 2)
+
+def test_requeue_full():
+    """Check that a message put back into a full queue is dropped"""
+    queue = OutboundQueue(2)
+
+    queue.put(b'a')
+    queue.put(b'b')
+    message = queue.pop()
+    queue.put(b'c')
+
+    assert(not queue.requeue(message))
+    assert(drain(queue) == [b'b', b'c'])
+    assert(queue.get_metrics()['dropped'] == 1)
+
+def test_keys_ignored_without_coalesce():
+    """Check that keys do not merge messages with the drop oldest policy"""
+    queue = OutboundQueue(4)
+
+    queue.put(b'a', key=1)
+    queue.put(b'b', key=1)
+
+    assert(drain(queue) == [b'a', b'b'])
+
+#-------------------------------------------------------------------------------
+# Coalesce policy tests
+#-------------------------------------------------------------------------------
+def test_coalesce_by_key():
+    """Check that the latest message for a key replaces the queued one"""
+    queue = OutboundQueue(4, OutboundQueue.COALESCE)
+
+    queue.put(b'1-main', key=1)
+    queue.put(b'2-main', key=2)
+    queue.put(b'1-div', key=1)
+    queue.put(b'other')
+
+    assert(drain(queue) == [b'1-div', b'2-main', b'other'])
+    assert(queue.get_metrics()['coalesced'] == 1)
+
+def test_coalesce_bounded():
+    """Check that many turnouts still cannot overflow the queue"""
+    queue = OutboundQueue(3, OutboundQueue.COALESCE)
+
+    for turnout_id in range(5):
+        queue.put(bytes([turnout_id]), key=turnout_id)
+
+    assert(drain(queue) == [b'\x02', b'\x03', b'\x04'])
+
+#-------------------------------------------------------------------------------
+# Backpressure tests
+#-------------------------------------------------------------------------------
+def test_backpressure(mocker):
+    """Check that producers are told when to hold back and when to resume"""
+    backpressure_cb = mocker.stub()
+    queue = OutboundQueue(8, backpressure_cb=backpressure_cb)
+
+    for i in range(6):
+        queue.put(b'x')
+
+    backpressure_cb.assert_called_once_with(True)
+    assert(queue.is_congested())
+
+    for i in range(4):
+        queue.pop()
+
+    backpressure_cb.assert_called_with(False)
+    assert(backpressure_cb.call_count == 2)
+    assert(not queue.is_congested())
+
+def test_metrics():
+    """Check the queue depth metrics"""
+    queue = OutboundQueue(4)
+
+    for i in range(3):
+        queue.put(b'x')
+
+    queue.pop()
+
+    metrics = queue.get_metrics()
+
+    assert(metrics['depth'] == 2)
+    assert(metrics['peak_depth'] == 3)
+    assert(metrics['enqueued'] == 3)
+    assert(metrics['sent'] == 1)
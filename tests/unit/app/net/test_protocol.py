@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# test_protocol.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+import pytest
+
+from src.app.net import protocol
+
+#-------------------------------------------------------------------------------
+# Test constants
+#-------------------------------------------------------------------------------
+ROUTE = [(1, True), (2, False), (300, True)]
+
+#-------------------------------------------------------------------------------
+# Encode tests
+#-------------------------------------------------------------------------------
+def test_encode_layout():
+    """Check the header and record layout on the wire"""
+    frame = protocol.encode(protocol.COMMAND, 0x0102, [(0x0304, 1)])
+
+    assert(frame == b'TT\x01\x01\x01\x02\x00\x01\x03\x04\x01')
+
+def test_encode_too_many_records():
+    """Check that a frame cannot hold more records than the count allows"""
+    with pytest.raises(ValueError):
+        protocol.encode(
+            protocol.STATE, 0, [(0, 0)] * (protocol.MAX_RECORDS + 1))
+
+def test_encoder_sequence():
+    """Check that the encoder numbers frames and wraps"""
+    encoder = protocol.FrameEncoder(protocol.SEQUENCE_MODULO - 1)
+
+    first = protocol.parse(encoder.encode(protocol.STATE, []))
+    second = protocol.parse(encoder.encode(protocol.STATE, []))
+
+    assert(first.sequence == protocol.SEQUENCE_MODULO - 1)
+    assert(second.sequence == 0)
+
+#-------------------------------------------------------------------------------
+# Parse tests
+#-------------------------------------------------------------------------------
+def test_round_trip():
+    """Check that a route update survives encoding and parsing"""
+    frame = protocol.parse(protocol.encode(protocol.COMMAND, 7, ROUTE))
+
+    assert(frame.msg_type == protocol.COMMAND)
+    assert(frame.sequence == 7)
+    assert(frame.count == len(ROUTE))
+    assert(list(frame) == [(i, int(d)) for i, d in ROUTE])
+    assert(frame.get_record(2) == (300, 1))
+
+def test_parse_no_copy():
+    """Check that records are read from the receive buffer itself"""
+    data = bytearray(protocol.encode(protocol.COMMAND, 0, [(1, 0)]))
+    frame = protocol.parse(data)
+
+    data[-1] = 1
+
+    assert(frame.get_record(0) == (1, 1))
+
+@pytest.mark.parametrize("data", [
+    b'TT\x01',
+    b'XX\x01\x01\x00\x00\x00\x00',
+    b'TT\x02\x01\x00\x00\x00\x00',
+    b'TT\x01\x63\x00\x00\x00\x00',
+    b'TT\x01\x01\x00\x00\x00\x02\x00\x01\x01'])
+def test_parse_invalid(data):
+    """Check that malformed frames are rejected"""
+    with pytest.raises(ValueError):
+        protocol.parse(data)
+
+def test_iter_frames():
+    """Check that frames sent back to back can be split"""
+    data = (protocol.encode(protocol.COMMAND, 1, ROUTE) +
+        protocol.encode(protocol.STATE, 2, ROUTE[:1]))
+
+    frames = list(protocol.iter_frames(data))
+
+    assert([frame.sequence for frame in frames] == [1, 2])
+    assert([frame.count for frame in frames] == [3, 1])
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# test_state_sync.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+import pytest
+
+from src.app.net import protocol
+from src.app.net.network_manager import NetworkManager
+from src.app.net.state_sync import StateSync
+from src.app.net.turnout_state_table import TurnoutStateTable
+
+from tests.unit.app.net.fake_client import FakeClient
+
+#-------------------------------------------------------------------------------
+# Test helpers
+#-------------------------------------------------------------------------------
+class Node(object):
+    """A network manager with a state table and sync agent"""
+
+    def __init__(self, mocker, epoch):
+        self.client = FakeClient()
+        self.endpoint = mocker.stub()
+        self.route_cb = mocker.stub()
+
+        self.net_man = NetworkManager(
+            self.endpoint, self.client, discovery_timeout=10,
+            randomize_timeout=False)
+
+        self.table = TurnoutStateTable(epoch)
+        self.sync = StateSync(self.net_man, self.table, self.route_cb)
+
+        # Records and size of every received sync frame
+        self.received = []
+
+        for msg_type in [
+            protocol.SYNC_REQUEST, protocol.SYNC_DELTA, protocol.SYNC_VERSION]:
+            self.net_man.register_handler(msg_type, self.__record)
+
+    def received_records(self, msg_type):
+        """Return the records of every received frame of a message type"""
+        return [
+            record
+            for frame_type, records, length in self.received
+            if frame_type == msg_type
+            for record in records]
+
+    def __record(self, frame):
+        """Keep a received frame"""
+        self.received.append((frame.msg_type, list(frame), len(frame)))
+
+def connect(node_a, node_b):
+    """Connect two nodes, node b answers the request of node a"""
+    for node in [node_a, node_b]:
+        del node.received[:]
+
+        if node.net_man.state == 'initializing':
+            node.net_man.search()
+
+    # Node b connects first, its own request loops back and is ignored
+    node_b.client.peer = None
+    node_b.net_man.connected()
+
+    node_a.client.peer = node_b.client
+    node_b.client.peer = node_a.client
+    node_a.net_man.connected()
+
+def disconnect(node_a, node_b):
+    """Disconnect two nodes"""
+    for node in [node_a, node_b]:
+        node.net_man.disconnected()
+
+#-------------------------------------------------------------------------------
+# Test fixtures
+#-------------------------------------------------------------------------------
+@pytest.fixture
+def nodes(mocker):
+    """Create two nodes with 100 turnouts each and no shared history"""
+    nodes = (Node(mocker, 1), Node(mocker, 2))
+
+    for turnout_id in range(100):
+        nodes[0].table.set_route(turnout_id, False)
+
+    for turnout_id in range(100, 200):
+        nodes[1].table.set_route(turnout_id, True)
+
+    yield nodes
+
+    for node in nodes:
+        node.net_man.shutdown()
+
+#-------------------------------------------------------------------------------
+# Sync tests
+#-------------------------------------------------------------------------------
+def test_first_sync(nodes):
+    """Check that nodes that never synced exchange full snapshots"""
+    node_a, node_b = nodes
+
+    connect(node_a, node_b)
+
+    assert(node_a.table.get_routes() == node_b.table.get_routes())
+    assert(len(node_a.table.get_routes()) == 200)
+    assert(node_a.sync.get_acked_version(2) == 100)
+    assert(node_b.sync.get_acked_version(1) == 200)
+
+    node_a.route_cb.assert_any_call(150, True)
+    assert(node_a.route_cb.call_count == 100)
+
+def test_unknown_route(nodes):
+    """Check that a route that is not known syncs as not known"""
+    node_a, node_b = nodes
+
+    connect(node_a, node_b)
+    disconnect(node_a, node_b)
+
+    node_b.table.set_route(150, None)
+
+    connect(node_a, node_b)
+
+    assert(node_a.table.get_route(150) is None)
+    assert(node_a.received_records(protocol.SYNC_DELTA)[0][:2] == (
+        150, protocol.UNKNOWN))
+    node_a.route_cb.assert_called_with(150, None)
+
+def test_resync_delta(nodes):
+    """Check that a reconnect only exchanges changes made while apart"""
+    node_a, node_b = nodes
+
+    connect(node_a, node_b)
+    disconnect(node_a, node_b)
+
+    node_a.table.set_route(5, True)
+    node_b.table.set_route(150, False)
+    node_b.table.set_route(151, False)
+
+    connect(node_a, node_b)
+
+    assert(node_a.table.get_routes() == node_b.table.get_routes())
+    assert(node_a.table.get_route(150) is False)
+    assert(node_b.table.get_route(5) is True)
+
+    # Only the changes travel, not the 200 turnouts
+    assert([r[0] for r in node_a.received_records(protocol.SYNC_DELTA)] ==
+        [150, 151])
+    assert([r[0] for r in node_b.received_records(protocol.SYNC_DELTA)] ==
+        [5])
+
+def test_conflict(nodes):
+    """Check that both nodes keep the same route when both changed it"""
+    node_a, node_b = nodes
+
+    connect(node_a, node_b)
+    disconnect(node_a, node_b)
+
+    node_a.table.set_route(5, True)
+    node_b.table.set_route(5, True)
+    node_b.table.set_route(5, False)
+
+    connect(node_a, node_b)
+
+    assert(node_a.table.get_route(5) is False)
+    assert(node_b.table.get_route(5) is False)
+
+def test_resync_unchanged(nodes):
+    """Check that reconnecting without changes sends no entries"""
+    node_a, node_b = nodes
+
+    connect(node_a, node_b)
+    disconnect(node_a, node_b)
+    connect(node_a, node_b)
+
+    assert(node_a.received_records(protocol.SYNC_DELTA) == [])
+    assert(node_b.received_records(protocol.SYNC_DELTA) == [])
+
+def test_restarted_peer(nodes, mocker):
+    """Check that a peer with a new epoch gets a full snapshot"""
+    node_a, node_b = nodes
+
+    connect(node_a, node_b)
+    disconnect(node_a, node_b)
+
+    node_b.net_man.shutdown()
+    restarted = Node(mocker, 3)
+    connect(node_a, restarted)
+
+    assert(len(restarted.table.get_routes()) == 200)
+    assert(len(restarted.received_records(protocol.SYNC_DELTA)) == 200)
+
+    restarted.net_man.shutdown()
+
+def test_large_snapshot_split(nodes):
+    """Check that a snapshot too big for one message is sent in several"""
+    node_a, node_b = nodes
+
+    for turnout_id in range(200, 20000):
+        node_b.table.set_route(turnout_id, turnout_id % 2)
+
+    connect(node_a, node_b)
+
+    assert(node_a.table.get_routes() == node_b.table.get_routes())
+    assert(node_a.sync.get_acked_version(2) == 19900)
+
+    lengths = [length for msg_type, records, length in node_a.received]
+
+    assert(len(lengths) > 1)
+    assert(max(lengths) <= StateSync.MAX_MESSAGE)
+
+def test_gap_not_acked(nodes):
+    """Check that a delta from a newer base than acknowledged is not acked"""
+    node_a, node_b = nodes
+
+    data = protocol.encode(protocol.SYNC_VERSION, 0, [(9, 5, 10)])
+
+    node_a.net_man.search()
+    node_a.net_man.connected()
+    node_a.client.receive(data, len(data))
+
+    assert(node_a.sync.get_acked_version(9) is None)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# test_tcp_client.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import asyncio
+import logging
+import pytest
+
+from src.app.net.tcp_client import TCPClient
+
+#-------------------------------------------------------------------------------
+# Test helpers
+#-------------------------------------------------------------------------------
+async def wait_for(condition, timeout=2):
+    """Wait on the event loop until a condition holds"""
+    for i in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+
+    raise AssertionError('Timed out waiting')
+
+#-------------------------------------------------------------------------------
+# Test fixtures
+#-------------------------------------------------------------------------------
+@pytest.fixture
+def callbacks(mocker):
+    """Role callbacks for the client"""
+    return [mocker.stub(), mocker.stub(), mocker.stub()]
+
+async def start_peer():
+    """Start a plain asyncio server that echoes what it is sent"""
+    peer = {'writers': []}
+
+    async def echo(reader, writer):
+        peer['writers'].append(writer)
+
+        while True:
+            data = await reader.read(100)
+
+            if not data:
+                break
+
+            writer.write(data)
+
+        writer.close()
+
+    peer['server'] = await asyncio.start_server(echo, '127.0.0.1', 0)
+    peer['port'] = peer['server'].sockets[0].getsockname()[1]
+
+    return peer
+
+async def start_client(callbacks):
+    """Start a client connected to a new echo server"""
+    peer = await start_peer()
+
+    client = TCPClient('127.0.0.1', peer['port'], asyncio.get_event_loop())
+    client.start(*callbacks)
+
+    await wait_for(lambda: callbacks[0].called)
+
+    return client, peer
+
+def stop_client(client, peer):
+    """Stop a client and its echo server"""
+    client.stop()
+    peer['server'].close()
+
+#-------------------------------------------------------------------------------
+# Client tests
+#-------------------------------------------------------------------------------
+@pytest.mark.asyncio
+async def test_client_connect(callbacks):
+    """Check that the client reports the connection"""
+    client, peer = await start_client(callbacks)
+
+    assert(client.is_running())
+
+    stop_client(client, peer)
+
+@pytest.mark.asyncio
+async def test_client_echo(callbacks):
+    """Check that sent data is framed and received data is unframed"""
+    connected_cb, disconnected_cb, data_rx_cb = callbacks
+    client, peer = await start_client(callbacks)
+
+    client.send(b'Test data', 4)
+
+    await wait_for(lambda: data_rx_cb.called)
+    data_rx_cb.assert_called_once_with(b'Test', 4)
+
+    stop_client(client, peer)
+
+@pytest.mark.asyncio
+async def test_client_server_lost(callbacks):
+    """Check that losing the server is reported"""
+    connected_cb, disconnected_cb, data_rx_cb = callbacks
+    client, peer = await start_client(callbacks)
+
+    peer['writers'][0].close()
+
+    await wait_for(lambda: disconnected_cb.called)
+
+    stop_client(client, peer)
+
+@pytest.mark.asyncio
+async def test_client_stop_not_reported(callbacks):
+    """Check that stopping the client is not reported as a disconnect"""
+    connected_cb, disconnected_cb, data_rx_cb = callbacks
+    client, peer = await start_client(callbacks)
+
+    stop_client(client, peer)
+    await asyncio.sleep(0.05)
+
+    assert(not client.is_running())
+    assert(not disconnected_cb.called)
+
+@pytest.mark.asyncio
+async def test_client_backpressure(callbacks, mocker):
+    """Check that the client reports when a slow server catches up"""
+    readers = []
+    server = await asyncio.start_server(
+        lambda reader, writer: readers.append(reader), '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+
+    client = TCPClient('127.0.0.1', port, asyncio.get_event_loop())
+    writable_cb = mocker.stub()
+    client.set_writable_cb(writable_cb)
+    client.start(*callbacks)
+    await wait_for(lambda: callbacks[0].called and len(readers))
+
+    # Fill the socket while the server is not reading
+    message = bytes(0x8000)
+
+    for i in range(1000):
+        if not client.is_writable():
+            break
+
+        client.send(message, len(message))
+        await asyncio.sleep(0)
+
+    assert(not client.is_writable())
+    assert(not writable_cb.called)
+
+    while not writable_cb.called:
+        await asyncio.wait_for(readers[0].read(0x100000), 2)
+
+    assert(client.is_writable())
+
+    client.stop()
+    server.close()
+
+@pytest.mark.asyncio
+async def test_client_pending_not_writable(callbacks, mocker):
+    """Check that data not yet written by the event loop holds the client"""
+    mocker.patch.object(TCPClient, 'MAX_PENDING', 16)
+    client, peer = await start_client(callbacks)
+
+    writable_cb = mocker.stub()
+    client.set_writable_cb(writable_cb)
+
+    client.send(b'0123456789abcdef', 16)
+    assert(not client.is_writable())
+
+    await wait_for(lambda: writable_cb.called)
+    assert(client.is_writable())
+
+    stop_client(client, peer)
+
+@pytest.mark.asyncio
+async def test_client_retry(callbacks, mocker):
+    """Check that the client keeps trying until the server appears"""
+    connected_cb, disconnected_cb, data_rx_cb = callbacks
+    mocker.patch.object(TCPClient, 'RETRY_INTERVAL_S', 0.01)
+
+    server = await asyncio.start_server(lambda r, w: None, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    server.close()
+    await server.wait_closed()
+
+    client = TCPClient('127.0.0.1', port, asyncio.get_event_loop())
+    client.start(*callbacks)
+    await asyncio.sleep(0.05)
+
+    assert(not connected_cb.called)
+
+    server = await asyncio.start_server(lambda r, w: None, '127.0.0.1', port)
+    await wait_for(lambda: connected_cb.called)
+
+    client.stop()
+    server.close()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# test_tcp_connection.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+import pytest
+
+from src.app.net.tcp_connection import TCPConnection
+
+#-------------------------------------------------------------------------------
+# Test fixtures
+#-------------------------------------------------------------------------------
+@pytest.fixture
+def transport(mocker):
+    """Transport test double"""
+    return mocker.Mock()
+
+@pytest.fixture
+def received():
+    """Messages received by the connection"""
+    return []
+
+@pytest.fixture
+def connection(transport, received, mocker):
+    """Create an open connection"""
+    connection = TCPConnection(
+        mocker.stub(),
+        lambda conn, data, length: received.append((data, length)),
+        mocker.stub())
+    connection.connection_made(transport)
+    return connection
+
+def framed(data):
+    """Return a message with its length prefix"""
+    return TCPConnection.LENGTH.pack(len(data)) + data
+
+#-------------------------------------------------------------------------------
+# Framing tests
+#-------------------------------------------------------------------------------
+def test_send_framed(connection, transport):
+    """Check that sent messages get a length prefix"""
+    connection.send(b'Test')
+
+    transport.writelines.assert_called_once_with([b'\x00\x00\x00\x04', b'Test'])
+
+def test_receive_split(connection, received):
+    """Check that a message split across reads is put back together"""
+    data = framed(b'Test')
+
+    connection.data_received(data[:3])
+    assert(received == [])
+
+    connection.data_received(data[3:])
+    assert(received == [(b'Test', 4)])
+
+def test_receive_many(connection, received):
+    """Check that several messages in one read are all delivered"""
+    connection.data_received(framed(b'One') + framed(b'Two') + framed(b'T'))
+
+    assert(received == [(b'One', 3), (b'Two', 3), (b'T', 1)])
+
+def test_receive_too_long(connection, received, transport):
+    """Check that an oversized message closes the connection"""
+    connection.data_received(
+        TCPConnection.LENGTH.pack(TCPConnection.MAX_MESSAGE + 1))
+
+    assert(received == [])
+    transport.close.assert_called_once_with()
+
+#-------------------------------------------------------------------------------
+# Flow control tests
+#-------------------------------------------------------------------------------
+def test_flow_control(transport, mocker):
+    """Check that a full send buffer is reported until it drains"""
+    writable_cb = mocker.stub()
+    connection = TCPConnection(
+        mocker.stub(), mocker.stub(), mocker.stub(), writable_cb)
+    connection.connection_made(transport)
+
+    assert(connection.is_writable())
+
+    connection.pause_writing()
+    assert(not connection.is_writable())
+
+    connection.resume_writing()
+    assert(connection.is_writable())
+    writable_cb.assert_called_once_with(connection)
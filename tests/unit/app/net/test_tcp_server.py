@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# test_tcp_server.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import asyncio
+import logging
+import pytest
+
+from src.app.net.tcp_client import TCPClient
+from src.app.net.tcp_server import TCPServer
+
+#-------------------------------------------------------------------------------
+# Test helpers
+#-------------------------------------------------------------------------------
+async def wait_for(condition, timeout=2):
+    """Wait on the event loop until a condition holds"""
+    for i in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+
+    raise AssertionError('Timed out waiting')
+
+#-------------------------------------------------------------------------------
+# Test fixtures
+#-------------------------------------------------------------------------------
+@pytest.fixture
+def callbacks(mocker):
+    """Role callbacks for the server"""
+    return [mocker.stub(), mocker.stub(), mocker.stub()]
+
+async def start_server(callbacks):
+    """Create a server on a free loopback port"""
+    server = TCPServer('127.0.0.1', 0, asyncio.get_event_loop())
+    server.start(*callbacks)
+
+    await wait_for(lambda: server.get_port() is not None)
+
+    return server
+
+def make_client(server, mocker):
+    """Create a client for the server with its own callbacks"""
+    client = TCPClient('127.0.0.1', server.get_port(), asyncio.get_event_loop())
+    client.start(mocker.stub(), mocker.stub(), mocker.stub())
+    return client
+
+#-------------------------------------------------------------------------------
+# Server tests
+#-------------------------------------------------------------------------------
+@pytest.mark.asyncio
+async def test_server_start_stop(callbacks):
+    """Check that the server listens while running"""
+    server = await start_server(callbacks)
+    assert(server.is_running())
+
+    server.stop()
+    await wait_for(lambda: server.get_port() is None)
+
+    assert(not server.is_running())
+
+@pytest.mark.asyncio
+async def test_server_port_in_use(callbacks, mocker):
+    """Check that a server unable to listen stops and reports it"""
+    server = await start_server(callbacks)
+    other_callbacks = [mocker.stub(), mocker.stub(), mocker.stub()]
+
+    other = TCPServer('127.0.0.1', server.get_port(), asyncio.get_event_loop())
+    other.start(*other_callbacks)
+
+    await wait_for(lambda: other_callbacks[1].called)
+
+    assert(not other.is_running())
+    assert(other.get_port() is None)
+
+    server.stop()
+
+@pytest.mark.asyncio
+async def test_server_many_clients(callbacks, mocker):
+    """Check that the server is connected while it has any client"""
+    connected_cb, disconnected_cb, data_rx_cb = callbacks
+    server = await start_server(callbacks)
+
+    clients = [make_client(server, mocker) for i in range(5)]
+
+    await wait_for(lambda: server.get_connection_count() == 5)
+    assert(connected_cb.call_count == 1)
+
+    for client in clients[1:]:
+        client.stop()
+
+    await wait_for(lambda: server.get_connection_count() == 1)
+    assert(not disconnected_cb.called)
+
+    clients[0].stop()
+
+    await wait_for(lambda: disconnected_cb.called)
+
+    server.stop()
+
+@pytest.mark.asyncio
+async def test_server_round_trip(callbacks, mocker):
+    """Check that data flows both ways between server and clients"""
+    connected_cb, disconnected_cb, data_rx_cb = callbacks
+    server = await start_server(callbacks)
+
+    clients = [make_client(server, mocker) for i in range(2)]
+    await wait_for(lambda: server.get_connection_count() == 2)
+
+    clients[0].send(b'Request', 7)
+    await wait_for(lambda: data_rx_cb.called)
+    data_rx_cb.assert_called_once_with(b'Request', 7)
+
+    server.send(b'Reply', 5)
+
+    for client in clients:
+        await wait_for(lambda: client._TCPClient__data_rx_cb.called)
+        client._TCPClient__data_rx_cb.assert_called_once_with(b'Reply', 5)
+        client.stop()
+
+    server.stop()
+
+@pytest.mark.asyncio
+async def test_server_slow_client(callbacks, mocker):
+    """Check that a slow client only holds back its own queue"""
+    server = TCPServer('127.0.0.1', 0, asyncio.get_event_loop(), queue_depth=4)
+    server.start(*callbacks)
+    await wait_for(lambda: server.get_port() is not None)
+
+    clients = [make_client(server, mocker) for i in range(2)]
+    await wait_for(lambda: server.get_connection_count() == 2)
+
+    slow_connection = list(server._TCPServer__connections)[0]
+    slow_connection.pause_writing()
+
+    for message in [b'0', b'1', b'2', b'3', b'4', b'5']:
+        server.send(message, 1)
+
+    data_rx_cbs = [client._TCPClient__data_rx_cb for client in clients]
+    await wait_for(lambda: any(cb.call_count == 6 for cb in data_rx_cbs))
+
+    assert(server.is_writable())
+
+    slow_cb = [cb for cb in data_rx_cbs if cb.call_count != 6][0]
+    assert(not slow_cb.called)
+
+    # The slow client gets the newest messages its queue could hold
+    slow_connection.resume_writing()
+
+    await wait_for(lambda: slow_cb.call_count == 4)
+    assert([args[0][0] for args in slow_cb.call_args_list] ==
+        [b'2', b'3', b'4', b'5'])
+
+    for client in clients:
+        client.stop()
+
+    server.stop()
+
+@pytest.mark.asyncio
+async def test_server_stop_closes_clients(callbacks, mocker):
+    """Check that stopping the server disconnects its clients"""
+    server = await start_server(callbacks)
+    client_disconnected_cb = mocker.stub()
+
+    client = TCPClient('127.0.0.1', server.get_port(), asyncio.get_event_loop())
+    client.start(mocker.stub(), client_disconnected_cb, mocker.stub())
+    await wait_for(lambda: server.get_connection_count() == 1)
+
+    server.stop()
+
+    await wait_for(lambda: client_disconnected_cb.called)
+    assert(not callbacks[1].called)
+
+    client.stop()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# test_turnout_dispatcher.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+import pytest
+
+from src.app.net import protocol
+from src.app.net.turnout_dispatcher import TurnoutDispatcher
+
+#-------------------------------------------------------------------------------
+# Test fixtures
+#-------------------------------------------------------------------------------
+@pytest.fixture
+def dispatcher():
+    """Create an empty dispatcher"""
+    return TurnoutDispatcher()
+
+@pytest.fixture
+def handlers(dispatcher, mocker):
+    """Register handlers for turnouts 1 to 3"""
+    handlers = {}
+
+    for turnout_id in range(1, 4):
+        handlers[turnout_id] = mocker.stub()
+        dispatcher.register(turnout_id, handlers[turnout_id])
+
+    return handlers
+
+#-------------------------------------------------------------------------------
+# Dispatch tests
+#-------------------------------------------------------------------------------
+def test_dispatch_records(dispatcher, handlers):
+    """Check that each record reaches only the handler of its turnout"""
+    frame = protocol.parse(
+        protocol.encode(protocol.COMMAND, 0, [(1, True), (3, False), (9, True)]))
+
+    dispatcher(frame)
+
+    handlers[1].assert_called_once_with(True, frame)
+    handlers[3].assert_called_once_with(False, frame)
+    assert(not handlers[2].called)
+
+def test_register_twice(dispatcher, handlers, mocker):
+    """Check that a turnout can only have one handler"""
+    with pytest.raises(AttributeError):
+        dispatcher.register(1, mocker.stub())
+
+def test_unregister(dispatcher, handlers):
+    """Check that an unregistered turnout is skipped"""
+    dispatcher.unregister(1)
+
+    dispatcher(protocol.parse(protocol.encode(protocol.COMMAND, 0, [(1, True)])))
+
+    assert(not handlers[1].called)
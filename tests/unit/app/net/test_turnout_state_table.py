@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# test_turnout_state_table.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+import pytest
+
+from src.app.net.turnout_state_table import TurnoutStateTable
+
+#-------------------------------------------------------------------------------
+# Test fixtures
+#-------------------------------------------------------------------------------
+@pytest.fixture
+def table():
+    """Create a table with turnouts 1 to 3 set to main"""
+    table = TurnoutStateTable(epoch=7)
+
+    for turnout_id in range(1, 4):
+        table.set_route(turnout_id, False)
+
+    return table
+
+#-------------------------------------------------------------------------------
+# Route tests
+#-------------------------------------------------------------------------------
+def test_random_epoch():
+    """Check that tables get a non zero epoch"""
+    assert(TurnoutStateTable().get_epoch() > 0)
+
+def test_routes(table):
+    """Check the routes recorded in the table"""
+    assert(table.get_routes() == {1: False, 2: False, 3: False})
+    assert(table.get_route(9) is None)
+    assert(table.get_version() == 3)
+
+def test_unchanged_route(table):
+    """Check that recording the same route does not bump the version"""
+    assert(not table.set_route(1, False))
+    assert(table.get_version() == 3)
+
+#-------------------------------------------------------------------------------
+# Change tests
+#-------------------------------------------------------------------------------
+def test_full_snapshot(table):
+    """Check that changes since version 0 cover every turnout"""
+    assert(table.get_changes() == [(1, False, 1, 7), (2, False, 2, 7), (3, False, 3, 7)])
+
+def test_changes_since(table):
+    """Check that only entries changed after a version are returned"""
+    table.set_route(2, True)
+    table.set_route(1, True)
+
+    assert(table.get_changes(3) == [(2, True, 4, 7), (1, True, 5, 7)])
+    assert(table.get_changes(4) == [(1, True, 5, 7)])
+    assert(table.get_changes(5) == [])
+
+def test_exclude_origin(table):
+    """Check that changes can be filtered by the table they came from"""
+    table.set_route(2, True, origin=9)
+    table.set_route(1, True)
+
+    assert(table.get_changes(3, exclude=9) == [(1, True, 5, 7)])
+    assert(table.get_changes(3)[0] == (2, True, 4, 9))
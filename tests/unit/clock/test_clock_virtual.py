@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# test_clock_virtual.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+import pytest
+import time
+
+from src.clock.clock import Clock
+from src.clock.clock_virtual import ClockVirtual
+
+#-------------------------------------------------------------------------------
+# Test fixtures
+#-------------------------------------------------------------------------------
+@pytest.fixture
+def clock():
+    """Create a virtual clock"""
+    return ClockVirtual()
+
+#-------------------------------------------------------------------------------
+# System clock tests
+#-------------------------------------------------------------------------------
+def test_system_call_later(mocker):
+    """Check that a system clock timer runs on its own thread"""
+    callback = mocker.stub()
+
+    Clock().call_later(0.01, callback, 1)
+    time.sleep(0.1)
+
+    callback.assert_called_once_with(1)
+
+def test_system_cancel(mocker):
+    """Check that a cancelled system clock timer does not run"""
+    callback = mocker.stub()
+
+    Clock().call_later(0.05, callback).cancel()
+    time.sleep(0.1)
+
+    assert(not callback.called)
+
+#-------------------------------------------------------------------------------
+# Virtual time tests
+#-------------------------------------------------------------------------------
+def test_sleep(clock):
+    """Check that sleeping advances the time without blocking"""
+    start = time.perf_counter()
+    clock.sleep(3600)
+
+    assert(time.perf_counter() - start < 1)
+    assert(clock.time() == 3600)
+
+def test_timers_in_order(clock):
+    """Check that timers run in time order as the clock advances"""
+    runs = []
+
+    clock.call_later(2, lambda: runs.append(('b', clock.time())))
+    clock.call_later(1, lambda: runs.append(('a', clock.time())))
+    clock.call_later(5, lambda: runs.append(('c', clock.time())))
+
+    assert(clock.advance(3) == 2)
+    assert(runs == [('a', 1), ('b', 2)])
+    assert(clock.time() == 3)
+    assert(clock.get_pending_count() == 1)
+
+def test_cancel(clock, mocker):
+    """Check that a cancelled timer does not run"""
+    callback = mocker.stub()
+
+    clock.call_later(1, callback).cancel()
+
+    assert(clock.run() == 0)
+    assert(not callback.called)
+
+def test_timer_schedules_timer(clock):
+    """Check that a timer can schedule more timers that run in turn"""
+    ticks = []
+
+    def tick():
+        ticks.append(clock.time())
+
+        if len(ticks) < 1000:
+            clock.call_later(0.5, tick)
+
+    clock.call_later(0.5, tick)
+
+    assert(clock.run() == 1000)
+    assert(clock.time() == 500)
+
+def test_sleep_runs_timers(clock, mocker):
+    """Check that timers due during a sleep run before it returns"""
+    callback = mocker.stub()
+
+    clock.call_later(0.5, callback, 'off')
+    clock.sleep(1)
+
+    callback.assert_called_once_with('off')
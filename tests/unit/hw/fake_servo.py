@@ -8,16 +8,22 @@
 # 2018
 #-------------------------------------------------------------------------------
 
+import asyncio
 import logging
 
 class FakeServo(object):
     """Servo test double implementation"""
 
-    def __init__(self):
+    def __init__(self, stall_current=650):
         """Create a servo test double, angle initialized to 90 degrees"""
         self.__logger = logging.getLogger('fake_servo')
 
+        self.__stall_current = stall_current
+
         self.__angle = 90
+        self.__moving = False
+        self.__assumed = False
+        self.__move_count = 0
 
     def set_angle(self, angle):
         """Move servo to desired angle"""
@@ -25,10 +31,50 @@ class FakeServo(object):
         assert(angle <= 180)
 
         self.__angle = angle
+        self.__assumed = False
+        self.__move_count += 1
+
+    def set_angle_async(self, angle):
+        """Move servo to desired angle, returns an already settled future"""
+        self.set_angle(angle)
+
+        settled = asyncio.get_event_loop().create_future()
+        settled.set_result(None)
+
+        return settled
+
+    def get_stall_current(self):
+        """Return the stall current in mA"""
+        return self.__stall_current
+
+    def assume_angle(self, angle):
+        """Take the servo to be at an angle without moving it"""
+        self.__angle = angle
+        self.__assumed = True
+
+    def is_assumed(self):
+        """Return whether the angle was assumed rather than moved to"""
+        return self.__assumed
+
+    def begin_move(self, angle):
+        """Start moving servo to desired angle, no time is needed to settle"""
+        self.set_angle(angle)
+        self.__moving = True
+
+        return 0
+
+    def end_move(self):
+        """Finish moving the servo"""
+        self.__moving = False
+
+    def is_moving(self):
+        """Return whether a move has been started and not finished"""
+        return self.__moving
 
     def get_angle(self):
         """Return current servo angle"""
         return self.__angle
 
-
-
+    def get_move_count(self):
+        """Return the number of times the servo has been moved"""
+        return self.__move_count
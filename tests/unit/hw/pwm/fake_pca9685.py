@@ -10,33 +10,59 @@
 
 import logging
 
+from src.hw.pwm.pca9685_frame import PCA9685Frame
+
 class FakePCA9685(object):
-    """
-    """
+    """PCA9685 test double that counts bus transactions"""
 
     def __init__(self):
-        """
-        """
+        """Create a PCA9685 test double with all channels off"""
         self.__logger = logging.getLogger('fake_pca9685')
         self.__freq = 0
         self.__duty = 0
+        self.__pins = {}
+        self.__reads = 0
+        self.__writes = 0
 
     def get_pwm_frequency(self):
-        """
-        """
+        """Return the PWM frequency, counts as a bus read"""
+        self.__reads += 1
         return self.__freq
 
     def set_pwm_frequency(self, freq):
-        """
-        """
+        """Set the PWM frequency, counts as a bus write"""
+        self.__writes += 1
         self.__freq = freq
 
-    def get_pwm(self):
-        """
+    def get_pwm(self, pin=None):
+        """Return the duty of a pin, or the last duty written if no pin given
         """
-        return self.__duty
+        if pin is None:
+            return self.__duty
+
+        self.__reads += 1
+        return self.__pins.get(pin, 0)
 
     def set_pwm(self, pin, duty):
-        """
-        """
+        """Set the duty of a pin, counts as a bus write"""
+        self.__writes += 1
         self.__duty = duty
+        self.__pins[pin] = duty
+
+    def write_block(self, register, data):
+        """Write a run of channel registers, counts as a single bus write"""
+        self.__writes += 1
+
+        first_pin = PCA9685Frame.pin(register)
+
+        for offset, duty in enumerate(PCA9685Frame.decode(data)):
+            self.__duty = duty
+            self.__pins[first_pin + offset] = duty
+
+    def get_read_count(self):
+        """Return the number of bus reads"""
+        return self.__reads
+
+    def get_write_count(self):
+        """Return the number of bus writes"""
+        return self.__writes
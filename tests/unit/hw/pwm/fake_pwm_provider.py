@@ -14,15 +14,16 @@ import time
 from src.hw.pwm.pwm_provider import PWMProvider
 
 class FakePWMProvider(PWMProvider):
-    """
-    """
+    """PWM provider test double with the resolution of a PCA9685"""
+
+    RESOLUTION = 0x0FFF
 
     def __init__(self):
-        """
-        """
+        """Create a PWM provider test double with the output off"""
         self.__logger = logging.getLogger('fake_pwm_provider')
         self.__freq = 0
         self.__duty = 0
+        self.__raw_duty = 0
         self.__on_count = 0
         self.__output_enabled = False
 
@@ -34,6 +35,20 @@ class FakePWMProvider(PWMProvider):
         """Set the duty cycle of the PWM provider"""
         self.__logger.info('Duty Cycle: %d', duty)
         self.__duty = duty
+        self.__raw_duty = int(duty * self.RESOLUTION / 100)
+
+    def get_resolution(self):
+        """Return the raw duty count that gives a 100% duty cycle"""
+        return self.RESOLUTION
+
+    def get_raw_duty(self):
+        """Return the current duty cycle as a raw count"""
+        return self.__raw_duty
+
+    def set_raw_duty(self, count):
+        """Set the duty cycle as a raw count"""
+        self.__raw_duty = count
+        self.__duty = count * 100.0 / self.RESOLUTION
 
     def get_freq(self):
         """Return the current frequency"""
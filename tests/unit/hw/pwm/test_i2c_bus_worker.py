@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# test_i2c_bus_worker.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+import pytest
+import threading
+
+from src.hw.pwm.i2c_bus_worker import I2CBusWorker
+
+#-------------------------------------------------------------------------------
+# Test fixtures
+#-------------------------------------------------------------------------------
+@pytest.fixture
+def worker():
+    """Create a worker for bus 1"""
+    worker = I2CBusWorker(1)
+
+    yield worker
+
+    worker.stop()
+
+#-------------------------------------------------------------------------------
+# Ordering tests
+#-------------------------------------------------------------------------------
+def test_order_kept(worker):
+    """Check that transactions run in the order they were queued"""
+    runs = []
+
+    for i in range(100):
+        worker.post(runs.append, i)
+
+    worker.sync()
+
+    assert(runs == list(range(100)))
+
+def test_runs_on_worker_thread(worker):
+    """Check that transactions do not run on the calling thread"""
+    assert(worker.call(threading.current_thread) is not threading.current_thread())
+
+def test_call_from_worker(worker):
+    """Check that a transaction can make calls on its own bus"""
+    assert(worker.call(lambda: worker.call(lambda: 5)) == 5)
+
+#-------------------------------------------------------------------------------
+# Failure tests
+#-------------------------------------------------------------------------------
+def test_call_failure(worker):
+    """Check that a failed call raises in the caller"""
+    def fail():
+        raise IOError('No ack')
+
+    with pytest.raises(IOError):
+        worker.call(fail)
+
+def test_post_failure(worker):
+    """Check that a failed post is raised once by the next sync"""
+    def fail():
+        raise IOError('No ack')
+
+    worker.post(fail)
+
+    with pytest.raises(IOError):
+        worker.sync()
+
+    worker.sync()
+
+def test_stopped(worker):
+    """Check that a stopped worker refuses transactions"""
+    worker.stop()
+
+    with pytest.raises(RuntimeError):
+        worker.call(lambda: None)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# test_pca9685_frame.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+import pytest
+
+from src.hw.pwm.pca9685_frame import PCA9685Frame
+
+#-------------------------------------------------------------------------------
+# Test fixtures
+#-------------------------------------------------------------------------------
+@pytest.fixture
+def frame():
+    """Creates an empty frame"""
+    return PCA9685Frame()
+
+#-------------------------------------------------------------------------------
+# Register tests
+#-------------------------------------------------------------------------------
+@pytest.mark.parametrize("pin, register", [(0, 0x06), (1, 0x0A), (15, 0x42)])
+def test_register(pin, register):
+    """Check that channels map onto the LEDn_ON_L registers"""
+    assert(PCA9685Frame.register(pin) == register)
+    assert(PCA9685Frame.pin(register) == pin)
+
+def test_pin_misaligned():
+    """Check that a register inside a channel is rejected"""
+    with pytest.raises(AssertionError):
+        PCA9685Frame.pin(0x07)
+
+#-------------------------------------------------------------------------------
+# Channel tests
+#-------------------------------------------------------------------------------
+def test_channel_layout(frame):
+    """Check that a channel is laid out as ON_L, ON_H, OFF_L, OFF_H"""
+    frame.set_channel(1, 0x0123)
+
+    register, data = frame.get_span(1, 1)
+
+    assert(register == 0x0A)
+    assert(bytes(data) == b'\x00\x00\x23\x01')
+    assert(frame.get_channel(1) == 0x0123)
+
+def test_full_span(frame):
+    """Check that all channels make one contiguous block"""
+    for pin in range(PCA9685Frame.CHANNELS):
+        frame.set_channel(pin, pin * 100)
+
+    register, data = frame.get_span(0, PCA9685Frame.CHANNELS - 1)
+
+    assert(register == PCA9685Frame.LED0_ON_L)
+    assert(len(data) == 64)
+    assert(PCA9685Frame.decode(data) == [pin * 100 for pin in range(16)])
+
+def test_invalid_pin(frame):
+    """Check that a channel outside the chip is rejected"""
+    with pytest.raises(AssertionError):
+        frame.set_channel(16, 0)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# test_pca9685_metrics.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+import pytest
+
+from src.clock.clock_virtual import ClockVirtual
+from src.hw.pwm.pca9685_frame import PCA9685Frame
+from src.hw.pwm.pca9685_metrics import LatencyHistogram, PCA9685Metrics
+from src.hw.pwm.pca9685_proxy import PCA9685Proxy
+
+from tests.unit.hw.pwm.fake_pca9685 import FakePCA9685
+
+#-------------------------------------------------------------------------------
+# Test helpers
+#-------------------------------------------------------------------------------
+class SlowPCA9685(FakePCA9685):
+    """Fake PCA9685 whose writes take time on a virtual clock"""
+
+    def __init__(self, clock, write_s):
+        super(SlowPCA9685, self).__init__()
+
+        self.__clock = clock
+        self.__write_s = write_s
+
+    def set_pwm(self, pin, duty):
+        self.__clock.sleep(self.__write_s)
+        super(SlowPCA9685, self).set_pwm(pin, duty)
+
+#-------------------------------------------------------------------------------
+# Test fixtures
+#-------------------------------------------------------------------------------
+@pytest.fixture
+def device():
+    """Creates a fake PCA9685"""
+    return FakePCA9685()
+
+@pytest.fixture
+def metrics(device):
+    """Creates metrics for the fake PCA9685"""
+    return PCA9685Metrics(device, '1:0x40')
+
+#-------------------------------------------------------------------------------
+# Count tests
+#-------------------------------------------------------------------------------
+def test_channel_counts(metrics, device):
+    """Check that reads and writes are counted per channel"""
+    metrics.set_pwm(3, 100)
+    metrics.set_pwm(3, 200)
+    metrics.get_pwm(3)
+    metrics.set_pwm(4, 100)
+
+    snapshot = metrics.get_snapshot()
+
+    assert(snapshot['device'] == '1:0x40')
+    assert(snapshot['writes'] == 3)
+    assert(snapshot['reads'] == 1)
+    assert(snapshot['channels'][3] == {
+        'reads': 1, 'writes': 2, 'redundant_writes': 0 })
+    assert(snapshot['channels'][4]['writes'] == 1)
+    assert(device.get_pwm(3) == 200)
+
+def test_redundant_writes(metrics):
+    """Check that writes of the value already written are counted"""
+    metrics.set_pwm(0, 100)
+    metrics.set_pwm(0, 100)
+    metrics.set_pwm_frequency(50)
+    metrics.set_pwm_frequency(50)
+
+    snapshot = metrics.get_snapshot()
+
+    assert(snapshot['redundant_writes'] == 2)
+    assert(snapshot['channels'][0]['redundant_writes'] == 1)
+
+def test_block_write(metrics, device):
+    """Check that a block write is one transaction covering its channels"""
+    frame = PCA9685Frame()
+
+    for pin in range(2, 5):
+        frame.set_channel(pin, 100)
+
+    metrics.write_block(*frame.get_span(2, 4))
+
+    snapshot = metrics.get_snapshot()
+
+    assert(snapshot['writes'] == 1)
+    assert(snapshot['latency']['block_write']['count'] == 1)
+    assert(snapshot['channels'][3]['writes'] == 1)
+    assert(device.get_pwm(4) == 100)
+
+def test_behind_proxy(device):
+    """Check that only traffic the proxy lets through is counted"""
+    metrics = PCA9685Metrics(device, '1:0x40')
+    proxy = PCA9685Proxy(metrics)
+
+    proxy.set_pwm(0, 100)
+    proxy.set_pwm(0, 100)
+
+    assert(metrics.get_snapshot()['writes'] == 1)
+
+#-------------------------------------------------------------------------------
+# Latency tests
+#-------------------------------------------------------------------------------
+def test_latency(mocker):
+    """Check that transaction latency is recorded in the histogram"""
+    clock = ClockVirtual()
+    metrics = PCA9685Metrics(SlowPCA9685(clock, 0.002), '1:0x40', clock)
+
+    for pin in range(4):
+        metrics.set_pwm(pin, 100)
+
+    snapshot = metrics.get_snapshot()
+    latency = snapshot['latency']['write']
+
+    assert(latency['count'] == 4)
+    assert(latency['sum'] == pytest.approx(0.008))
+    assert(dict(latency['buckets'])[0.001] == 0)
+    assert(dict(latency['buckets'])[0.0025] == 4)
+    assert(snapshot['busy_s'] == pytest.approx(0.008))
+
+def test_histogram_buckets():
+    """Check that bucket counts are cumulative and include an overflow"""
+    histogram = LatencyHistogram([1, 2])
+
+    for seconds in [0.5, 1, 1.5, 3]:
+        histogram.observe(seconds)
+
+    assert(histogram.get_snapshot()['buckets'] == [(1, 2), (2, 3), (None, 4)])
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# test_pca9685_proxy.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+import pytest
+
+from tests.unit.hw.pwm.fake_pca9685 import FakePCA9685
+from src.hw.pwm.pca9685_proxy import PCA9685Proxy
+from src.hw.pwm.pwm_provider_pca9685 import PWMProviderPCA9685
+
+#-------------------------------------------------------------------------------
+# Test fixtures
+#-------------------------------------------------------------------------------
+@pytest.fixture()
+def device():
+    """Creates a fake PCA9685 to be used during the test"""
+    return FakePCA9685()
+
+@pytest.fixture
+def proxy(device):
+    """Creates a write through proxy for the fake PCA9685"""
+    return PCA9685Proxy(device)
+
+@pytest.fixture
+def deferred_proxy(device):
+    """Creates a deferred proxy for the fake PCA9685"""
+    return PCA9685Proxy(device, write_through=False)
+
+#-------------------------------------------------------------------------------
+# Sharing tests
+#-------------------------------------------------------------------------------
+def test_shared_proxy_per_device(device):
+    """Check that the same device always gets the same proxy"""
+    assert(PCA9685Proxy.shared(device) is PCA9685Proxy.shared(device))
+    assert(PCA9685Proxy.shared(device) is not PCA9685Proxy.shared(FakePCA9685()))
+
+#-------------------------------------------------------------------------------
+# Frequency tests
+#-------------------------------------------------------------------------------
+def test_freq_read_once(proxy, device):
+    """Check that the frequency is only read from the chip once"""
+    proxy.get_pwm_frequency()
+    proxy.get_pwm_frequency()
+    proxy.set_pwm_frequency(50)
+    proxy.get_pwm_frequency()
+
+    assert(device.get_read_count() == 1)
+    assert(proxy.get_pwm_frequency() == 50)
+
+def test_freq_same_prescale_dropped(proxy, device):
+    """Check that frequencies with the same prescaler are not written"""
+    proxy.set_pwm_frequency(50)
+    proxy.set_pwm_frequency(50)
+
+    assert(PCA9685Proxy.prescale(50) == PCA9685Proxy.prescale(50.1))
+    proxy.set_pwm_frequency(50.1)
+
+    assert(device.get_write_count() == 1)
+    assert(proxy.get_dropped_write_count() == 2)
+
+def test_freq_out_of_range(proxy, device):
+    """Check that frequencies the prescaler cannot reach are rejected"""
+    for freq in [0, -50, 1, 2000]:
+        with pytest.raises(AssertionError):
+            proxy.set_pwm_frequency(freq)
+
+    assert(device.get_write_count() == 0)
+
+#-------------------------------------------------------------------------------
+# Write through tests
+#-------------------------------------------------------------------------------
+def test_write_through(proxy, device):
+    """Check that changed channels are written straight away"""
+    proxy.set_pwm(3, 100)
+
+    assert(device.get_pwm(3) == 100)
+    assert(proxy.get_dirty_channels() == [])
+
+def test_write_through_unchanged_dropped(proxy, device):
+    """Check that writing the same duty twice only hits the chip once"""
+    proxy.set_pwm(3, 100)
+    proxy.set_pwm(3, 100)
+
+    assert(device.get_write_count() == 1)
+    assert(proxy.get_dropped_write_count() == 1)
+
+def test_read_from_shadow(proxy, device):
+    """Check that reads of written channels do not touch the chip"""
+    proxy.set_pwm(3, 100)
+
+    assert(proxy.get_pwm(3) == 100)
+    assert(device.get_read_count() == 0)
+
+def test_invalidate(proxy, device):
+    """Check that an invalidated shadow is read back from the chip"""
+    proxy.set_pwm(3, 100)
+    proxy.invalidate()
+
+    assert(proxy.get_pwm(3) == 100)
+    assert(device.get_read_count() == 1)
+
+#-------------------------------------------------------------------------------
+# Deferred tests
+#-------------------------------------------------------------------------------
+def test_deferred_dirty_until_flush(deferred_proxy, device):
+    """Check that deferred writes wait for a flush"""
+    deferred_proxy.set_pwm(1, 100)
+    deferred_proxy.set_pwm(2, 200)
+
+    assert(device.get_write_count() == 0)
+    assert(deferred_proxy.get_dirty_channels() == [1, 2])
+    assert(deferred_proxy.get_pwm(2) == 200)
+
+    deferred_proxy.flush()
+
+    assert(device.get_write_count() == 2)
+    assert(device.get_pwm(1) == 100)
+    assert(device.get_pwm(2) == 200)
+    assert(deferred_proxy.get_dirty_channels() == [])
+
+def test_deferred_coalesced(deferred_proxy, device):
+    """Check that only the last staged duty of a channel is written"""
+    deferred_proxy.set_pwm(1, 100)
+    deferred_proxy.set_pwm(1, 200)
+    deferred_proxy.flush()
+
+    assert(device.get_write_count() == 1)
+    assert(device.get_pwm(1) == 200)
+
+def test_deferred_reverted(deferred_proxy, device):
+    """Check that a channel changed back before a flush is not written"""
+    deferred_proxy.set_pwm(1, 100)
+    deferred_proxy.flush()
+    deferred_proxy.set_pwm(1, 200)
+    deferred_proxy.set_pwm(1, 100)
+    deferred_proxy.flush()
+
+    assert(device.get_write_count() == 1)
+
+#-------------------------------------------------------------------------------
+# PWM provider tests
+#-------------------------------------------------------------------------------
+def test_pwm_provider_repeat_off(proxy, device):
+    """Check that a PWM provider turning off an off pin does not hit the bus"""
+    pwm_provider = PWMProviderPCA9685(proxy, 0)
+
+    pwm_provider.set_freq(50)
+    pwm_provider.set_duty(50)
+    pwm_provider.turn_on()
+    pwm_provider.turn_off()
+    pwm_provider.turn_off()
+    pwm_provider.set_freq(50)
+
+    assert(device.get_read_count() == 1)
+    assert(device.get_write_count() == 3)
+
+#-------------------------------------------------------------------------------
+# Block write tests
+#-------------------------------------------------------------------------------
+def test_block_flush_single_write(device):
+    """Check that staged channels across the chip go out in one transfer"""
+    proxy = PCA9685Proxy(device, write_through=False, block_writes=True)
+
+    for pin in range(PCA9685Proxy.CHANNELS):
+        proxy.set_pwm(pin, pin + 1)
+
+    proxy.flush()
+
+    assert(device.get_write_count() == 1)
+
+    for pin in range(PCA9685Proxy.CHANNELS):
+        assert(device.get_pwm(pin) == pin + 1)
+
+def test_block_flush_fills_gaps(device):
+    """Check that unknown channels inside the run are read and kept"""
+    device.set_pwm(2, 300)
+
+    proxy = PCA9685Proxy(device, write_through=False, block_writes=True)
+    proxy.set_pwm(1, 100)
+    proxy.set_pwm(3, 400)
+    proxy.flush()
+
+    assert(device.get_read_count() == 1)
+    assert(device.get_write_count() == 2)
+    assert(device.get_pwm(2) == 300)
+    assert(device.get_pwm(3) == 400)
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# test_pca9685_registry.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+import pytest
+import threading
+import time
+
+from src.hw.pwm.pca9685_registry import PCA9685Registry
+
+from tests.unit.hw.pwm.fake_pca9685 import FakePCA9685
+
+#-------------------------------------------------------------------------------
+# Test constants
+#-------------------------------------------------------------------------------
+WRITE_S = 0.02
+
+#-------------------------------------------------------------------------------
+# Test helpers
+#-------------------------------------------------------------------------------
+class SlowPCA9685(FakePCA9685):
+    """Fake PCA9685 whose writes hold the bus and are logged in order"""
+
+    def __init__(self, bus, address, log):
+        super(SlowPCA9685, self).__init__()
+
+        self.bus = bus
+        self.address = address
+        self.thread = threading.current_thread()
+
+        self.__log = log
+
+    def set_pwm(self, pin, duty):
+        time.sleep(WRITE_S)
+        self.__log.append((self.bus, self.address, pin, duty))
+
+        super(SlowPCA9685, self).set_pwm(pin, duty)
+
+class FailingPCA9685(FakePCA9685):
+    """Fake PCA9685 whose next pin write fails"""
+
+    def __init__(self):
+        super(FailingPCA9685, self).__init__()
+
+        self.fail = False
+
+    def set_pwm(self, pin, duty):
+        if self.fail:
+            self.fail = False
+            raise IOError('Bus error')
+
+        super(FailingPCA9685, self).set_pwm(pin, duty)
+
+#-------------------------------------------------------------------------------
+# Test fixtures
+#-------------------------------------------------------------------------------
+@pytest.fixture
+def log():
+    """Create a log of the writes reaching the devices"""
+    return []
+
+@pytest.fixture
+def devices():
+    """Create a record of the devices made by the registry"""
+    return {}
+
+@pytest.fixture
+def registry(log, devices):
+    """Create a registry of slow fake boards"""
+    def create(bus, address):
+        devices[(bus, address)] = SlowPCA9685(bus, address, log)
+        return devices[(bus, address)]
+
+    registry = PCA9685Registry(create)
+
+    yield registry
+
+    registry.stop()
+
+#-------------------------------------------------------------------------------
+# Mapping tests
+#-------------------------------------------------------------------------------
+def test_provider_per_pin(registry):
+    """Check that a pin always maps to the same provider"""
+    provider = registry.get_pwm_provider(1, 0x40, 3)
+
+    assert(registry.get_pwm_provider(1, 0x40, 3) is provider)
+    assert(registry.get_pwm_provider(1, 0x41, 3) is not provider)
+
+def test_worker_per_bus(registry):
+    """Check that boards on the same bus share a worker"""
+    for bus, address in [(1, 0x40), (1, 0x41), (2, 0x40)]:
+        registry.get_board(bus, address)
+
+    assert(registry.get_worker(1) is not registry.get_worker(2))
+    assert(registry.get_worker(3) is None)
+    assert(len(registry.get_boards()) == 3)
+
+def test_device_made_on_worker(registry, devices):
+    """Check that a board is opened on the thread of its bus"""
+    registry.get_board(1, 0x40)
+
+    assert(devices[(1, 0x40)].thread is not threading.current_thread())
+
+#-------------------------------------------------------------------------------
+# Bus tests
+#-------------------------------------------------------------------------------
+def test_bus_order(registry, log):
+    """Check that writes to boards on one bus reach it in order"""
+    for pin in range(4):
+        registry.get_pwm_provider(1, 0x40 + pin % 2, pin).turn_off()
+
+    registry.flush()
+
+    assert([entry[2] for entry in log] == [0, 1, 2, 3])
+
+def test_buses_in_parallel(registry, log):
+    """Check that separate buses are written at the same time"""
+    providers = [
+        registry.get_pwm_provider(bus, 0x40, pin)
+        for bus in [1, 2] for pin in range(4)]
+
+    start = time.time()
+
+    for provider in providers:
+        provider.set_raw_duty(100)
+        provider.turn_on()
+
+    registry.flush()
+    elapsed = time.time() - start
+
+    assert(len(log) == 8)
+    assert(elapsed < 6 * WRITE_S)
+
+def test_reads_from_shadow(registry, devices):
+    """Check that the frequency is only read from the bus once"""
+    provider = registry.get_pwm_provider(1, 0x40, 0)
+
+    provider.set_freq(50)
+    provider.set_freq(50)
+    registry.flush()
+
+    assert(devices[(1, 0x40)].get_read_count() == 1)
+    assert(devices[(1, 0x40)].get_pwm_frequency() == 50)
+
+def test_deferred_flush(log, devices):
+    """Check that deferred boards reach the bus on flush"""
+    registry = PCA9685Registry(
+        lambda bus, address: SlowPCA9685(bus, address, log),
+        write_through=False)
+
+    registry.get_pwm_provider(1, 0x40, 0).turn_off()
+    assert(log == [])
+
+    registry.flush()
+    assert(log == [(1, 0x40, 0, 0)])
+
+    registry.stop()
+
+def test_failed_write_retried():
+    """Check that a write that failed on the bus is not dropped as unchanged"""
+    device = FailingPCA9685()
+    registry = PCA9685Registry(lambda bus, address: device)
+    provider = registry.get_pwm_provider(1, 0x40, 0)
+    provider.set_raw_duty(100)
+
+    device.fail = True
+    provider.turn_on()
+
+    with pytest.raises(IOError):
+        registry.flush()
+
+    provider.turn_on()
+    registry.flush()
+
+    assert(device.get_pwm(0) == 100)
+
+    registry.stop()
@@ -103,6 +103,11 @@ def test_set_same_freq_in_range(pwm_provider, device):
     pwm_provider.set_freq(50)
     assert(device.get_pwm_frequency()==50)
 
+def test_set_freq_single_read(pwm_provider, device):
+    """Check that setting the frequency reads it from the device only once"""
+    pwm_provider.set_freq(50)
+    assert(device.get_read_count() == 1)
+
 # TODO: These next two tests can probably be parameterized
 def test_set_freq_out_range_low(pwm_provider, device):
     """Set the device to an invalid low frequency"""
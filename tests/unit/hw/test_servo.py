@@ -8,12 +8,22 @@
 # 2018
 #-------------------------------------------------------------------------------
 
+import asyncio
 import logging
 import pytest
+import time
 
+from tests.unit.hw.pwm.fake_pca9685 import FakePCA9685
 from tests.unit.hw.pwm.fake_pwm_provider import FakePWMProvider
+from src.hw.pwm.pwm_provider_pca9685 import PWMProviderPCA9685
+from src.clock.clock_virtual import ClockVirtual
 from src.hw.servo import Servo
 
+#-------------------------------------------------------------------------------
+# Test constants
+#-------------------------------------------------------------------------------
+FULL_SWEEP_S = 180.0 / Servo.SPEED_DEG_S
+
 #-------------------------------------------------------------------------------
 # Test fixtures
 #-------------------------------------------------------------------------------
@@ -82,6 +92,48 @@ def test_servo_signal_generation(servo, pwm_provider):
 
 
 
+@pytest.mark.parametrize("angle, count", [
+    (0, 205),
+    (90, 307),
+    (180, 409)])
+def test_servo_duty_count(servo, pwm_provider, angle, count):
+    """Check that the nominal 1ms to 2ms pulse maps onto 12 bit counts"""
+    servo.set_angle(angle)
+
+    assert(pwm_provider.get_raw_duty() == count)
+
+@pytest.mark.parametrize("angle, count", [
+    (0, 103),
+    (90, 307),
+    (180, 511)])
+def test_servo_calibrated_duty_count(pwm_provider, angle, count):
+    """Check that the calibrated endpoints set the pulse range"""
+    servo = Servo(pwm_provider, min_pulse=500, max_pulse=2500)
+    servo.set_angle(angle)
+
+    assert(pwm_provider.get_raw_duty() == count)
+
+def test_servo_fractional_angle(servo, pwm_provider):
+    """Check that a fractional angle uses the nearest whole degree"""
+    servo.set_angle(89.8)
+
+    assert(pwm_provider.get_raw_duty() == 307)
+
+def test_servo_invalid_pulse(pwm_provider):
+    """Check that the endpoints must make a valid pulse range"""
+    with pytest.raises(AssertionError):
+        Servo(pwm_provider, min_pulse=2000, max_pulse=1000)
+
+def test_servo_pca9685_count(mocker):
+    """Check that the table count reaches the PCA9685 without rescaling"""
+    mocker.patch('src.clock.clock.time.sleep')
+    device = FakePCA9685()
+    servo = Servo(PWMProviderPCA9685(device, 0))
+
+    servo.begin_move(180)
+
+    assert(device.get_pwm(0) == 409)
+
 #-------------------------------------------------------------------------------
 # Frequency tests
 #-------------------------------------------------------------------------------
@@ -94,3 +146,120 @@ def test_servo_freq(servo, pwm_provider):
 
     # Check that the expected frequency has been requested
     assert(pwm_provider.get_freq() == 50)
+
+#-------------------------------------------------------------------------------
+# Async tests
+#-------------------------------------------------------------------------------
+@pytest.mark.asyncio
+async def test_servo_async_returns_before_settle(servo, pwm_provider):
+    """Check that an async angle request leaves the servo on and returns"""
+    start = time.time()
+    settled = servo.set_angle_async(90)
+
+    assert(time.time() - start < FULL_SWEEP_S)
+    assert(pwm_provider.output_enabled())
+    assert(not settled.done())
+
+    await settled
+
+    assert(not pwm_provider.output_enabled())
+    assert(pwm_provider.get_on_count() == 1)
+
+@pytest.mark.asyncio
+async def test_servo_async_angle(servo, pwm_provider):
+    """Check that an async angle request generates a suitable duty cycle"""
+    await servo.set_angle_async(180)
+
+    assert(pwm_provider.get_raw_duty() == 409)
+    assert(pwm_provider.get_freq() == 50)
+
+@pytest.mark.asyncio
+async def test_servo_async_retarget(servo, pwm_provider):
+    """Check that a new request while moving extends the settle window"""
+    first = servo.set_angle_async(0)
+    await asyncio.sleep(FULL_SWEEP_S / 2)
+    second = servo.set_angle_async(180)
+    await asyncio.sleep(FULL_SWEEP_S / 2 + 0.05)
+
+    # The first move was overtaken so the servo is still on
+    assert(not first.done())
+    assert(pwm_provider.output_enabled())
+
+    await second
+
+    assert(first.done())
+    assert(not pwm_provider.output_enabled())
+    assert(pwm_provider.get_on_count() == 2)
+
+#-------------------------------------------------------------------------------
+# Current tests
+#-------------------------------------------------------------------------------
+def test_servo_stall_current(pwm_provider):
+    """Check that the stall current is kept with the servo"""
+    assert(Servo(pwm_provider).get_stall_current() == Servo.STALL_CURRENT_MA)
+    assert(Servo(pwm_provider, 300).get_stall_current() == 300)
+
+def test_servo_invalid_stall_current(pwm_provider):
+    """Check that a servo must draw some current"""
+    with pytest.raises(AssertionError):
+        Servo(pwm_provider, 0)
+
+#-------------------------------------------------------------------------------
+# Settle time tests
+#-------------------------------------------------------------------------------
+def test_servo_settle_unknown_start(servo):
+    """Check that the first move allows for a full sweep"""
+    assert(servo.get_settle_time(90) == FULL_SWEEP_S)
+
+@pytest.mark.parametrize("start, end, settle_time", [
+    (90, 100, Servo.MIN_SETTLE_TIME_S),
+    (90, 90, Servo.MIN_SETTLE_TIME_S),
+    (45, 135, 90.0 / Servo.SPEED_DEG_S),
+    (0, 180, FULL_SWEEP_S)])
+def test_servo_settle_time(servo, mocker, start, end, settle_time):
+    """Check that the time waited depends on how far the servo travels"""
+    sleep = mocker.patch('src.clock.clock.time.sleep')
+
+    servo.set_angle(start)
+    servo.set_angle(end)
+
+    sleep.assert_called_with(settle_time)
+
+def test_servo_calibrated_settle_time(pwm_provider, mocker):
+    """Check that the settle time follows the servo calibration"""
+    sleep = mocker.patch('src.clock.clock.time.sleep')
+    servo = Servo(pwm_provider, speed=100, min_settle_time=0.2)
+
+    servo.set_angle(0)
+    servo.set_angle(50)
+    sleep.assert_called_with(0.5)
+
+    servo.set_angle(60)
+    sleep.assert_called_with(0.2)
+
+def test_servo_begin_move_settle_time(servo, mocker):
+    """Check that beginning a move reports the settle time"""
+    mocker.patch('src.clock.clock.time.sleep')
+    servo.set_angle(0)
+
+    assert(servo.begin_move(90) == 90.0 / Servo.SPEED_DEG_S)
+    servo.end_move()
+
+def test_servo_invalid_calibration(pwm_provider):
+    """Check that a servo must have a speed"""
+    with pytest.raises(AssertionError):
+        Servo(pwm_provider, speed=0)
+
+#-------------------------------------------------------------------------------
+# Clock tests
+#-------------------------------------------------------------------------------
+def test_servo_virtual_clock(pwm_provider):
+    """Check that the servo settles on the given clock"""
+    clock = ClockVirtual()
+    servo = Servo(pwm_provider, clock=clock)
+
+    servo.set_angle(0)
+    servo.set_angle(90)
+
+    assert(clock.time() == FULL_SWEEP_S + 90.0 / Servo.SPEED_DEG_S)
+    assert(not pwm_provider.output_enabled())
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# test_servo_move_scheduler.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+import pytest
+
+from src.hw.servo_move_scheduler import ServoMoveScheduler
+from src.hw.turnout_bank import TurnoutBank
+from src.hw.turnout_efrog_servo import TurnoutEFrogServo
+
+from tests.unit.hw.fake_servo import FakeServo
+from tests.unit.hw.fake_gpo_provider import FakeGPOProvider
+
+#-------------------------------------------------------------------------------
+# Test constants
+#-------------------------------------------------------------------------------
+ANGLE_MAIN = 45
+ANGLE_DIV = 135
+BUDGET = 2000
+
+#-------------------------------------------------------------------------------
+# Test fixtures
+#-------------------------------------------------------------------------------
+def make_turnout(stall_current):
+    """Create a turnout whose servo has the given stall current"""
+    servo = FakeServo(stall_current)
+    return TurnoutEFrogServo(servo, FakeGPOProvider(), ANGLE_MAIN, ANGLE_DIV)
+
+@pytest.fixture
+def bank(mocker):
+    """Turnout bank with a spy on the routes it sets"""
+    bank = TurnoutBank()
+    mocker.spy(bank, 'set_routes')
+    return bank
+
+@pytest.fixture
+def scheduler(bank):
+    """Create a scheduler with a 2A budget"""
+    return ServoMoveScheduler(BUDGET, bank)
+
+#-------------------------------------------------------------------------------
+# Submission tests
+#-------------------------------------------------------------------------------
+def test_submit_over_budget(scheduler):
+    """Check that a move that can never fit is rejected"""
+    with pytest.raises(AssertionError):
+        scheduler.submit(make_turnout(BUDGET + 1), True)
+
+def test_submit_same_turnout(scheduler):
+    """Check that a turnout only has one pending move with the latest route"""
+    turnout = make_turnout(500)
+
+    scheduler.submit(turnout, True)
+    scheduler.submit(turnout, False)
+
+    assert(scheduler.get_pending_count() == 1)
+    assert(scheduler.plan() == [[(turnout, False)]])
+    assert(scheduler.get_pending_count() == 0)
+
+#-------------------------------------------------------------------------------
+# Packing tests
+#-------------------------------------------------------------------------------
+def test_plan_within_budget(scheduler):
+    """Check that every wave is within budget and waves are few"""
+    turnouts = [make_turnout(650) for i in range(12)]
+
+    for turnout in turnouts:
+        scheduler.submit(turnout, True)
+
+    waves = scheduler.plan()
+
+    # Three 650mA moves fit in 2A
+    assert(len(waves) == 4)
+
+    for wave in waves:
+        assert(sum(t.get_stall_current() for t, d in wave) <= BUDGET)
+
+def test_plan_fifo(scheduler):
+    """Check that moves of equal priority keep their order"""
+    turnouts = [make_turnout(1000) for i in range(4)]
+
+    for turnout in turnouts:
+        scheduler.submit(turnout, True)
+
+    waves = scheduler.plan()
+
+    assert([[t for t, d in wave] for wave in waves] == [
+        turnouts[0:2], turnouts[2:4]])
+
+def test_plan_priority(scheduler):
+    """Check that higher priority moves go in the first wave"""
+    low = [make_turnout(1000) for i in range(2)]
+    high = make_turnout(1500)
+
+    for turnout in low:
+        scheduler.submit(turnout, True)
+
+    scheduler.submit(high, True, priority=1)
+
+    waves = scheduler.plan()
+
+    assert(waves[0] == [(high, True)])
+
+def test_plan_backfill(scheduler):
+    """Check that small moves fill gaps left in earlier waves"""
+    big = [make_turnout(1500) for i in range(2)]
+    small = make_turnout(500)
+
+    for turnout in big + [small]:
+        scheduler.submit(turnout, True)
+
+    waves = scheduler.plan()
+
+    assert(len(waves) == 2)
+    assert((small, True) in waves[0])
+
+#-------------------------------------------------------------------------------
+# Run tests
+#-------------------------------------------------------------------------------
+def test_run(scheduler, bank):
+    """Check that each wave is set by the bank"""
+    turnouts = [make_turnout(1000) for i in range(3)]
+
+    for turnout in turnouts:
+        scheduler.submit(turnout, True)
+
+    assert(scheduler.run() == 2)
+    assert(bank.set_routes.call_count == 2)
+
+@pytest.mark.asyncio
+async def test_run_async(scheduler):
+    """Check that waves can be run without blocking the event loop"""
+    turnouts = [make_turnout(1000) for i in range(3)]
+
+    for turnout in turnouts:
+        scheduler.submit(turnout, True)
+
+    assert(await scheduler.run_async() == 2)
+    assert(scheduler.get_pending_count() == 0)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# test_turnout_bank.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+import pytest
+import time
+
+from src.clock.clock_virtual import ClockVirtual
+from src.hw.pwm.pca9685_proxy import PCA9685Proxy
+from src.hw.pwm.pwm_provider_pca9685 import PWMProviderPCA9685
+from src.hw.servo import Servo
+from src.hw.turnout_bank import TurnoutBank
+from src.hw.turnout_efrog_servo import TurnoutEFrogServo
+from src.hw.turnout_state_store import TurnoutStateStore
+
+from tests.unit.hw.fake_gpo_provider import FakeGPOProvider
+from tests.unit.hw.fake_servo import FakeServo
+from tests.unit.hw.pwm.fake_pca9685 import FakePCA9685
+from tests.unit.hw.pwm.fake_pwm_provider import FakePWMProvider
+
+#-------------------------------------------------------------------------------
+# Test constants
+#-------------------------------------------------------------------------------
+ANGLE_MAIN = 45
+ANGLE_DIV = 135
+TURNOUT_COUNT = 12
+THROW_S = (ANGLE_DIV - ANGLE_MAIN) / float(Servo.SPEED_DEG_S)
+
+#-------------------------------------------------------------------------------
+# Test fixtures
+#-------------------------------------------------------------------------------
+@pytest.fixture
+def pwm_providers():
+    """Fake pwm providers, one per turnout"""
+    return [FakePWMProvider() for i in range(TURNOUT_COUNT)]
+
+@pytest.fixture
+def gpo_providers():
+    """GPO provider test doubles, one per turnout"""
+    return [FakeGPOProvider() for i in range(TURNOUT_COUNT)]
+
+@pytest.fixture
+def turnouts(pwm_providers, gpo_providers):
+    """Create a yard ladder of turnouts without waiting for them to home"""
+    clock = ClockVirtual()
+
+    return [
+        TurnoutEFrogServo(Servo(pwm, clock=clock), gpo, ANGLE_MAIN, ANGLE_DIV)
+        for pwm, gpo in zip(pwm_providers, gpo_providers)]
+
+@pytest.fixture
+def bank():
+    """Create a turnout bank"""
+    return TurnoutBank()
+
+#-------------------------------------------------------------------------------
+# Route tests
+#-------------------------------------------------------------------------------
+def test_set_routes_single_settle(bank, turnouts, pwm_providers, gpo_providers):
+    """Check that a full ladder is thrown in one settle period"""
+    start = time.time()
+    bank.set_routes([(turnout, True) for turnout in turnouts])
+    elapsed = time.time() - start
+
+    assert(elapsed >= THROW_S)
+    assert(elapsed < 2 * THROW_S)
+
+    for pwm, gpo in zip(pwm_providers, gpo_providers):
+        assert(pwm.get_on_count() == 2)
+        assert(not pwm.output_enabled())
+        assert(gpo.is_enabled())
+
+def test_set_routes_energized_together(bank, turnouts, pwm_providers, mocker):
+    """Check that every servo is on during the shared settle period"""
+    def check_all_on(settle_time):
+        for pwm in pwm_providers:
+            assert(pwm.output_enabled())
+
+    mocker.patch('src.clock.clock.time.sleep', side_effect=check_all_on)
+
+    bank.set_routes([(turnout, True) for turnout in turnouts])
+
+    for pwm in pwm_providers:
+        assert(not pwm.output_enabled())
+
+def test_set_routes_empty(bank, mocker):
+    """Check that an empty route does not wait"""
+    sleep = mocker.patch('src.clock.clock.time.sleep')
+
+    bank.set_routes([])
+
+    assert(not sleep.called)
+
+def test_set_routes_flushes_devices(mocker):
+    """Check that a full board is driven with one transfer per phase"""
+    mocker.patch('src.clock.clock.time.sleep')
+
+    device = FakePCA9685()
+    proxy = PCA9685Proxy(device, write_through=False, block_writes=True)
+    bank = TurnoutBank([proxy])
+
+    turnouts = []
+
+    for pin in range(0, PCA9685Proxy.CHANNELS, 2):
+        servo = Servo(PWMProviderPCA9685(proxy, pin))
+        turnout = TurnoutEFrogServo(servo, FakeGPOProvider(), ANGLE_MAIN, ANGLE_DIV)
+        turnouts.append(turnout)
+
+    proxy.flush()
+    writes = device.get_write_count()
+
+    bank.set_routes([(turnout, True) for turnout in turnouts])
+
+    assert(device.get_write_count() - writes == 2)
+
+    for pin in range(0, PCA9685Proxy.CHANNELS, 2):
+        assert(device.get_pwm(pin) == 0)
+
+#-------------------------------------------------------------------------------
+# Homing tests
+#-------------------------------------------------------------------------------
+def test_home_batch(bank, pwm_providers, gpo_providers, mocker):
+    """Check that turnouts built without homing are homed in one settle"""
+    sleep = mocker.patch('src.clock.clock.time.sleep')
+
+    turnouts = [
+        TurnoutEFrogServo(Servo(pwm), gpo, ANGLE_MAIN, ANGLE_DIV, home=False)
+        for pwm, gpo in zip(pwm_providers, gpo_providers)]
+
+    assert(bank.home(turnouts) == TURNOUT_COUNT)
+    assert(sleep.call_count == 1)
+
+    for turnout, pwm in zip(turnouts, pwm_providers):
+        assert(turnout.get_route() is False)
+        assert(pwm.get_on_count() == 1)
+
+def test_set_routes_failure_settles_started(bank, turnouts, mocker):
+    """Check that turnouts started before a failure are still finished"""
+    mocker.patch.object(
+        turnouts[1], 'begin_route', side_effect=RuntimeError('Servo fault'))
+
+    with pytest.raises(RuntimeError):
+        bank.set_routes([(turnout, True) for turnout in turnouts])
+
+    assert(turnouts[0].get_route() is True)
+    assert(turnouts[0].get_moving_route() is None)
+
+def test_set_routes_flush_failure_settles(turnouts, mocker):
+    """Check that a failed flush still lets the servos settle and turn off"""
+    device = mocker.Mock()
+    device.flush.side_effect = [IOError('Bus error'), None]
+    bank = TurnoutBank([device])
+
+    with pytest.raises(IOError):
+        bank.set_routes([(turnout, True) for turnout in turnouts])
+
+    assert(device.flush.call_count == 2)
+
+    for turnout in turnouts:
+        assert(turnout.get_route() is True)
+        assert(turnout.get_moving_route() is None)
+
+def test_home_skips_known(bank, tmp_path):
+    """Check that turnouts known to the state store are not driven"""
+    store = TurnoutStateStore(str(tmp_path / 'turnouts.json'))
+    store.set_route(1, True)
+
+    servos = [FakeServo() for i in range(3)]
+    gpos = [FakeGPOProvider() for i in range(3)]
+    turnouts = [
+        TurnoutEFrogServo(servo, gpo, ANGLE_MAIN, ANGLE_DIV, home=False,
+            state_store=store, turnout_id=turnout_id)
+        for turnout_id, (servo, gpo) in enumerate(zip(servos, gpos))]
+
+    assert(bank.home(turnouts, store) == 2)
+
+    assert(servos[1].get_move_count() == 0)
+    assert(servos[1].get_angle() == ANGLE_DIV)
+    assert(gpos[1].is_enabled())
+
+    for index in [0, 2]:
+        assert(servos[index].get_move_count() == 1)
+        assert(servos[index].get_angle() == ANGLE_MAIN)
+
+    assert(store.get_routes() == {0: False, 1: True, 2: False})
+
+def test_home_drives_interrupted(bank, tmp_path):
+    """Check that a turnout whose last move never settled is driven"""
+    path = str(tmp_path / 'turnouts.json')
+    store = TurnoutStateStore(path)
+    turnout = TurnoutEFrogServo(FakeServo(), FakeGPOProvider(),
+        ANGLE_MAIN, ANGLE_DIV, state_store=store, turnout_id=0)
+
+    # Power is lost part way through the move
+    turnout.begin_route(True)
+
+    store = TurnoutStateStore(path)
+    servo = FakeServo()
+    turnout = TurnoutEFrogServo(servo, FakeGPOProvider(),
+        ANGLE_MAIN, ANGLE_DIV, home=False, state_store=store, turnout_id=0)
+
+    assert(bank.home([turnout], store) == 1)
+    assert(servo.get_move_count() == 1)
+    assert(store.get_route(0) is False)
+
+@pytest.mark.asyncio
+async def test_set_routes_async_single_settle(
+    bank, turnouts, pwm_providers, gpo_providers):
+    """Check that a full ladder is thrown in one settle period asynchronously"""
+    start = time.time()
+    await bank.set_routes_async([(turnout, True) for turnout in turnouts])
+    elapsed = time.time() - start
+
+    assert(elapsed >= THROW_S - 0.05)
+    assert(elapsed < 2 * THROW_S)
+
+    for pwm, gpo in zip(pwm_providers, gpo_providers):
+        assert(not pwm.output_enabled())
+        assert(gpo.is_enabled())
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# test_turnout_command_queue.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import asyncio
+import logging
+import pytest
+
+from src.clock.clock_virtual import ClockVirtual
+from src.hw.servo import Servo
+from src.hw.turnout_command_queue import TurnoutCommandQueue
+from src.hw.turnout_efrog_servo import TurnoutEFrogServo
+
+from tests.unit.hw.fake_gpo_provider import FakeGPOProvider
+from tests.unit.hw.pwm.fake_pwm_provider import FakePWMProvider
+
+#-------------------------------------------------------------------------------
+# Test constants
+#-------------------------------------------------------------------------------
+ANGLE_MAIN = 45
+ANGLE_DIV = 135
+
+#-------------------------------------------------------------------------------
+# Test fixtures
+#-------------------------------------------------------------------------------
+@pytest.fixture
+def pwm_provider():
+    """Creates a fake pwm provider for testing"""
+    return FakePWMProvider()
+
+@pytest.fixture
+def turnout(pwm_provider, mocker):
+    """Create a turnout with a fast servo, homed to the main route"""
+    servo = Servo(
+        pwm_provider, speed=3600, min_settle_time=0.01, clock=ClockVirtual())
+    turnout = TurnoutEFrogServo(servo, FakeGPOProvider(), ANGLE_MAIN, ANGLE_DIV)
+
+    mocker.spy(turnout, 'set_route_async')
+
+    return turnout
+
+@pytest.fixture
+def queue():
+    """Create a command queue"""
+    return TurnoutCommandQueue()
+
+#-------------------------------------------------------------------------------
+# Command tests
+#-------------------------------------------------------------------------------
+@pytest.mark.asyncio
+async def test_single_command(queue, turnout):
+    """Check that a lone command runs"""
+    outcome = queue.submit(turnout, True)
+
+    assert(await outcome == TurnoutCommandQueue.COMPLETED)
+    assert(queue.is_idle())
+
+@pytest.mark.asyncio
+async def test_burst_latest_wins(queue, turnout, pwm_provider):
+    """Check that a burst of commands runs only the first and the newest
+
+    The third command asks for the route already being set so joins that move.
+    """
+    outcomes = [queue.submit(turnout, diverging)
+        for diverging in [True, False, True, False]]
+
+    assert(queue.get_waiting_count() == 1)
+
+    results = await asyncio.gather(*outcomes)
+
+    assert(results == [
+        TurnoutCommandQueue.COMPLETED,
+        TurnoutCommandQueue.SUPERSEDED,
+        TurnoutCommandQueue.COALESCED,
+        TurnoutCommandQueue.COMPLETED])
+    assert(turnout.set_route_async.call_count == 2)
+    assert(queue.is_idle())
+
+@pytest.mark.asyncio
+async def test_coalesce_running(queue, turnout):
+    """Check that a repeat of the running command does not move again"""
+    first = queue.submit(turnout, True)
+    repeat = queue.submit(turnout, True)
+
+    assert(await first == TurnoutCommandQueue.COMPLETED)
+    assert(await repeat == TurnoutCommandQueue.COALESCED)
+    assert(turnout.set_route_async.call_count == 1)
+
+@pytest.mark.asyncio
+async def test_coalesce_waiting(queue, turnout):
+    """Check that a repeat of the waiting command does not move again"""
+    queue.submit(turnout, True)
+    waiting = queue.submit(turnout, False)
+    repeat = queue.submit(turnout, False)
+
+    assert(await waiting == TurnoutCommandQueue.COMPLETED)
+    assert(await repeat == TurnoutCommandQueue.COALESCED)
+    assert(turnout.set_route_async.call_count == 2)
+
+@pytest.mark.asyncio
+async def test_turnouts_independent(queue, turnout, mocker):
+    """Check that commands for different turnouts do not replace each other"""
+    other = TurnoutEFrogServo(
+        Servo(FakePWMProvider(), clock=ClockVirtual()),
+        FakeGPOProvider(), ANGLE_MAIN, ANGLE_DIV)
+
+    outcomes = [queue.submit(turnout, True), queue.submit(other, True)]
+
+    assert(await asyncio.gather(*outcomes) == [
+        TurnoutCommandQueue.COMPLETED, TurnoutCommandQueue.COMPLETED])
+
+@pytest.mark.asyncio
+async def test_cancelled_command(queue, turnout):
+    """Check that a command given up on by its caller does not stop the queue"""
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(queue.submit(turnout, True), 0.001)
+
+    # Give the move time to settle
+    await asyncio.sleep(0.2)
+
+    assert(queue.is_idle())
+    assert(await queue.submit(turnout, False) == TurnoutCommandQueue.COMPLETED)
+    assert(turnout.get_route() is False)
+
+@pytest.mark.asyncio
+async def test_close(queue, turnout):
+    """Check that closing cancels running and waiting commands"""
+    running = queue.submit(turnout, True)
+    waiting = queue.submit(turnout, False)
+
+    await asyncio.sleep(0)
+    await queue.close()
+
+    assert(running.cancelled())
+    assert(waiting.cancelled())
+    assert(queue.is_idle())
+
+@pytest.mark.asyncio
+async def test_failed_command(queue, turnout, mocker):
+    """Check that a failed move is reported and the queue keeps going"""
+    turnout.set_route_async.side_effect = RuntimeError('Servo fault')
+
+    failed = queue.submit(turnout, True)
+
+    with pytest.raises(RuntimeError):
+        await failed
+
+    assert(queue.is_idle())
@@ -8,13 +8,18 @@
 # 2018
 #-------------------------------------------------------------------------------
 
+import asyncio
+import concurrent.futures
 import logging
 import pytest
 
+from src.hw.servo import Servo
 from src.hw.turnout_efrog_servo import TurnoutEFrogServo
+from src.hw.turnout_state_store import TurnoutStateStore
 
 from tests.unit.hw.fake_servo import FakeServo
 from tests.unit.hw.fake_gpo_provider import FakeGPOProvider
+from tests.unit.hw.pwm.fake_pwm_provider import FakePWMProvider
 
 #-------------------------------------------------------------------------------
 # Test constants
@@ -65,6 +70,21 @@ def test_init_bad_angle(servo, gpo_provider):
     with pytest.raises(AssertionError):
         TurnoutEFrogServo(servo, gpo_provider, -45, ANGLE_DIV)
 
+def test_init_no_home(servo, gpo_provider):
+    """Check that a turnout can be built without moving it"""
+    turnout = TurnoutEFrogServo(
+        servo, gpo_provider, ANGLE_MAIN, ANGLE_DIV, home=False)
+
+    assert(servo.get_move_count() == 0)
+    assert(turnout.get_route() is None)
+
+def test_init_store_without_id(servo, gpo_provider, mocker):
+    """Check that a turnout recorded in a store must have an id"""
+    with pytest.raises(AssertionError):
+        TurnoutEFrogServo(
+            servo, gpo_provider, ANGLE_MAIN, ANGLE_DIV,
+            state_store=mocker.Mock())
+
 #-------------------------------------------------------------------------------
 # Route tests
 #-------------------------------------------------------------------------------
@@ -82,4 +102,159 @@ def test_diverging_route(turnout_main, servo, gpo_provider):
 
     # Check that the route was set to the diverging route
     assert(servo.get_angle() == ANGLE_DIV)
-    assert(gpo_provider.is_enabled())
\ No newline at end of file
+    assert(gpo_provider.is_enabled())
+
+@pytest.mark.asyncio
+async def test_diverging_route_async(turnout_main, servo, gpo_provider):
+    """Test that the turnout moves to the diverging route asynchronously"""
+    await turnout_main.set_route_async(True)
+
+    assert(servo.get_angle() == ANGLE_DIV)
+    assert(gpo_provider.is_enabled())
+
+@pytest.mark.asyncio
+async def test_main_route_async(turnout_div, servo, gpo_provider):
+    """Test that the turnout moves to the main route asynchronously"""
+    await turnout_div.set_route_async(False)
+
+    assert(servo.get_angle() == ANGLE_MAIN)
+    assert(not gpo_provider.is_enabled())
+
+def test_begin_end_route(turnout_main, servo, gpo_provider):
+    """Test that the servo stays powered between beginning and ending a route"""
+    turnout_main.begin_route(True)
+
+    assert(servo.is_moving())
+    assert(servo.get_angle() == ANGLE_DIV)
+    assert(gpo_provider.is_enabled())
+
+    turnout_main.end_route()
+
+    assert(not servo.is_moving())
+
+def test_get_route(turnout_main):
+    """Test that the turnout tracks the route it was set to"""
+    assert(turnout_main.get_route() is False)
+
+    turnout_main.set_route(True)
+
+    assert(turnout_main.get_route() is True)
+
+def test_route_unknown_while_moving(turnout_main):
+    """Test that the route is only known once the points have settled"""
+    turnout_main.begin_route(True)
+
+    assert(turnout_main.get_route() is None)
+    assert(turnout_main.get_moving_route() is True)
+    assert(not turnout_main.wait_settled(0.01))
+
+    turnout_main.end_route()
+
+    assert(turnout_main.get_route() is True)
+    assert(turnout_main.get_moving_route() is None)
+    assert(turnout_main.wait_settled(0.01))
+
+def test_route_kept_while_resent(turnout_main):
+    """Test that setting the route the points are at keeps it known"""
+    turnout_main.begin_route(False)
+
+    assert(turnout_main.get_route() is False)
+
+    turnout_main.end_route()
+
+def test_route_unknown_after_failure(turnout_main, servo, mocker):
+    """Test that a move that fails leaves the route unknown"""
+    mocker.patch.object(
+        servo, 'begin_move', side_effect=RuntimeError('Servo fault'))
+
+    with pytest.raises(RuntimeError):
+        turnout_main.begin_route(True)
+
+    assert(turnout_main.get_route() is None)
+    assert(turnout_main.get_moving_route() is None)
+
+def test_assume_route(servo, gpo_provider):
+    """Test that assuming a route sets the frog without moving the points"""
+    turnout = TurnoutEFrogServo(
+        servo, gpo_provider, ANGLE_MAIN, ANGLE_DIV, home=False)
+
+    turnout.assume_route(True)
+
+    assert(servo.is_assumed())
+    assert(servo.get_angle() == ANGLE_DIV)
+    assert(gpo_provider.is_enabled())
+    assert(turnout.get_route() is True)
+
+def test_assume_route_not_recorded(servo, gpo_provider, mocker):
+    """Test that assuming a route does not write the store again"""
+    store = mocker.Mock()
+    turnout = TurnoutEFrogServo(
+        servo, gpo_provider, ANGLE_MAIN, ANGLE_DIV, home=False,
+        state_store=store, turnout_id=7)
+
+    turnout.assume_route(True)
+
+    assert(not store.set_route.called)
+
+def test_route_recorded(servo, gpo_provider, mocker):
+    """Test that every route set is recorded in the state store"""
+    store = mocker.Mock()
+    turnout = TurnoutEFrogServo(
+        servo, gpo_provider, ANGLE_MAIN, ANGLE_DIV,
+        state_store=store, turnout_id=7)
+
+    turnout.set_route(True)
+    turnout.set_route(True)
+
+    assert(turnout.get_id() == 7)
+    assert(store.set_route.call_args_list == [
+        mocker.call(7, None), mocker.call(7, False),
+        mocker.call(7, None), mocker.call(7, True),
+        mocker.call(7, True)])
+
+def test_route_recorded_once_settled(servo, gpo_provider, tmp_path):
+    """Test that the route is unknown to the store while the points move"""
+    store = TurnoutStateStore(str(tmp_path / 'turnouts.json'))
+    turnout = TurnoutEFrogServo(
+        servo, gpo_provider, ANGLE_MAIN, ANGLE_DIV,
+        state_store=store, turnout_id=7)
+
+    turnout.begin_route(True)
+    assert(store.get_route(7) is None)
+
+    turnout.end_route()
+    assert(store.get_route(7) is True)
+
+@pytest.mark.asyncio
+async def test_route_recorded_async(gpo_provider, tmp_path):
+    """Test that the async path records the route once the servo settles"""
+    store = TurnoutStateStore(str(tmp_path / 'turnouts.json'))
+    turnout = TurnoutEFrogServo(
+        Servo(FakePWMProvider(), speed=900, min_settle_time=0.01),
+        gpo_provider, ANGLE_MAIN, ANGLE_DIV, state_store=store, turnout_id=7)
+
+    settled = turnout.set_route_async(True)
+    await asyncio.sleep(0.05)
+
+    assert(store.get_route(7) is None)
+
+    await settled
+
+    assert(store.get_route(7) is True)
+
+@pytest.mark.asyncio
+async def test_route_recorded_async_writer(gpo_provider, tmp_path, mocker):
+    """Test that the async path writes records on the given store writer"""
+    store = TurnoutStateStore(str(tmp_path / 'turnouts.json'))
+    writer = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    submit = mocker.spy(writer, 'submit')
+    turnout = TurnoutEFrogServo(
+        Servo(FakePWMProvider(), speed=900, min_settle_time=0.01),
+        gpo_provider, ANGLE_MAIN, ANGLE_DIV, state_store=store, turnout_id=7,
+        store_writer=writer)
+
+    await turnout.set_route_async(True)
+    writer.shutdown()
+
+    assert(submit.call_count == 2)
+    assert(store.get_route(7) is True)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# test_turnout_planner.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+import pytest
+import threading
+
+from src.hw.turnout_bank import TurnoutBank
+from src.hw.turnout_efrog_servo import TurnoutEFrogServo
+from src.hw.turnout_planner import TurnoutPlanner
+
+from tests.unit.hw.fake_gpo_provider import FakeGPOProvider
+from tests.unit.hw.fake_servo import FakeServo
+
+#-------------------------------------------------------------------------------
+# Test constants
+#-------------------------------------------------------------------------------
+ANGLE_MAIN = 45
+ANGLE_DIV = 135
+TURNOUT_COUNT = 8
+
+#-------------------------------------------------------------------------------
+# Test fixtures
+#-------------------------------------------------------------------------------
+@pytest.fixture
+def servos():
+    """Servo test doubles, one per turnout"""
+    return [FakeServo() for i in range(TURNOUT_COUNT)]
+
+@pytest.fixture
+def turnouts(servos):
+    """Create turnouts set to main"""
+    return [
+        TurnoutEFrogServo(servo, FakeGPOProvider(), ANGLE_MAIN, ANGLE_DIV)
+        for servo in servos]
+
+@pytest.fixture
+def bank(mocker):
+    """Turnout bank with a spy on the routes it sets"""
+    bank = TurnoutBank()
+    mocker.spy(bank, 'set_routes')
+
+    return bank
+
+@pytest.fixture
+def planner(bank):
+    """Create a planner using the bank"""
+    return TurnoutPlanner(bank)
+
+#-------------------------------------------------------------------------------
+# Plan tests
+#-------------------------------------------------------------------------------
+def test_plan_differences(planner, turnouts):
+    """Check that only turnouts set differently are moved"""
+    plan = planner.plan([(turnout, i % 4 == 0) for i, turnout in enumerate(turnouts)])
+
+    assert(plan.moves == [(turnouts[0], True), (turnouts[4], True)])
+    assert(len(plan.unchanged) == TURNOUT_COUNT - 2)
+
+def test_plan_unknown_route(planner):
+    """Check that a turnout whose route is not known is moved"""
+    turnout = TurnoutEFrogServo(
+        FakeServo(), FakeGPOProvider(), ANGLE_MAIN, ANGLE_DIV, home=False)
+
+    assert(planner.plan([(turnout, False)]).moves == [(turnout, False)])
+
+def test_plan_last_wins(planner, turnouts):
+    """Check that a turnout given twice takes the last route"""
+    plan = planner.plan([(turnouts[0], True), (turnouts[0], False)])
+
+    assert(plan.moves == [])
+    assert(plan.unchanged == [turnouts[0]])
+
+def test_plan_joins_moving(planner, turnouts):
+    """Check that a turnout already moving to the route is joined"""
+    turnouts[0].begin_route(True)
+    turnouts[1].begin_route(True)
+
+    plan = planner.plan([(turnouts[0], True), (turnouts[1], False)])
+
+    assert(plan.joined == [(turnouts[0], True)])
+    assert(plan.moves == [(turnouts[1], False)])
+
+def test_plan_verify(planner, turnouts):
+    """Check that verify mode moves every turnout"""
+    plan = planner.plan([(turnout, False) for turnout in turnouts], verify=True)
+
+    assert(len(plan.moves) == TURNOUT_COUNT)
+
+#-------------------------------------------------------------------------------
+# Apply tests
+#-------------------------------------------------------------------------------
+def test_full_state_sync(planner, turnouts, servos):
+    """Check that a full state costs only the moves of turnouts that differ"""
+    state = [(turnout, i < 3) for i, turnout in enumerate(turnouts)]
+
+    planner.apply(state)
+    planner.apply(state)
+
+    assert(sum(servo.get_move_count() for servo in servos) ==
+        TURNOUT_COUNT + 3)
+
+def test_apply_single_batch(planner, turnouts, bank):
+    """Check that the moves are made together"""
+    planner.apply([(turnout, True) for turnout in turnouts])
+
+    bank.set_routes.assert_called_once()
+
+def test_apply_waits_for_joined(planner, turnouts, servos):
+    """Check that applying a state waits for a joined move to settle"""
+    turnouts[0].begin_route(True)
+
+    timer = threading.Timer(0.05, turnouts[0].end_route)
+    timer.start()
+
+    plan = planner.apply([(turnouts[0], True)])
+    timer.join()
+
+    assert(plan.joined == [(turnouts[0], True)])
+    assert(turnouts[0].get_route() is True)
+    assert(servos[0].get_move_count() == 2)
+
+def test_apply_joined_failed(planner, turnouts, servos, mocker):
+    """Check that a joined move that did not settle as wanted is made again"""
+    mocker.patch.object(turnouts[0], 'get_moving_route', return_value=True)
+    mocker.patch.object(turnouts[0], 'wait_settled', return_value=True)
+
+    planner.apply([(turnouts[0], True)])
+
+    mocker.stopall()
+
+    assert(turnouts[0].get_route() is True)
+    assert(servos[0].get_move_count() == 2)
+
+def test_apply_verify(planner, turnouts, servos):
+    """Check that verify mode drives turnouts already in position"""
+    planner.apply([(turnout, False) for turnout in turnouts], verify=True)
+
+    assert(all(servo.get_move_count() == 2 for servo in servos))
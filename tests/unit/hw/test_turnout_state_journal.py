@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# test_turnout_state_journal.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+import os
+import pytest
+
+from src.clock.clock_virtual import ClockVirtual
+from src.hw.servo import Servo
+from src.hw.turnout_bank import TurnoutBank
+from src.hw.turnout_efrog_servo import TurnoutEFrogServo
+from src.hw.turnout_state_journal import TurnoutStateJournal
+
+from tests.unit.hw.fake_gpo_provider import FakeGPOProvider
+from tests.unit.hw.pwm.fake_pwm_provider import FakePWMProvider
+
+#-------------------------------------------------------------------------------
+# Test constants
+#-------------------------------------------------------------------------------
+RECORD_SIZE = TurnoutStateJournal.JOURNAL_RECORD.size
+
+#-------------------------------------------------------------------------------
+# Test fixtures
+#-------------------------------------------------------------------------------
+@pytest.fixture
+def path(tmp_path):
+    """Return the base path of the journal files"""
+    return str(tmp_path / 'turnouts')
+
+@pytest.fixture
+def journal(path):
+    """Create an empty journal"""
+    journal = TurnoutStateJournal(path)
+
+    yield journal
+
+    journal.close()
+
+#-------------------------------------------------------------------------------
+# Test helpers
+#-------------------------------------------------------------------------------
+def reopen(journal, path, compact=False):
+    """Simulate a restart, without the compaction of a clean close unless
+    asked for
+    """
+    if compact:
+        journal.close()
+
+    return TurnoutStateJournal(path)
+
+def lose_snapshot_write(journal, turnout_id, value):
+    """Put a route back in the snapshot as if the change never reached it"""
+    journal._TurnoutStateJournal__snapshot[
+        TurnoutStateJournal.SNAPSHOT_HEADER.size + turnout_id] = value
+
+def journal_size(path):
+    """Return the size of the journal file"""
+    return os.path.getsize(path + '.journal')
+
+#-------------------------------------------------------------------------------
+# Route tests
+#-------------------------------------------------------------------------------
+def test_unknown_route(journal):
+    """Check that turnouts never set are not known"""
+    assert(journal.get_route(1) is None)
+    assert(journal.get_routes() == {})
+
+def test_set_route(journal):
+    """Check that routes are recorded"""
+    journal.set_route(1, True)
+    journal.set_route(0xFFFF, False)
+
+    assert(journal.get_route(1) is True)
+    assert(journal.get_routes() == {1: True, 0xFFFF: False})
+
+def test_unchanged_not_journaled(journal, path):
+    """Check that setting the same route does not grow the journal"""
+    journal.set_route(1, True)
+    journal.set_route(1, True)
+
+    assert(journal_size(path) == RECORD_SIZE)
+
+#-------------------------------------------------------------------------------
+# Restart tests
+#-------------------------------------------------------------------------------
+def test_survives_restart(journal, path):
+    """Check that routes are read back after a restart"""
+    journal.set_route(1, True)
+    journal.set_route(2, False)
+    journal.set_route(1, False)
+
+    journal = reopen(journal, path)
+
+    assert(journal.get_routes() == {1: False, 2: False})
+    journal.close()
+
+def test_route_forgotten(journal, path):
+    """Check that a forgotten route stays unknown after a restart"""
+    journal.set_route(1, True)
+    journal.compact()
+    journal.set_route(1, None)
+
+    lose_snapshot_write(journal, 1, TurnoutStateJournal.DIVERGING)
+
+    journal = reopen(journal, path)
+
+    assert(journal.get_route(1) is None)
+    journal.close()
+
+def test_lost_snapshot_writes(journal, path):
+    """Check that the journal restores changes the snapshot never got"""
+    journal.set_route(1, True)
+    journal.compact()
+    journal.set_route(1, False)
+    journal.set_route(2, True)
+
+    # Power lost before the snapshot pages were written back
+    lose_snapshot_write(journal, 1, TurnoutStateJournal.DIVERGING)
+    lose_snapshot_write(journal, 2, TurnoutStateJournal.UNKNOWN)
+
+    journal = reopen(journal, path)
+
+    assert(journal.get_routes() == {1: False, 2: True})
+    journal.close()
+
+def test_torn_record(journal, path):
+    """Check that a record torn by a power loss is dropped"""
+    journal.set_route(1, True)
+    journal.set_route(2, True)
+
+    with open(path + '.journal', 'r+b') as journal_file:
+        journal_file.truncate(2 * RECORD_SIZE - 3)
+
+    lose_snapshot_write(journal, 2, TurnoutStateJournal.UNKNOWN)
+
+    journal = reopen(journal, path)
+
+    assert(journal.get_routes() == {1: True})
+    assert(journal_size(path) == RECORD_SIZE)
+
+    journal.set_route(3, False)
+    journal = reopen(journal, path)
+
+    assert(journal.get_routes() == {1: True, 3: False})
+    journal.close()
+
+def test_corrupt_record(journal, path):
+    """Check that replay stops at a record that fails its checksum"""
+    for turnout_id in range(3):
+        journal.set_route(turnout_id, True)
+
+    with open(path + '.journal', 'r+b') as journal_file:
+        journal_file.seek(RECORD_SIZE + 4)
+        journal_file.write(b'\x09')
+
+    for turnout_id in range(3):
+        lose_snapshot_write(journal, turnout_id, TurnoutStateJournal.UNKNOWN)
+
+    journal = reopen(journal, path)
+
+    assert(journal.get_routes() == {0: True})
+    journal.close()
+
+#-------------------------------------------------------------------------------
+# Compaction tests
+#-------------------------------------------------------------------------------
+def test_compaction(path):
+    """Check that the journal is emptied once it holds enough records"""
+    journal = TurnoutStateJournal(path, compact_records=4)
+
+    for turnout_id in range(5):
+        journal.set_route(turnout_id, True)
+
+    assert(journal_size(path) == RECORD_SIZE)
+
+    journal = reopen(journal, path)
+
+    assert(len(journal.get_routes()) == 5)
+    journal.close()
+
+def test_old_journal_after_compaction(journal, path):
+    """Check that a journal left behind by a power loss during compaction
+    does not undo later changes
+    """
+    journal.set_route(1, True)
+
+    with open(path + '.journal', 'rb') as journal_file:
+        stale = journal_file.read()
+
+    journal.compact()
+    journal.set_route(1, False)
+    journal.compact()
+
+    with open(path + '.journal', 'wb') as journal_file:
+        journal_file.write(stale)
+
+    journal = reopen(journal, path)
+
+    assert(journal.get_route(1) is False)
+    journal.close()
+
+def test_clean_close(journal, path):
+    """Check that a clean close leaves an empty journal"""
+    journal.set_route(1, True)
+
+    journal = reopen(journal, path, compact=True)
+
+    assert(journal_size(path) == 0)
+    assert(journal.get_route(1) is True)
+    journal.close()
+
+#-------------------------------------------------------------------------------
+# Turnout tests
+#-------------------------------------------------------------------------------
+def test_boot_without_driving(journal, path):
+    """Check that turnouts recorded before a restart are not driven at boot"""
+    clock = ClockVirtual()
+
+    turnouts = [
+        TurnoutEFrogServo(
+            Servo(FakePWMProvider(), clock=clock), FakeGPOProvider(), 45, 135,
+            state_store=journal, turnout_id=turnout_id)
+        for turnout_id in range(4)]
+
+    turnouts[2].set_route(True)
+
+    journal = reopen(journal, path)
+
+    turnouts = [
+        TurnoutEFrogServo(
+            Servo(FakePWMProvider(), clock=clock), FakeGPOProvider(), 45, 135,
+            home=False, state_store=journal, turnout_id=turnout_id)
+        for turnout_id in range(5)]
+
+    assert(TurnoutBank(clock=clock).home(turnouts, journal) == 1)
+    assert(turnouts[2].get_route() is True)
+
+    journal.close()
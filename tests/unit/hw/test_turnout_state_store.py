@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+# test_turnout_state_store.py
+#
+# G. Thomas
+# 2018
+#-------------------------------------------------------------------------------
+
+import logging
+import pytest
+
+from src.hw.turnout_state_store import TurnoutStateStore
+
+#-------------------------------------------------------------------------------
+# Test fixtures
+#-------------------------------------------------------------------------------
+@pytest.fixture
+def path(tmp_path):
+    """Path of the state file"""
+    return str(tmp_path / 'turnouts.json')
+
+@pytest.fixture
+def store(path):
+    """Create an empty state store"""
+    return TurnoutStateStore(path)
+
+#-------------------------------------------------------------------------------
+# State tests
+#-------------------------------------------------------------------------------
+def test_unknown_route(store):
+    """Check that a turnout that was never recorded is unknown"""
+    assert(store.get_route(1) is None)
+    assert(store.get_routes() == {})
+
+def test_route_persisted(store, path):
+    """Check that recorded routes are loaded by a new store"""
+    store.set_route(1, True)
+    store.set_route(2, False)
+
+    assert(TurnoutStateStore(path).get_routes() == {1: True, 2: False})
+
+def test_route_updated(store, path):
+    """Check that the latest route of a turnout is kept"""
+    store.set_route(1, True)
+    store.set_route(1, False)
+
+    assert(TurnoutStateStore(path).get_route(1) is False)
+
+def test_route_forgotten(store, path):
+    """Check that a forgotten route is no longer known"""
+    store.set_route(1, True)
+    store.set_route(1, None)
+    store.set_route(2, None)
+
+    assert(TurnoutStateStore(path).get_routes() == {})
+
+def test_corrupt_file(path):
+    """Check that an unreadable file is treated as no state"""
+    with open(path, 'w') as state_file:
+        state_file.write('{"1": tr')
+
+    assert(TurnoutStateStore(path).get_routes() == {})